@@ -11,6 +11,7 @@ from typing import List, Optional, AsyncIterator
 import logging
 import os
 import json
+import time
 
 from analysis_service.parsers.tempest_xml import TempestXMLParser
 from analysis_service.parsers.rhcert_xml import RHCertXMLParser
@@ -69,6 +70,12 @@ class ChatRequest(BaseModel):
 # Global storage for parsed test results (in production, use database)
 test_results_cache = {}
 
+# Jobs cancelled in the main app (job_id -> time cancelled) - streaming responses
+# for these stop early. Entries are dropped after CANCELLED_JOB_TTL seconds, long
+# after any open stream has seen them, so the map does not grow with every cancel.
+cancelled_jobs = {}
+CANCELLED_JOB_TTL = 3600
+
 
 @app.on_event("startup")
 async def startup_event():
@@ -430,6 +437,27 @@ async def list_ai_backends():
     }
 
 
+@app.post("/api/analysis/cancel/{job_id}")
+async def cancel_job_analysis(job_id: str):
+    """
+    Stop analysis and chat streams for a cancelled job
+
+    Args:
+        job_id: UUID of the job cancelled in the main app
+    """
+    now = time.monotonic()
+    for expired in [key for key, cancelled_at in cancelled_jobs.items() if now - cancelled_at > CANCELLED_JOB_TTL]:
+        del cancelled_jobs[expired]
+    cancelled_jobs[job_id] = now
+
+    # Drop cached parse results for the job
+    for cache_key in [key for key in test_results_cache if key.startswith(f"{job_id}:")]:
+        del test_results_cache[cache_key]
+
+    logger.info(f"Cancelled analysis for job {job_id}")
+    return {'success': True, 'job_id': job_id}
+
+
 @app.post("/api/analysis/analyze")
 async def analyze_failures(request: AnalyzeRequest):
     """
@@ -491,6 +519,9 @@ async def analyze_failures(request: AnalyzeRequest):
                     # Get the async generator from the plugin (no await - it's already a generator)
                     generator = plugin.analyze_failures(context, stream=True)
                     async for chunk in generator:
+                        if request.job_id in cancelled_jobs:
+                            yield f"data: {json.dumps({'error': 'Job cancelled'})}\n\n"
+                            break
                         # Format as Server-Sent Event
                         yield f"data: {json.dumps({'text': chunk})}\n\n"
                 except Exception as e:
@@ -586,6 +617,9 @@ async def chat_about_failures(request: ChatRequest):
                         stream=True
                     )
                     async for chunk in generator:
+                        if request.job_id in cancelled_jobs:
+                            yield f"data: {json.dumps({'error': 'Job cancelled'})}\n\n"
+                            break
                         yield f"data: {json.dumps({'text': chunk})}\n\n"
                 except Exception as e:
                     logger.error(f"Chat streaming error: {e}")
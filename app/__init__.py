@@ -3,7 +3,7 @@ Flask Application Factory
 Creates and configures the Flask application
 """
 
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
 from flask_cors import CORS
 
 from config import settings, logging as log_config
@@ -53,24 +53,60 @@ def create_app(config=None):
     # Register error handlers
     register_error_handlers(app)
 
+    # Register CLI commands
+    from app.cli import register_commands
+    register_commands(app)
+
     # Register teardown
+    from app.services.index_store import index_store
     app.teardown_appcontext(shutdown_session)
+    app.teardown_appcontext(index_store.remove_sessions)
+
+    # Record job accesses (retention evicts least recently used jobs) and start sweeping
+    from app.services.retention import retention_service
+    app.before_request(record_job_access)
+    retention_service.start()
+
+    # Pack idle jobs into the cold tier
+    from app.services.cold_storage import cold_storage_service
+    cold_storage_service.start()
+
+    # Index changes made to extracted trees outside an index pass (if enabled)
+    from app.services.tree_watcher import tree_watcher_service
+    tree_watcher_service.start()
+
+    # Finish post-index stages (content index) interrupted by a restart
+    from app.services.post_index import post_index_pipeline
+    post_index_pipeline.resume()
 
     app.logger.info("File Extractor application initialized")
 
     return app
 
 
+def record_job_access():
+    """Mark the job a request is about as accessed"""
+    from app.services.retention import retention_service
+
+    job_id = (request.view_args or {}).get('job_id')
+    if job_id:
+        retention_service.touch(job_id)
+
+
 def register_blueprints(app):
     """Register all blueprints"""
     from app.blueprints.upload import upload_bp
     from app.blueprints.browse import browse_bp
     from app.blueprints.viewer import viewer_bp
+    from app.blueprints.jobs import jobs_bp
+    from app.blueprints.diff import diff_bp
 
     # Register with /api prefix
     app.register_blueprint(upload_bp, url_prefix='/api')
     app.register_blueprint(browse_bp, url_prefix='/api')
     app.register_blueprint(viewer_bp, url_prefix='/api')
+    app.register_blueprint(jobs_bp, url_prefix='/api')
+    app.register_blueprint(diff_bp, url_prefix='/api')
 
     # Main route for serving frontend
     @app.route('/')
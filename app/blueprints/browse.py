@@ -3,11 +3,20 @@ Browse Blueprint
 Handles file browsing, search, pagination, and tree view
 """
 
-from flask import Blueprint, request, jsonify
+import json
+from datetime import datetime, timedelta
+
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 
 from app.database import db_session
 from app.models import Job
+from app.services.file_classifier import type_criteria
+from app.services.global_index import global_index_service
+from app.services.grep import grep_service, GrepError
 from app.services.indexing import indexing_service
+from app.services.manifest import manifest_service
+from app.services.path_index import path_index_service, PathSearchError
+from app.services.post_index import post_index_pipeline
 from app.services.tree_builder import tree_builder_service
 from app.utils.pagination import paginate, get_pagination_params, sort_items
 from config import settings
@@ -39,17 +48,24 @@ def browse_files(job_id, dir_path=''):
     # Get pagination parameters
     page, per_page, sort_by, sort_order = get_pagination_params(request)
 
-    # Get directory contents
-    contents = tree_builder_service.get_directory_contents(job_id, dir_path)
+    manifest = manifest_service.get(job_id)
+    if manifest:
+        # Sort and paginate entry indexes of the mapped manifest; only the page's items are built
+        entries, listed_path = manifest.listing(dir_path, sort_by, sort_order)
+        result = paginate(entries, page, per_page)
+        result['items'] = [manifest.item(entry, listed_path) for entry in result['items']]
+    else:
+        # Get directory contents
+        contents = tree_builder_service.get_directory_contents(job_id, dir_path)
 
-    # Combine files and directories
-    all_items = contents['directories'] + contents['files']
+        # Combine files and directories
+        all_items = contents['directories'] + contents['files']
 
-    # Sort items
-    sorted_items = sort_items(all_items, sort_by, sort_order)
+        # Sort items
+        sorted_items = sort_items(all_items, sort_by, sort_order)
 
-    # Paginate
-    result = paginate(sorted_items, page, per_page)
+        # Paginate
+        result = paginate(sorted_items, page, per_page)
 
     # Add job and path info
     result['job_id'] = job_id
@@ -58,6 +74,61 @@ def browse_files(job_id, dir_path=''):
     return jsonify(result)
 
 
+@browse_bp.route('/search', methods=['GET'])
+def search_all_jobs():
+    """
+    Search file names and paths (optionally contents) across all jobs
+
+    Query params:
+        q: Search query (words, "quoted phrases", prefix*)
+        content: '1' to also search file contents
+        path: Only files whose path contains this (e.g. q=libvirt&content=1&path=nova-compute.log)
+        since: Only jobs uploaded on or after this date (YYYY-MM-DD or ISO datetime, UTC)
+        until: Only jobs uploaded up to this date (a date includes the whole day)
+        filename: Only jobs whose uploaded filename contains this
+        limit: Maximum hits over all jobs (up to GLOBAL_SEARCH_LIMIT)
+        per_job: Maximum hits listed per job (up to GLOBAL_SEARCH_PER_JOB)
+
+    Returns jobs best match first, each with its ranked hits.
+    """
+    query = request.args.get('q', '')
+    if not query:
+        return jsonify({'error': 'Search query required'}), 400
+
+    try:
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+        until = None
+        if request.args.get('until'):
+            until = datetime.fromisoformat(request.args['until'])
+            if 'T' not in request.args['until'] and ' ' not in request.args['until']:
+                until += timedelta(days=1)
+        limit = min(max(int(request.args.get('limit', settings.GLOBAL_SEARCH_LIMIT)), 1), settings.GLOBAL_SEARCH_LIMIT)
+        per_job = min(max(int(request.args.get('per_job', settings.GLOBAL_SEARCH_PER_JOB)), 1),
+                      settings.GLOBAL_SEARCH_PER_JOB)
+    except ValueError as e:
+        return jsonify({'error': 'Invalid parameter', 'message': str(e)}), 400
+
+    jobs = global_index_service.search(
+        query,
+        content=request.args.get('content', '').lower() in ('1', 'true'),
+        path=request.args.get('path'),
+        since=since,
+        until=until,
+        filename=request.args.get('filename'),
+        limit=limit,
+        per_job=per_job
+    )
+
+    return jsonify({
+        'jobs': jobs,
+        'total_jobs': len(jobs),
+        'total_hits': sum(job['total_hits'] for job in jobs),
+        'query': query,
+        # Completed jobs whose files are still being added to the global index
+        'pending_jobs': global_index_service.pending_jobs(),
+    })
+
+
 @browse_bp.route('/search/<job_id>', methods=['GET'])
 def search_files(job_id):
     """
@@ -69,8 +140,16 @@ def search_files(job_id):
     Query params:
         q: Search query
         type: Filter by 'file' or 'directory' (optional)
+        binary: '1' for binary files only, '0' for text files only (optional)
+        mime: Only files whose MIME type starts with this, e.g. 'text/' or 'image' (optional)
+        encoding: Only text files of this encoding, e.g. 'utf-8' (optional)
+        compression: Only files compressed with this, e.g. 'gzip' (optional)
         page: Page number (default 1)
         per_page: Items per page (default 50)
+        sort: Sort field (default 'rank': path matches, then content matches by relevance)
+
+    The binary, mime, encoding and compression filters use the file types
+    stored at index time; files not classified yet do not match them.
     """
     # Validate job exists
     job = db_session.query(Job).filter_by(id=job_id).first()
@@ -80,15 +159,24 @@ def search_files(job_id):
     # Get search parameters
     query = request.args.get('q', '')
     file_type = request.args.get('type', None)
+    binary = request.args.get('binary')
+    type_filter = type_criteria(
+        binary=None if binary is None else binary.lower() in ('1', 'true'),
+        mime=request.args.get('mime'),
+        encoding=request.args.get('encoding'),
+        compression=request.args.get('compression'),
+    )
 
     if not query:
         return jsonify({'error': 'Search query required'}), 400
 
     # Get pagination parameters
     page, per_page, sort_by, sort_order = get_pagination_params(request)
+    if 'sort' not in request.args:
+        sort_by = 'rank'
 
     # Perform search
-    results = indexing_service.search_files(job_id, query, file_type)
+    results = indexing_service.search_files(job_id, query, file_type, type_filter)
 
     # Sort results
     sorted_results = sort_items(results, sort_by, sort_order)
@@ -99,10 +187,130 @@ def search_files(job_id):
     # Add search info
     paginated_result['query'] = query
     paginated_result['job_id'] = job_id
+    # 'pending' while the job's contents are still being indexed in the background
+    paginated_result['content_index'] = post_index_pipeline.status(job_id, 'content_index')
 
     return jsonify(paginated_result)
 
 
+@browse_bp.route('/search/<job_id>/paths', methods=['GET'])
+def search_paths(job_id):
+    """
+    Search file and directory paths by substring or regular expression, a page at a time
+
+    Args:
+        job_id: UUID of the job
+
+    Query params:
+        q: Substring, or regular expression with regex=1
+        regex: '1' to treat q as a regular expression (searched anywhere in the path)
+        case_sensitive: '1' for case-sensitive matching
+        type: Filter by 'file' or 'directory' (optional)
+        limit: Matches per page (default DEFAULT_PAGE_SIZE)
+        cursor: next_cursor of the previous page
+
+    A page can hold fewer than limit matches (PATH_SEARCH_SCAN_LIMIT
+    candidates are checked per request); continue while next_cursor is set.
+    """
+    job = db_session.query(Job).filter_by(id=job_id).first()
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    query = request.args.get('q', '')
+    if not query:
+        return jsonify({'error': 'Search query required'}), 400
+
+    cursor = request.args.get('cursor') or None
+    try:
+        limit = min(max(int(request.args.get('limit', settings.DEFAULT_PAGE_SIZE)), 1), settings.MAX_PAGE_SIZE)
+        if cursor is not None:
+            int(cursor)
+    except ValueError:
+        return jsonify({'error': 'limit and cursor must be integers'}), 400
+
+    regex = request.args.get('regex', '').lower() in ('1', 'true')
+    try:
+        matches, next_cursor = path_index_service.search(
+            job_id, query,
+            regex=regex,
+            ignore_case=request.args.get('case_sensitive', '').lower() not in ('1', 'true'),
+            file_type=request.args.get('type'),
+            cursor=cursor,
+            limit=limit,
+            scan_limit=settings.PATH_SEARCH_SCAN_LIMIT
+        )
+    except PathSearchError as e:
+        return jsonify({'error': 'Invalid pattern', 'message': str(e)}), 400
+
+    return jsonify({
+        'items': path_index_service.items(job_id, matches),
+        'next_cursor': next_cursor,
+        'query': query,
+        'regex': regex,
+        'job_id': job_id,
+        # 'pending' while the path index is built: the same results, found by a full scan
+        'path_index': post_index_pipeline.status(job_id, path_index_service.name),
+    })
+
+
+@browse_bp.route('/grep/<job_id>', methods=['GET'])
+def grep_job(job_id):
+    """
+    Search the lines of a job's text files with a regular expression (Server-Sent Events)
+
+    Args:
+        job_id: UUID of the job
+
+    Query params:
+        q: Regular expression (^ and $ match at line boundaries)
+        case_sensitive: '1' for case-sensitive matching
+        context: Lines of context before and after each hit (up to GREP_MAX_CONTEXT)
+        max_hits: Maximum hits (up to GREP_MAX_HITS)
+        path: Only search below this directory
+
+    Streams one event per hit ({path, line, text, before, after}) in path
+    order, then a summary event ({done: true, hits, files_searched, ...}).
+    """
+    job = db_session.query(Job).filter_by(id=job_id).first()
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    query = request.args.get('q', '')
+    if not query:
+        return jsonify({'error': 'Search query required'}), 400
+
+    try:
+        context = min(max(int(request.args.get('context', 0)), 0), settings.GREP_MAX_CONTEXT)
+        max_hits = min(max(int(request.args.get('max_hits', settings.GREP_MAX_HITS)), 1), settings.GREP_MAX_HITS)
+    except ValueError:
+        return jsonify({'error': 'context and max_hits must be integers'}), 400
+
+    try:
+        run = grep_service.search(
+            job_id, query,
+            ignore_case=request.args.get('case_sensitive', '').lower() not in ('1', 'true'),
+            path_prefix=request.args.get('path', ''),
+            context=context,
+            max_hits=max_hits
+        )
+    except GrepError as e:
+        return jsonify({'error': 'Invalid pattern', 'message': str(e)}), 400
+
+    def event_stream():
+        for hit in run:
+            yield f"data: {json.dumps(hit)}\n\n"
+        yield f"data: {json.dumps(run.summary())}\n\n"
+
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
 @browse_bp.route('/tree/<job_id>', methods=['GET'])
 @browse_bp.route('/tree/<job_id>/<path:start_path>', methods=['GET'])
 def get_tree(job_id, start_path=''):
@@ -144,20 +352,73 @@ def get_all_files(job_id):
         return jsonify({'error': 'Job not found'}), 404
 
     from app.models import FileMetadata
+    from app.services.directories import directory_service
+    from app.services.index_store import index_store
     from app.utils.security import get_file_size_human
 
-    # Get all files and directories
-    all_items = db_session.query(FileMetadata).filter_by(job_id=job_id).all()
-
     items = []
-    for item in all_items:
+
+    manifest = manifest_service.get(job_id)
+    if manifest:
+        for d in range(1, manifest.n_dirs):
+            relative_path = manifest.dir_path(d)
+            items.append({
+                'name': relative_path.rsplit('/', 1)[-1],
+                'relative_path': relative_path,
+                'type': 'directory',
+                'size': None,
+                'size_human': 'Directory',
+                'extension': None
+            })
+        for d in range(manifest.n_dirs):
+            parent_path = manifest.dir_path(d)
+            for f in manifest.files(d):
+                name = manifest.file_name(f)
+                size = manifest.file_size(f)
+                items.append({
+                    'name': name,
+                    'relative_path': f'{parent_path}/{name}' if parent_path else name,
+                    'type': 'file',
+                    'size': size,
+                    'size_human': get_file_size_human(size) if size else 'Unknown',
+                    'extension': manifest.file_extension(f)
+                })
+        return jsonify({
+            'job_id': job_id,
+            'items': items,
+            'total': len(items)
+        })
+
+    # Directory paths come from the cached map; files are (parent_id, name) rows
+    dir_map = directory_service.path_map(job_id)
+
+    for relative_path in dir_map.ids:
+        if not relative_path:
+            continue
         items.append({
-            'name': item.name,
-            'relative_path': item.relative_path,
-            'type': 'directory' if item.is_directory else 'file',
-            'size': item.size,
-            'size_human': get_file_size_human(item.size) if item.size and not item.is_directory else 'Directory' if item.is_directory else 'Unknown',
-            'extension': item.extension if not item.is_directory else None
+            'name': relative_path.rsplit('/', 1)[-1],
+            'relative_path': relative_path,
+            'type': 'directory',
+            'size': None,
+            'size_human': 'Directory',
+            'extension': None
+        })
+
+    files = index_store.session(job_id).query(
+        FileMetadata.parent_id,
+        FileMetadata.name,
+        FileMetadata.size,
+        FileMetadata.extension
+    ).filter(FileMetadata.job_id == job_id).all()
+
+    for parent_id, name, size, extension in files:
+        items.append({
+            'name': name,
+            'relative_path': dir_map.file_path(parent_id, name),
+            'type': 'file',
+            'size': size,
+            'size_human': get_file_size_human(size) if size else 'Unknown',
+            'extension': extension
         })
 
     return jsonify({
@@ -180,56 +441,41 @@ def get_summary(job_id):
     if not job:
         return jsonify({'error': 'Job not found'}), 404
 
-    # Get file type breakdown
-    from app.models import FileMetadata
-    from collections import Counter
-
-    all_files = db_session.query(FileMetadata).filter_by(
-        job_id=job_id,
-        is_directory=False
-    ).all()
-
-    # Count by extension
-    extensions = Counter(f.extension or 'no extension' for f in all_files)
-
-    # Get largest files
-    largest_files = sorted(all_files, key=lambda f: f.size or 0, reverse=True)[:10]
-
-    # Get rhoso folders
-    rhoso_folders = db_session.query(FileMetadata).filter(
-        FileMetadata.job_id == job_id,
-        FileMetadata.is_directory == True,
-        FileMetadata.name.like('rhoso%')
-    ).all()
-
-    # Get rhcert files
-    rhcert_files = db_session.query(FileMetadata).filter(
-        FileMetadata.job_id == job_id,
-        FileMetadata.is_directory == False,
-        FileMetadata.name.like('%rhcert%'),
-        FileMetadata.extension == '.xml'
-    ).all()
-
+    # Everything below was collected at index time - one primary-key lookup
+    from app.services.job_stats import job_stats_service
     from app.utils.security import get_file_size_human
 
+    stats = job_stats_service.get(job_id)
+    if stats is None:
+        return jsonify({
+            'error': 'Summary not available',
+            'message': 'The job is still being indexed'
+        }), 409
+    stats = stats.to_dict()
+
+    # Top extensions by file count
+    file_types = sorted(stats['extensions'].items(), key=lambda item: item[1]['count'], reverse=True)[:10]
+
     return jsonify({
         'job_id': job_id,
         'filename': job.filename,
-        'total_files': job.total_files,
-        'total_directories': job.total_directories,
-        'total_size': job.total_size,
-        'total_size_human': get_file_size_human(job.total_size) if job.total_size else '0 B',
-        'file_types': dict(extensions.most_common(10)),
+        'total_files': stats['total_files'],
+        'total_directories': stats['total_directories'],
+        'total_size': stats['total_size'],
+        'total_size_human': get_file_size_human(stats['total_size']) if stats['total_size'] else '0 B',
+        'file_types': {extension: totals['count'] for extension, totals in file_types},
+        'file_type_bytes': {extension: totals['bytes'] for extension, totals in file_types},
+        'size_distribution': stats['size_histogram'],
         'largest_files': [
             {
-                'name': f.name,
-                'path': f.relative_path,
-                'size': f.size,
-                'size_human': get_file_size_human(f.size) if f.size else 'Unknown'
+                'name': f['path'].rsplit('/', 1)[-1],
+                'path': f['path'],
+                'size': f['size'],
+                'size_human': get_file_size_human(f['size']) if f['size'] else 'Unknown'
             }
-            for f in largest_files
+            for f in stats['largest_files'][:10]
         ],
         'has_rhoso_tests': job.has_rhoso_tests,
-        'rhoso_folders': [f.relative_path for f in rhoso_folders],
-        'rhcert_files': [f.relative_path for f in rhcert_files]
+        'rhoso_folders': stats['rhoso_folders'],
+        'rhcert_files': stats['rhcert_files']
     })
@@ -0,0 +1,132 @@
+"""
+Diff Blueprint
+Handles comparing the file trees of two jobs and line diffs of file pairs
+"""
+
+import logging
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+
+from app.database import db_session
+from app.models import Job
+from app.services.file_classifier import SNIFF_SIZE, file_classifier_service, text_codec, text_encoding
+from app.services.job_diff import job_diff_service, DiffError, STATUSES
+from app.services.post_index import post_index_pipeline
+from app.utils.security import size_limit_error
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+diff_bp = Blueprint('diff', __name__)
+
+
+def _missing_jobs(*job_ids):
+    """404 response if a job does not exist, else None"""
+    found = {job_id for (job_id,) in db_session.query(Job.id).filter(Job.id.in_(job_ids))}
+    missing = [job_id for job_id in job_ids if job_id not in found]
+    if missing:
+        return jsonify({'error': 'Job not found', 'message': f'No job {missing[0]}'}), 404
+    return None
+
+
+@diff_bp.route('/diff/<job_a>/<job_b>', methods=['GET'])
+def diff_jobs(job_a, job_b):
+    """
+    Files added, removed and changed from one job to another
+
+    Args:
+        job_a: UUID of the base job
+        job_b: UUID of the job compared with it
+
+    Query params:
+        status: List only 'added', 'removed', 'changed', 'unverified' or 'unchanged' files
+        path: Only files under this directory
+        limit: Files listed (default and maximum DIFF_MAX_ENTRIES)
+        offset: Files to skip
+
+    Files of equal size are compared by content hash; they are 'unverified'
+    until both jobs' hashes are computed (content_hash: 'pending').
+    """
+    error_response = _missing_jobs(job_a, job_b)
+    if error_response:
+        return error_response
+
+    status = request.args.get('status') or None
+    if status is not None and status not in STATUSES:
+        return jsonify({'error': 'Invalid status', 'message': f'status must be one of {", ".join(STATUSES)}'}), 400
+
+    try:
+        limit = min(max(int(request.args.get('limit', settings.DIFF_MAX_ENTRIES)), 1), settings.DIFF_MAX_ENTRIES)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+
+    try:
+        result = job_diff_service.compare(job_a, job_b, status=status, path_prefix=request.args.get('path', ''),
+                                          limit=limit, offset=offset)
+    except DiffError as e:
+        return jsonify({'error': 'Cannot compare jobs', 'message': str(e)}), 400
+
+    result.update({
+        'job_a': job_a,
+        'job_b': job_b,
+        'content_hash': {
+            job_a: post_index_pipeline.status(job_a, 'content_hash'),
+            job_b: post_index_pipeline.status(job_b, 'content_hash'),
+        },
+    })
+    return jsonify(result)
+
+
+@diff_bp.route('/diff/<job_a>/<job_b>/file', methods=['GET'])
+def diff_file(job_a, job_b):
+    """
+    Stream a unified diff of a file in two jobs (text/plain)
+
+    Args:
+        job_a: UUID of the base job
+        job_b: UUID of the job compared with it
+
+    Query params:
+        path: Relative path of the file in job_a
+        path_b: Relative path in job_b (default: path)
+        context: Unchanged lines around each change (default 3)
+    """
+    error_response = _missing_jobs(job_a, job_b)
+    if error_response:
+        return error_response
+
+    path_a = request.args.get('path', '')
+    path_b = request.args.get('path_b') or path_a
+    if not path_a:
+        return jsonify({'error': 'File path required'}), 400
+    try:
+        context = min(max(int(request.args.get('context', 3)), 0), 100)
+    except ValueError:
+        return jsonify({'error': 'context must be an integer'}), 400
+
+    contents = []
+    for job_id, file_path in ((job_a, path_a), (job_b, path_b)):
+        try:
+            size, open_file = job_diff_service.locate(job_id, file_path)
+        except FileNotFoundError:
+            return jsonify({'error': 'File not found', 'message': f'{file_path} is not a file of job {job_id}'}), 404
+
+        size_error = size_limit_error(size, settings.DIFF_MAX_FILE_SIZE)
+        if size_error:
+            return jsonify({'error': 'File too large to diff', 'message': size_error}), 413
+
+        with open_file() as f:
+            data = f.read()
+        # Classified at index time, else detected the same way
+        file_type = file_classifier_service.lookup(job_id, file_path)
+        encoding = file_type['encoding'] if file_type else text_encoding(data[:SNIFF_SIZE])
+        if encoding is None:
+            return jsonify({'error': 'Binary file', 'message': f'{file_path} appears to be binary'}), 415
+        contents.append(data.decode(text_codec(encoding), errors='replace'))
+
+    lines = job_diff_service.unified_diff(contents[0], contents[1], path_a, path_b, context)
+    return Response(
+        stream_with_context(lines),
+        mimetype='text/plain',
+        headers={'X-Accel-Buffering': 'no'}
+    )
@@ -0,0 +1,146 @@
+"""
+Jobs Blueprint
+Handles job cancellation, deletion, cold tier rehydration and pipeline stage timings
+"""
+
+import logging
+from flask import Blueprint, request, jsonify
+
+from app.database import db_session
+from app.models import Job
+from app.services.cold_storage import cold_storage_service
+from app.services.job_control import job_control_service
+from app.services.stage_timing import stage_timing_service
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+jobs_bp = Blueprint('jobs', __name__)
+
+
+@jobs_bp.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_or_delete_job(job_id):
+    """
+    Cancel a running job, or delete a finished one
+
+    Running jobs are signalled through their cancellation token; the worker
+    stops at its next checkpoint and removes partial output itself. Finished
+    jobs have their extracted files, upload and index rows removed immediately.
+
+    Args:
+        job_id: UUID of the job
+    """
+    job = db_session.query(Job).filter_by(id=job_id).first()
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    _notify_analysis_service(job_id)
+
+    if job_control_service.cancel(job_id):
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'cancelling'
+        }), 202
+
+    try:
+        deleted = job_control_service.cleanup_job_data(job_id, delete_job=True)
+    except Exception as e:
+        return jsonify({
+            'error': 'Delete failed',
+            'message': str(e)
+        }), 500
+
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'deleted',
+        'deleted_entries': deleted
+    })
+
+
+@jobs_bp.route('/jobs/<job_id>/rehydrate', methods=['POST'])
+def rehydrate_job(job_id):
+    """
+    Bring a job's files back from the cold tier onto disk
+
+    Browsing and viewing read packed jobs directly; callers that need the
+    loose tree (analysis, nested extraction) rehydrate first.
+
+    Args:
+        job_id: UUID of the job
+    """
+    job = db_session.query(Job).filter_by(id=job_id).first()
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    try:
+        rehydrated = cold_storage_service.ensure_hot(job_id)
+    except Exception as e:
+        logger.error(f"Rehydrating job {job_id} failed: {e}", exc_info=True)
+        return jsonify({
+            'error': 'Rehydration failed',
+            'message': str(e)
+        }), 500
+
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'rehydrated': rehydrated
+    })
+
+
+@jobs_bp.route('/jobs/<job_id>/timings', methods=['GET'])
+def get_job_timings(job_id):
+    """
+    Get the pipeline stage timing breakdown of a job
+
+    Args:
+        job_id: UUID of the job
+    """
+    job = db_session.query(Job).filter_by(id=job_id).first()
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    timings = stage_timing_service.get_job_timings(job_id)
+
+    return jsonify({
+        'job_id': job_id,
+        'stages': timings,
+        'total_wall_seconds': round(sum(t['wall_seconds'] for t in timings), 3),
+        'total_cpu_seconds': round(sum(t['cpu_seconds'] for t in timings), 3),
+    })
+
+
+@jobs_bp.route('/timings/summary', methods=['GET'])
+def get_timings_summary():
+    """
+    Aggregate stage timings across jobs
+
+    Query params:
+        stage: Only this stage (optional)
+        days: Only samples from the last N days (optional)
+    """
+    stage = request.args.get('stage')
+
+    try:
+        days = int(request.args['days']) if request.args.get('days') else None
+    except ValueError:
+        return jsonify({'error': 'days must be an integer'}), 400
+
+    return jsonify({
+        'stages': stage_timing_service.summarize(stage=stage, days=days),
+        'days': days,
+    })
+
+
+def _notify_analysis_service(job_id):
+    """Best-effort request for the analysis service to stop streaming for a job"""
+    if not settings.ENABLE_AI_ANALYSIS:
+        return
+
+    try:
+        import requests
+        requests.post(f'{settings.ANALYSIS_SERVICE_URL}/api/analysis/cancel/{job_id}', timeout=2)
+    except Exception as e:
+        logger.debug(f"Analysis service not notified of cancellation for {job_id}: {e}")
@@ -4,18 +4,24 @@ Handles file upload and extraction progress tracking
 """
 
 import os
+import json
 import uuid
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from werkzeug.utils import secure_filename
 
 from app.database import db_session
 from app.models import Job
 from app.services.extraction import extraction_service
+from app.services.progress_bus import progress_bus, TERMINAL_STATUSES
+from app.services.stage_timing import stage_timing_service, StageSample
 from app.utils.security import allowed_file
 from config import settings
 
 upload_bp = Blueprint('upload', __name__)
 
+# Seconds between keepalives / database fallback checks on a progress stream
+PROGRESS_STREAM_INTERVAL = 2.0
+
 
 @upload_bp.route('/upload', methods=['POST'])
 def upload_file():
@@ -41,7 +47,11 @@ def upload_file():
 
     # Save uploaded file
     upload_path = os.path.join(settings.UPLOAD_FOLDER, f"{job_id}_{filename}")
-    file.save(upload_path)
+    upload_sample = StageSample(job_id, 'upload_save')
+    with upload_sample.measure():
+        file.save(upload_path)
+    upload_sample.bytes_processed = os.path.getsize(upload_path)
+    upload_sample.items = 1
 
     # Create extraction directory
     extract_path = os.path.join(settings.EXTRACT_FOLDER, job_id)
@@ -58,6 +68,9 @@ def upload_file():
     db_session.add(job)
     db_session.commit()
 
+    # Recorded once the Job row exists
+    stage_timing_service.record(upload_sample)
+
     # Start extraction in background
     extraction_service.extract_archive_async(job_id, upload_path, extract_path)
 
@@ -72,14 +85,58 @@ def upload_file():
 def get_progress(job_id):
     """Get extraction progress for a job"""
 
-    job = db_session.query(Job).filter_by(id=job_id).first()
+    progress = extraction_service.get_progress(job_id)
 
-    if not job:
+    if progress is None:
         return jsonify({'error': 'Job not found'}), 404
 
-    return jsonify({
-        'status': job.status,
-        'progress': job.progress,
-        'message': job.message,
-        'has_rhoso_tests': job.has_rhoso_tests
-    })
+    return jsonify(progress)
+
+
+@upload_bp.route('/progress/<job_id>/stream', methods=['GET'])
+def stream_progress(job_id):
+    """
+    Stream extraction progress as Server-Sent Events
+
+    Events are pushed from the in-process progress bus. Jobs that are not
+    running in this process are served from the Job row instead; the stream
+    closes after a terminal status.
+    """
+    initial = extraction_service.get_progress(job_id)
+    if initial is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def event_stream():
+        subscription = progress_bus.subscribe(job_id)
+        last_sent = None
+        snapshot = initial
+
+        try:
+            while True:
+                if snapshot is not None and snapshot != last_sent:
+                    yield f"data: {json.dumps(snapshot)}\n\n"
+                    last_sent = snapshot
+                if snapshot is not None and snapshot.get('status') in TERMINAL_STATUSES:
+                    return
+
+                snapshot = subscription.wait(timeout=PROGRESS_STREAM_INTERVAL)
+                if snapshot is not None:
+                    snapshot = extraction_service.get_progress(job_id) or snapshot
+                elif progress_bus.get(job_id) is None:
+                    # Not running in this process - fall back to the persisted row
+                    snapshot = extraction_service.get_progress(job_id)
+                    if snapshot is None:
+                        return
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            progress_bus.unsubscribe(subscription)
+
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        }
+    )
@@ -4,13 +4,22 @@ Handles file reading and downloading
 """
 
 import os
+import posixpath
+import shutil
 import logging
-from flask import Blueprint, jsonify, send_from_directory
+from flask import Blueprint, jsonify, send_file, send_from_directory
 
 from app.database import db_session
-from app.models import Job, FileMetadata
-from app.utils.security import check_file_access, check_file_size, is_binary_file, get_file_size_human
+from app.models import Job
+from app.utils.security import (check_file_access, check_file_size, is_binary_data, is_binary_file,
+                                get_file_size_human, size_limit_error)
+from app.services.cold_storage import cold_storage_service
+from app.services.file_classifier import file_classifier_service, text_codec
 from app.services.rhcert_extractor import RHCertAttachmentExtractor
+from app.services.resource_governor import ResourceLimitExceeded
+from app.services.stage_timing import stage_timing_service
+from app.services.tree_watcher import tree_watcher_service
+from app.utils.walker import WalkEntry
 from config import settings
 
 logger = logging.getLogger(__name__)
@@ -32,6 +41,11 @@ def read_file(job_id, file_path):
     if not job:
         return jsonify({'error': 'Job not found'}), 404
 
+    # Files of a job moved to the cold tier are read from its pack
+    pack = cold_storage_service.get(job_id)
+    if pack is not None:
+        return _read_packed_file(job_id, pack, file_path)
+
     # Security check
     is_safe, full_path, error = check_file_access(job_id, file_path)
     if not is_safe:
@@ -44,48 +58,20 @@ def read_file(job_id, file_path):
     # Check file size
     is_valid_size, size, size_error = check_file_size(full_path)
     if not is_valid_size:
-        # Check if this is a file that can be extracted even if too large to preview
-        file_lower = file_path.lower()
-        can_extract = False
-        extract_type = None
-
-        # Check if it's a rhcert XML file with embedded attachments
-        if file_lower.endswith('.xml') and ('rhcert' in file_lower or 'rhcert-results' in file_lower):
-            can_extract = True
-            extract_type = 'rhcert'
-        # Check if it's a nested archive
-        elif any(file_lower.endswith(ext) for ext in ['.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.zip', '.gz', '.bz2', '.xz']):
-            can_extract = True
-            extract_type = 'archive'
+        return _too_large_response(file_path, size, size_error)
 
-        return jsonify({
-            'error': 'File too large for preview',
-            'size': get_file_size_human(size),
-            'message': size_error,
-            'can_extract': can_extract,
-            'extract_type': extract_type,
-            'file_path': file_path
-        }), 413
-
-    # Check if binary
-    if is_binary_file(full_path):
-        return jsonify({
-            'error': 'Binary file',
-            'message': 'This file appears to be binary and cannot be displayed as text',
-            'size': get_file_size_human(size)
-        }), 415
+    # Check if binary (classified at index time, else sniffed)
+    file_type = file_classifier_service.lookup(job_id, file_path)
+    if file_type['is_binary'] if file_type else is_binary_file(full_path):
+        return _binary_file_response(size)
 
     # Read file content
     try:
-        with open(full_path, 'r', encoding='utf-8', errors='replace') as f:
+        encoding = text_codec(file_type['encoding'] if file_type else None)
+        with open(full_path, 'r', encoding=encoding, errors='replace') as f:
             content = f.read()
 
-        return jsonify({
-            'success': True,
-            'content': content,
-            'size': size,
-            'size_human': get_file_size_human(size)
-        })
+        return _text_file_response(content, size, file_type)
 
     except Exception as e:
         return jsonify({
@@ -108,6 +94,16 @@ def download_file(job_id, file_path):
     if not job:
         return jsonify({'error': 'Job not found'}), 404
 
+    pack = cold_storage_service.get(job_id)
+    if pack is not None:
+        member, error_response = _packed_member(pack, file_path, 'Cannot download directory')
+        if error_response:
+            return error_response
+        response = send_file(pack.open(member), as_attachment=True,
+                             download_name=posixpath.basename(member))
+        response.content_length = pack.size(member)
+        return response
+
     # Security check
     is_safe, full_path, error = check_file_access(job_id, file_path)
     if not is_safe:
@@ -138,16 +134,23 @@ def extract_nested_archive(job_id, file_path):
     if not job:
         return jsonify({'error': 'Job not found'}), 404
 
-    # Security check
-    is_safe, full_path, error = check_file_access(job_id, file_path)
-    if not is_safe:
-        return jsonify({'error': error}), 403 if 'denied' in error.lower() else 404
-
     # Check if file is an archive
     file_lower = file_path.lower()
     if not any(file_lower.endswith(ext) for ext in ['.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.zip', '.gz', '.bz2', '.xz']):
         return jsonify({'error': 'Not a supported archive format'}), 400
 
+    # Extraction writes next to the job's files - bring them back from the cold tier
+    error_response = _rehydrate_for_extraction(job_id, file_path)
+    if error_response:
+        return error_response
+
+    # Security check
+    is_safe, full_path, error = check_file_access(job_id, file_path)
+    if not is_safe:
+        return jsonify({'error': error}), 403 if 'denied' in error.lower() else 404
+
+    # The extraction indexes its own files
+    tree_watcher_service.pause(job_id)
     try:
         # Create extraction subdirectory
         base_name = os.path.basename(file_path)
@@ -172,27 +175,33 @@ def extract_nested_archive(job_id, file_path):
 
         logger.info(f"Extracting nested archive: {file_path} to {extraction_dir}")
 
-        if file_ext == 'zip':
-            extraction_service._extract_zip(job_id, full_path, extraction_dir)
-        elif file_ext in ['tar', 'gz', 'bz2', 'xz', 'tgz'] or 'tar' in base_name:
-            # Try as compressed file first, then tar
-            if file_ext in ['gz', 'bz2', 'xz'] and not any(base_name.endswith(ext) for ext in ['.tar.gz', '.tar.bz2', '.tar.xz']):
-                try:
-                    if not extraction_service._extract_compressed_file(job_id, full_path, extraction_dir, base_name, file_ext):
+        with stage_timing_service.stage(job_id, 'nested_extract') as sample:
+            if file_ext == 'zip':
+                extraction_service._extract_zip(job_id, full_path, extraction_dir)
+            elif file_ext in ['tar', 'gz', 'bz2', 'xz', 'tgz'] or 'tar' in base_name:
+                # Try as compressed file first, then tar
+                if file_ext in ['gz', 'bz2', 'xz'] and not any(base_name.endswith(ext) for ext in ['.tar.gz', '.tar.bz2', '.tar.xz']):
+                    try:
+                        if not extraction_service._extract_compressed_file(job_id, full_path, extraction_dir, base_name, file_ext):
+                            extraction_service._extract_tar(job_id, full_path, extraction_dir, base_name, file_ext)
+                    except ResourceLimitExceeded:
+                        raise
+                    except Exception:
                         extraction_service._extract_tar(job_id, full_path, extraction_dir, base_name, file_ext)
-                except Exception:
+                else:
                     extraction_service._extract_tar(job_id, full_path, extraction_dir, base_name, file_ext)
             else:
-                extraction_service._extract_tar(job_id, full_path, extraction_dir, base_name, file_ext)
-        else:
-            return jsonify({'error': f'Unsupported format: {file_ext}'}), 400
+                return jsonify({'error': f'Unsupported format: {file_ext}'}), 400
 
-        # Count extracted files
-        extracted_count = sum(1 for _ in os.walk(extraction_dir) for _ in _[2])
+            # Count extracted files
+            extracted_count = sum(1 for _ in os.walk(extraction_dir) for _ in _[2])
+            sample.items = extracted_count
+            sample.bytes_processed = extraction_service._final_figures(job_id).get('uncompressed_bytes')
 
         # Index extracted files
         from app.services.indexing import indexing_service
-        indexing_service.index_directory(job_id, extraction_dir, f'nested_archives/{folder_name}')
+        with stage_timing_service.stage(job_id, 'nested_index') as sample:
+            sample.items = indexing_service.index_directory(job_id, extraction_dir, f'nested_archives/{folder_name}')
 
         return jsonify({
             'success': True,
@@ -201,6 +210,14 @@ def extract_nested_archive(job_id, file_path):
             'extracted_files': extracted_count
         })
 
+    except ResourceLimitExceeded as e:
+        logger.warning(f"Nested extraction aborted for {file_path}: {e}")
+        shutil.rmtree(extraction_dir, ignore_errors=True)
+        return jsonify({
+            'error': 'Extraction aborted',
+            'message': str(e)
+        }), 413
+
     except Exception as e:
         logger.error(f"Error extracting nested archive: {e}")
         import traceback
@@ -210,6 +227,9 @@ def extract_nested_archive(job_id, file_path):
             'message': str(e)
         }), 500
 
+    finally:
+        tree_watcher_service.resume(job_id)
+
 
 @viewer_bp.route('/extract-rhcert/<job_id>/<path:file_path>', methods=['POST'])
 def extract_rhcert_attachments(job_id, file_path):
@@ -225,11 +245,6 @@ def extract_rhcert_attachments(job_id, file_path):
     if not job:
         return jsonify({'error': 'Job not found'}), 404
 
-    # Security check
-    is_safe, full_path, error = check_file_access(job_id, file_path)
-    if not is_safe:
-        return jsonify({'error': error}), 403 if 'denied' in error.lower() else 404
-
     # Check if it's an XML file
     if not file_path.lower().endswith('.xml'):
         return jsonify({'error': 'Not an XML file'}), 400
@@ -239,6 +254,18 @@ def extract_rhcert_attachments(job_id, file_path):
     if 'rhcert' not in file_basename:
         return jsonify({'error': 'Not a rhcert file'}), 400
 
+    # Extraction writes next to the job's files - bring them back from the cold tier
+    error_response = _rehydrate_for_extraction(job_id, file_path)
+    if error_response:
+        return error_response
+
+    # Security check
+    is_safe, full_path, error = check_file_access(job_id, file_path)
+    if not is_safe:
+        return jsonify({'error': error}), 403 if 'denied' in error.lower() else 404
+
+    # The extraction indexes its own files
+    tree_watcher_service.pause(job_id)
     try:
         # Get extraction base directory (same as job extraction directory)
         extraction_dir = os.path.join(settings.EXTRACT_FOLDER, job_id)
@@ -248,10 +275,16 @@ def extract_rhcert_attachments(job_id, file_path):
 
         # Extract all attachments
         logger.info(f"Extracting attachments from rhcert XML: {file_path}")
-        results = extractor.extract_all_attachments()
+        with stage_timing_service.stage(job_id, 'rhcert_extract') as sample:
+            results = extractor.extract_all_attachments()
+            sample.items = len(results['extracted_files']) + sum(
+                len(archive['extracted_files']) for archive in results['extracted_archives'])
+            sample.bytes_processed = os.path.getsize(full_path)
 
         # Index extracted files in database
-        indexed_count = _index_extracted_files(job_id, results, extraction_dir)
+        with stage_timing_service.stage(job_id, 'rhcert_index') as sample:
+            indexed_count = _index_extracted_files(job_id, results, extraction_dir)
+            sample.items = indexed_count
 
         return jsonify({
             'success': True,
@@ -272,6 +305,130 @@ def extract_rhcert_attachments(job_id, file_path):
             'message': str(e)
         }), 500
 
+    finally:
+        tree_watcher_service.resume(job_id)
+
+
+def _too_large_response(file_path, size, size_error):
+    """413 response for a file over the preview limit, saying whether it can be extracted instead"""
+    file_lower = file_path.lower()
+    can_extract = False
+    extract_type = None
+
+    # Check if it's a rhcert XML file with embedded attachments
+    if file_lower.endswith('.xml') and ('rhcert' in file_lower or 'rhcert-results' in file_lower):
+        can_extract = True
+        extract_type = 'rhcert'
+    # Check if it's a nested archive
+    elif any(file_lower.endswith(ext) for ext in ['.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.zip', '.gz', '.bz2', '.xz']):
+        can_extract = True
+        extract_type = 'archive'
+
+    return jsonify({
+        'error': 'File too large for preview',
+        'size': get_file_size_human(size),
+        'message': size_error,
+        'can_extract': can_extract,
+        'extract_type': extract_type,
+        'file_path': file_path
+    }), 413
+
+
+def _binary_file_response(size):
+    """415 response for a file that cannot be shown as text"""
+    return jsonify({
+        'error': 'Binary file',
+        'message': 'This file appears to be binary and cannot be displayed as text',
+        'size': get_file_size_human(size)
+    }), 415
+
+
+def _packed_member(pack, file_path, directory_error):
+    """
+    Resolve a request path to a member of a cold job's pack
+
+    Returns:
+        tuple: (member path, None) or (None, error response)
+    """
+    relative_path = posixpath.normpath(file_path) if file_path else ''
+    relative_path = '' if relative_path == '.' else relative_path
+    if relative_path.startswith('/') or relative_path == '..' or relative_path.startswith('../'):
+        return None, (jsonify({'error': 'Access denied - path traversal attempt detected'}), 403)
+
+    member = pack.resolve(relative_path)
+    if member is None:
+        if pack.is_directory(relative_path):
+            return None, (jsonify({'error': directory_error}), 400)
+        return None, (jsonify({'error': 'File or directory not found'}), 404)
+    return member, None
+
+
+def _rehydrate_for_extraction(job_id, file_path):
+    """
+    Bring a cold job's files back to disk before an extraction writes next to them
+
+    The path is checked against the pack first, so a request for a missing
+    file or a directory never expands (and deletes) the pack.
+
+    Returns:
+        Error response, or None once the job's files are on disk
+    """
+    pack = cold_storage_service.get(job_id)
+    if pack is not None:
+        _, error_response = _packed_member(pack, file_path, 'Cannot extract a directory')
+        if error_response:
+            return error_response
+
+    try:
+        cold_storage_service.ensure_hot(job_id)
+    except Exception as e:
+        logger.error(f"Rehydrating job {job_id} failed: {e}", exc_info=True)
+        return jsonify({
+            'error': 'Rehydration failed',
+            'message': str(e)
+        }), 500
+    return None
+
+
+def _read_packed_file(job_id, pack, file_path):
+    """read_file for a job whose files are in the cold tier"""
+    member, error_response = _packed_member(pack, file_path, 'Cannot read directory')
+    if error_response:
+        return error_response
+
+    size = pack.size(member)
+    size_error = size_limit_error(size)
+    if size_error:
+        return _too_large_response(file_path, size, size_error)
+
+    try:
+        data = pack.read(member)
+    except Exception as e:
+        return jsonify({
+            'error': 'Error reading file',
+            'message': str(e)
+        }), 500
+
+    file_type = file_classifier_service.lookup(job_id, file_path)
+    if file_type['is_binary'] if file_type else is_binary_data(data[:1024]):
+        return _binary_file_response(size)
+
+    encoding = text_codec(file_type['encoding'] if file_type else None)
+    return _text_file_response(data.decode(encoding, errors='replace'), size, file_type)
+
+
+def _text_file_response(content, size, file_type):
+    """read_file response for a text file (with its stored classification, if any)"""
+    return jsonify({
+        'success': True,
+        'content': content,
+        'size': size,
+        'size_human': get_file_size_human(size),
+        'encoding': file_type['encoding'] if file_type else None,
+        'mime_type': file_type['mime_type'] if file_type else None,
+        'line_count': file_type['line_count'] if file_type else None
+    })
+
 
 def _index_extracted_files(job_id: str, extraction_results: dict, extraction_dir: str) -> int:
     """
@@ -285,77 +442,24 @@ def _index_extracted_files(job_id: str, extraction_results: dict, extraction_dir
     Returns:
         int: Number of files indexed
     """
-    indexed_count = 0
-
-    try:
-        # Index direct attachments
-        for file_info in extraction_results['extracted_files']:
-            # Check if already indexed
-            existing = db_session.query(FileMetadata).filter_by(
-                job_id=job_id,
-                relative_path=file_info['relative_path']
-            ).first()
-
-            if not existing:
-                # Get file details
-                file_path = file_info['path']
-                file_name = os.path.basename(file_path)
-                file_size = file_info['size']
-                file_ext = os.path.splitext(file_name)[1]
-
-                # Create metadata entry
-                metadata = FileMetadata(
-                    job_id=job_id,
-                    name=file_name,
-                    path=file_path,
-                    relative_path=file_info['relative_path'],
-                    size=file_size,
-                    extension=file_ext,
-                    is_directory=False,
-                    parent_path='rhcert_attachments'
-                )
-
-                db_session.add(metadata)
-                indexed_count += 1
-
-        # Index files extracted from archives
-        for archive_result in extraction_results['extracted_archives']:
-            for file_info in archive_result['extracted_files']:
-                # Check if already indexed
-                existing = db_session.query(FileMetadata).filter_by(
-                    job_id=job_id,
-                    relative_path=file_info['relative_path']
-                ).first()
-
-                if not existing:
-                    file_path = file_info['path']
-                    file_name = os.path.basename(file_path)
-                    file_size = file_info['size']
-                    file_ext = os.path.splitext(file_name)[1]
-
-                    # Determine parent path
-                    rel_path_parts = file_info['relative_path'].split('/')
-                    parent_path = '/'.join(rel_path_parts[:-1]) if len(rel_path_parts) > 1 else ''
-
-                    metadata = FileMetadata(
-                        job_id=job_id,
-                        name=file_name,
-                        path=file_path,
-                        relative_path=file_info['relative_path'],
-                        size=file_size,
-                        extension=file_ext,
-                        is_directory=False,
-                        parent_path=parent_path
-                    )
-
-                    db_session.add(metadata)
-                    indexed_count += 1
-
-        db_session.commit()
-        logger.info(f"Indexed {indexed_count} extracted files in database")
-
-    except Exception as e:
-        logger.error(f"Error indexing extracted files: {e}")
-        db_session.rollback()
-
+    from app.services.indexing import indexing_service
+
+    file_infos = list(extraction_results['extracted_files'])
+    for archive_result in extraction_results['extracted_archives']:
+        file_infos.extend(archive_result['extracted_files'])
+
+    entries = [
+        WalkEntry(
+            name=os.path.basename(file_info['path']),
+            path=file_info['path'],
+            relative_path=file_info['relative_path'],
+            parent_path=posixpath.dirname(file_info['relative_path']),
+            is_directory=False,
+            size=file_info['size']
+        )
+        for file_info in file_infos
+    ]
+
+    indexed_count = indexing_service.index_entries(job_id, entries, 'rhcert_attachments')
+    logger.info(f"Indexed {indexed_count} extracted files in database")
     return indexed_count
@@ -0,0 +1,223 @@
+"""
+CLI Commands
+Maintenance commands registered on the Flask app (run with `flask --app run_main <command>`)
+"""
+
+import os
+import re
+import sys
+
+import click
+from sqlalchemy import event
+
+from app.database import db_session
+from app.models import Job, Directory
+from app.services.index_store import index_store
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Read endpoints whose file index queries must stay on an index
+HOT_ENDPOINTS = (
+    '/api/browse/{job_id}',
+    '/api/browse/{job_id}/{dir_path}',
+    '/api/tree/{job_id}',
+    '/api/tree/{job_id}/{dir_path}',
+    '/api/all-files/{job_id}',
+    '/api/summary/{job_id}',
+    '/api/search/{job_id}?q=log',
+)
+
+# Plan lines that mean every row (of a table, or of an index across all jobs) is read
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'^SCAN (file_metadata|directories)\b'),
+    'postgresql': re.compile(r'Seq Scan on (file_metadata|directories)\b'),
+}
+
+
+def register_commands(app):
+    """Register CLI commands"""
+    app.cli.add_command(check_query_plans)
+    app.cli.add_command(migrate_sqlite)
+    app.cli.add_command(retention_sweep)
+    app.cli.add_command(cold_tier_sweep)
+
+
+@click.command('check-query-plans')
+@click.option('--job-id', default=None, help='Indexed job to run the queries against (default: latest completed)')
+def check_query_plans(job_id):
+    """
+    Fail if a hot browse/tree/summary query falls back to a full table scan
+
+    Runs each endpoint in HOT_ENDPOINTS through the test client, captures
+    every SELECT it issues against file_metadata or directories and checks
+    the database's EXPLAIN output for it. Manifests are bypassed so the
+    database paths (used while a job's index is changing) are exercised.
+    """
+    from flask import current_app
+
+    job = _pick_job(job_id)
+    if not job:
+        click.echo('No completed job to check against - upload an archive first', err=True)
+        sys.exit(2)
+
+    # The job's index may live in its own shard
+    index_engine = index_store.engine(job.id)
+
+    dir_path = index_store.session(job.id).query(Directory.relative_path).filter(
+        Directory.job_id == job.id,
+        Directory.parent_id != None
+    ).order_by(Directory.relative_path).first()
+    dir_path = dir_path.relative_path if dir_path else ''
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and ('file_metadata' in statement or 'directories' in statement):
+            statements.append((statement, parameters))
+
+    event.listen(index_engine, 'before_cursor_execute', capture)
+    manifests_enabled = settings.ENABLE_MANIFESTS
+    settings.ENABLE_MANIFESTS = False
+    try:
+        client = current_app.test_client()
+        for endpoint in HOT_ENDPOINTS:
+            response = client.get(endpoint.format(job_id=job.id, dir_path=dir_path))
+            if response.status_code != 200:
+                click.echo(f'{endpoint}: HTTP {response.status_code}', err=True)
+    finally:
+        settings.ENABLE_MANIFESTS = manifests_enabled
+        event.remove(index_engine, 'before_cursor_execute', capture)
+
+    failures = 0
+    seen = set()
+    for statement, parameters in statements:
+        if statement in seen:
+            continue
+        seen.add(statement)
+
+        plan = _explain(index_engine, statement, parameters)
+        full_scans = _full_scans(index_engine, plan)
+        status = 'FULL SCAN' if full_scans else 'ok'
+        click.echo(f'[{status}] {" ".join(statement.split())[:160]}')
+        for line in plan:
+            click.echo(f'    {line}')
+        failures += bool(full_scans)
+
+    click.echo(f'{len(seen)} queries checked, {failures} with full table scans')
+    sys.exit(1 if failures else 0)
+
+
+@click.command('migrate-sqlite')
+@click.argument('source')
+def migrate_sqlite(source):
+    """
+    Copy an existing SQLite database into the configured DATABASE_URL
+
+    SOURCE is the SQLite file (or sqlite:// URL) the application used so far.
+    Point DATABASE_URL at the new, empty PostgreSQL database and run this
+    once; the tables are created on startup and filled in one transaction.
+    Per-job index shards and manifests are files and stay where they are.
+    """
+    from sqlalchemy import create_engine
+    from app.database import engine, engine_options
+    from app.services.database_migration import database_migration_service, DatabaseMigrationError
+
+    source_url = source if source.startswith('sqlite') else f'sqlite:///{os.path.abspath(source)}'
+    if not source_url.startswith('sqlite:///') or not os.path.exists(source_url[len('sqlite:///'):]):
+        click.echo(f'No SQLite database at {source}', err=True)
+        sys.exit(2)
+    if engine.dialect.name == 'sqlite':
+        click.echo('DATABASE_URL points at SQLite - set it to the target database first', err=True)
+        sys.exit(2)
+
+    source_engine = create_engine(source_url, **engine_options(source_url))
+
+    def report(table_name, copied, skipped):
+        note = f' ({skipped} orphaned rows skipped)' if skipped else ''
+        click.echo(f'{table_name}: {copied} rows{note}')
+
+    try:
+        copied = database_migration_service.copy(source_engine, engine, progress=report)
+    except DatabaseMigrationError as e:
+        click.echo(str(e), err=True)
+        sys.exit(1)
+    finally:
+        source_engine.dispose()
+
+    click.echo(f'Migrated {sum(copied.values())} rows into {engine.url.render_as_string(hide_password=True)}')
+
+
+@click.command('retention-sweep')
+@click.option('--dry-run', is_flag=True, help='Only list the jobs that would be deleted')
+def retention_sweep(dry_run):
+    """
+    Delete the finished jobs selected by the retention policies now
+
+    Uses RETENTION_MAX_AGE_DAYS, RETENTION_MAX_IDLE_DAYS and
+    RETENTION_MAX_TOTAL_BYTES, like the background sweep.
+    """
+    from app.services.retention import retention_service
+
+    if not retention_service.enabled:
+        click.echo('No retention policy configured', err=True)
+        sys.exit(2)
+
+    jobs = retention_service.sweep(dry_run=dry_run)
+    for job_id, reason in jobs:
+        click.echo(f'{job_id}  {reason}')
+    click.echo(f'{len(jobs)} jobs {"selected" if dry_run else "deleted"}')
+
+
+@click.command('cold-tier-sweep')
+@click.option('--job', 'job_ids', multiple=True, help='Pack this job regardless of idle time (repeatable)')
+def cold_tier_sweep(job_ids):
+    """
+    Pack idle jobs (or the given ones) into the cold tier now
+
+    Without --job, uses COLD_TIER_IDLE_DAYS like the background sweep.
+    """
+    from app.services.cold_storage import cold_storage_service
+
+    if job_ids:
+        packed = [job_id for job_id in job_ids if cold_storage_service.pack(job_id)]
+    elif not cold_storage_service.enabled:
+        click.echo('COLD_TIER_IDLE_DAYS is not set', err=True)
+        sys.exit(2)
+    else:
+        packed = cold_storage_service.sweep()
+
+    for job_id in packed:
+        click.echo(job_id)
+    click.echo(f'{len(packed)} jobs packed')
+
+
+def _pick_job(job_id):
+    """The requested job, or the most recently completed one"""
+    query = db_session.query(Job)
+    if job_id:
+        return query.filter_by(id=job_id).first()
+    return query.filter_by(status='completed').order_by(Job.created_at.desc()).first()
+
+
+def _explain(engine, statement, parameters):
+    """EXPLAIN output lines for a captured statement"""
+    with engine.connect() as conn:
+        if engine.dialect.name == 'sqlite':
+            rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+            return [row[-1] for row in rows]
+
+        if engine.dialect.name == 'postgresql':
+            # Small tables favour sequential scans; only ask whether an index path exists
+            conn.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        rows = conn.exec_driver_sql(f'EXPLAIN {statement}', parameters).fetchall()
+        return [str(row[0]) for row in rows]
+
+
+def _full_scans(engine, plan):
+    """Plan lines that read all of file_metadata or directories"""
+    pattern = FULL_SCAN_PATTERNS.get(engine.dialect.name)
+    if pattern is None:
+        return []
+    return [line for line in plan if pattern.search(line.strip())]
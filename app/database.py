@@ -2,18 +2,86 @@
 Database Configuration and Session Management
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import scoped_session, sessionmaker
 
 from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Name a pre-hierarchy file_metadata table (one full-path row per file and
+# directory) is moved to while its rows are converted
+LEGACY_FILE_TABLE = 'file_metadata_legacy'
+
+def engine_options(url):
+    """
+    create_engine() keyword arguments for a database URL
+
+    SQLite gets cross-thread connections and a busy timeout. Server databases
+    get a sized connection pool (extraction threads, indexing and requests
+    each check out their own connection) with pre-ping and recycling so
+    connections dropped by the server are replaced; PostgreSQL sessions also
+    get a statement timeout.
+
+    Args:
+        url: Database URL
+
+    Returns:
+        dict: Engine options
+    """
+    if url.startswith('sqlite'):
+        return {
+            'connect_args': {'check_same_thread': False, 'timeout': settings.SQLITE_BUSY_TIMEOUT},
+            'echo': settings.DEBUG
+        }
+
+    options = {
+        'pool_size': settings.DB_POOL_SIZE,
+        'max_overflow': settings.DB_MAX_OVERFLOW,
+        'pool_timeout': settings.DB_POOL_TIMEOUT,
+        'pool_recycle': settings.DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+        'echo': settings.DEBUG
+    }
+    if url.startswith('postgresql') and settings.DB_STATEMENT_TIMEOUT:
+        options['connect_args'] = {'options': f'-c statement_timeout={int(settings.DB_STATEMENT_TIMEOUT * 1000)}'}
+    return options
+
 
 # Create engine
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={'check_same_thread': False} if 'sqlite' in settings.DATABASE_URL else {},
-    echo=settings.DEBUG
-)
+engine = create_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL))
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL lets the web workers keep reading while an indexing job holds its
+    single write transaction; synchronous=NORMAL is safe under WAL and
+    avoids an fsync per commit.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """
+    SQLite ignores foreign keys (and their ON DELETE CASCADE) unless asked
+
+    Only for the main database: index shards hold no jobs table, so their
+    job_id references cannot be enforced.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+
+if engine.dialect.name == 'sqlite':
+    event.listen(engine, 'connect', set_sqlite_pragmas)
+    event.listen(engine, 'connect', enable_sqlite_foreign_keys)
+
 
 # Create session factory
 db_session = scoped_session(
@@ -28,9 +96,128 @@ Base.query = db_session.query_property()
 def init_db():
     """Initialize database tables"""
     # Import all models to register them with Base
-    from app.models import job, file_metadata, analysis
+    from app.models import (job, job_stats, directory, directory_stats, file_metadata, analysis, stage_timing,
+                            post_index_state)
 
+    legacy_file_index = _retire_legacy_file_index()
     Base.metadata.create_all(bind=engine)
+    if legacy_file_index:
+        _convert_legacy_file_index()
+    migrate_schema()
+
+    # Jobs indexed before directory stats existed (including converted ones)
+    from app.services.directory_stats import directory_stats_service
+    directory_stats_service.backfill()
+
+
+def _retire_legacy_file_index():
+    """
+    Move a pre-hierarchy file_metadata table out of the way
+
+    Returns:
+        bool: True if there is a legacy table to convert
+    """
+    inspector = inspect(engine)
+    if inspector.has_table(LEGACY_FILE_TABLE):
+        return True
+    if not inspector.has_table('file_metadata'):
+        return False
+    if 'relative_path' not in {column['name'] for column in inspector.get_columns('file_metadata')}:
+        return False
+
+    with engine.begin() as conn:
+        for index in inspector.get_indexes('file_metadata'):
+            conn.execute(text(f'DROP INDEX {index["name"]}'))
+        conn.execute(text(f'ALTER TABLE file_metadata RENAME TO {LEGACY_FILE_TABLE}'))
+        if engine.dialect.name == 'postgresql':
+            conn.execute(text(f'ALTER SEQUENCE IF EXISTS file_metadata_id_seq RENAME TO {LEGACY_FILE_TABLE}_id_seq'))
+    return True
+
+
+def _convert_legacy_file_index():
+    """Rebuild directories and file rows from the legacy table, then drop it (one transaction)"""
+    from app.models import Directory, FileMetadata
+
+    converted = 0
+    with engine.begin() as conn:
+        job_ids = [row[0] for row in conn.execute(text(f'SELECT DISTINCT job_id FROM {LEGACY_FILE_TABLE}'))]
+
+        for job_id in job_ids:
+            rows = conn.execute(text(
+                f'SELECT relative_path, is_directory, size, extension, content_preview '
+                f'FROM {LEGACY_FILE_TABLE} WHERE job_id = :job_id'
+            ), {'job_id': job_id}).all()
+
+            # Every directory row plus every ancestor of any row
+            dir_paths = {''}
+            for relative_path, is_directory, *_ in rows:
+                path = relative_path if is_directory else relative_path.rpartition('/')[0]
+                while path not in dir_paths:
+                    dir_paths.add(path)
+                    path = path.rpartition('/')[0]
+
+            dir_ids = {}
+            for path in sorted(dir_paths, key=lambda p: (p.count('/') + 1 if p else 0, p)):
+                parent_path, _, name = path.rpartition('/')
+                dir_ids[path] = conn.execute(Directory.__table__.insert().values(
+                    job_id=job_id,
+                    parent_id=dir_ids[parent_path] if path else None,
+                    name=name,
+                    relative_path=path
+                )).inserted_primary_key[0]
+
+            files = {}
+            for relative_path, is_directory, size, extension, content_preview in rows:
+                if is_directory:
+                    continue
+                parent_path, _, name = relative_path.rpartition('/')
+                files[(dir_ids[parent_path], name)] = {
+                    'job_id': job_id, 'parent_id': dir_ids[parent_path], 'name': name,
+                    'size': size, 'extension': extension, 'content_preview': content_preview
+                }
+            if files:
+                conn.execute(FileMetadata.__table__.insert(), list(files.values()))
+            converted += len(files)
+
+        conn.execute(text(f'DROP TABLE {LEGACY_FILE_TABLE}'))
+
+    logger.info(f"Converted {converted} indexed files of {len(job_ids)} jobs to the directory hierarchy")
+
+
+def migrate_schema(bind=None, tables=None):
+    """
+    Apply additive schema changes to existing databases
+
+    create_all() only creates missing tables, so columns and indexes added to
+    a model after its table was created are added here.
+
+    Args:
+        bind: Engine to migrate (default: the main database)
+        tables: Tables to check (default: every model table)
+    """
+    bind = bind or engine
+    inspector = inspect(bind)
+    tables = [table for table in (tables or Base.metadata.sorted_tables) if inspector.has_table(table.name)]
+
+    with bind.begin() as conn:
+        for table in tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=bind.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+    for table in tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                index.create(bind=bind)
+            except Exception as e:
+                # e.g. a unique index over rows that already contain duplicates
+                logger.warning(f"Could not create index {index.name}: {e}")
 
 
 def shutdown_session(exception=None):
@@ -3,13 +3,23 @@ Database Models
 """
 
 from app.models.job import Job
+from app.models.job_stats import JobStats
+from app.models.directory import Directory
+from app.models.directory_stats import DirectoryStats
 from app.models.file_metadata import FileMetadata
 from app.models.analysis import TestAnalysis, TestFailure, AIConversation
+from app.models.stage_timing import JobStageTiming
+from app.models.post_index_state import PostIndexState
 
 __all__ = [
     'Job',
+    'JobStats',
+    'Directory',
+    'DirectoryStats',
     'FileMetadata',
     'TestAnalysis',
     'TestFailure',
     'AIConversation',
+    'JobStageTiming',
+    'PostIndexState',
 ]
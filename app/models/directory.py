@@ -0,0 +1,54 @@
+"""
+Directory Model - Directory hierarchy of an extraction
+"""
+
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, Text
+from app.database import Base
+
+
+class Directory(Base):
+    """
+    One directory of an extraction
+
+    Every job has a root directory (parent_id NULL, name and relative_path
+    '') that top-level entries hang off. Files reference their directory by
+    parent_id, so a directory's path is stored once instead of once per file.
+    """
+
+    __tablename__ = 'directories'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String(36), ForeignKey('jobs.id', ondelete='CASCADE'), nullable=False)
+    parent_id = Column(Integer, ForeignKey('directories.id', ondelete='CASCADE'), nullable=True)
+
+    name = Column(String(255), nullable=False)
+    relative_path = Column(Text, nullable=False)  # Path relative to extraction root
+
+    __table_args__ = (
+        # Path lookups and subtree range scans
+        Index('uq_directories_job_path', 'job_id', 'relative_path', unique=True),
+        # Children of a directory
+        Index('uq_directories_parent_name', 'parent_id', 'name', unique=True),
+        # Lookup by name (rhoso folders)
+        Index('idx_directories_job_name', 'job_id', 'name'),
+    )
+
+    @property
+    def parent_path(self):
+        """Relative path of the parent directory ('' for top-level directories)"""
+        return self.relative_path.rpartition('/')[0]
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'path': self.relative_path,
+            'size': None,
+            'extension': None,
+            'is_directory': True,
+            'parent_path': self.parent_path,
+        }
+
+    def __repr__(self):
+        return f'<Directory {self.relative_path or "/"}>'
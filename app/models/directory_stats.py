@@ -0,0 +1,44 @@
+"""
+Directory Stats Model - Recursive aggregates of a directory subtree
+"""
+
+from sqlalchemy import Column, String, Integer, BigInteger, ForeignKey, Float, Index
+from app.database import Base
+
+
+class DirectoryStats(Base):
+    """
+    File count, byte total and newest mtime of everything below a directory
+
+    Computed bottom-up when a job is indexed and updated with deltas when
+    nested archives or rhcert attachments add files, so tree, browse and
+    summary never have to count files themselves.
+    """
+
+    __tablename__ = 'directory_stats'
+
+    directory_id = Column(Integer, ForeignKey('directories.id', ondelete='CASCADE'), primary_key=True)
+    job_id = Column(String(36), ForeignKey('jobs.id', ondelete='CASCADE'), nullable=False)
+
+    # Recursive totals (the directory itself is not counted)
+    file_count = Column(Integer, nullable=False, default=0)
+    directory_count = Column(Integer, nullable=False, default=0)
+    total_size = Column(BigInteger, nullable=False, default=0)  # bytes
+    max_mtime = Column(Float, nullable=True)  # newest file mtime (epoch seconds)
+
+    __table_args__ = (
+        # Job cleanup and backfill
+        Index('idx_directory_stats_job', 'job_id'),
+    )
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'file_count': self.file_count,
+            'directory_count': self.directory_count,
+            'total_size': self.total_size,
+            'max_mtime': self.max_mtime,
+        }
+
+    def __repr__(self):
+        return f'<DirectoryStats {self.directory_id}: {self.file_count} files, {self.total_size} bytes>'
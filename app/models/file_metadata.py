@@ -2,53 +2,75 @@
 File Metadata Model - For search indexing
 """
 
-from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, Index, Text
+from sqlalchemy import Column, String, Integer, BigInteger, Boolean, ForeignKey, Index, Text
 from app.database import Base
 
 
 class FileMetadata(Base):
-    """Stores file metadata for search and browsing"""
+    """
+    Stores file metadata for search and browsing
+
+    Only the leaf name is stored; the path is that of the parent Directory
+    (see directory_service.path_map) plus the name.
+    """
 
     __tablename__ = 'file_metadata'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     job_id = Column(String(36), ForeignKey('jobs.id', ondelete='CASCADE'), nullable=False)
+    parent_id = Column(Integer, ForeignKey('directories.id', ondelete='CASCADE'), nullable=False)
 
     # File information
     name = Column(String(255), nullable=False)
-    path = Column(Text, nullable=False)  # Absolute path on disk
-    relative_path = Column(Text, nullable=False)  # Path relative to extraction root
-    size = Column(Integer, nullable=True)  # bytes, None for directories
+    size = Column(BigInteger, nullable=True)  # bytes
     extension = Column(String(50), nullable=True)
 
-    # Flags
-    is_directory = Column(Boolean, default=False)
-
-    # Hierarchy
-    parent_path = Column(Text, nullable=True)
-
     # Content preview for search (first 500 chars)
     content_preview = Column(Text, nullable=True)
 
-    # Indexes for performance
+    # '<algorithm>:<hex digest>' of the content, set by the post-index pipeline (job diffs)
+    content_hash = Column(String(48), nullable=True)
+
+    # Classification by the post-index pipeline (NULL until classified)
+    is_binary = Column(Boolean, nullable=True)
+    encoding = Column(String(20), nullable=True)  # None for binaries
+    mime_type = Column(String(100), nullable=True)
+    line_count = Column(BigInteger, nullable=True)  # text files only
+    compression = Column(String(10), nullable=True)  # gzip, bzip2, xz, zstd, lz4, zip, 7z
+
+    # Indexes for performance - one per access path
     __table_args__ = (
-        Index('idx_file_metadata_job', 'job_id'),
-        Index('idx_file_metadata_name', 'name'),
-        Index('idx_file_metadata_path', 'relative_path'),
-        Index('idx_file_metadata_extension', 'extension'),
+        # Files of a directory (browse, tree) and incremental re-index diffing
+        Index('uq_file_metadata_parent_name', 'parent_id', 'name', unique=True),
+        # Summary: largest files (ORDER BY size DESC LIMIT) read from the index
+        Index('idx_file_metadata_job_size', 'job_id', 'size'),
+        # Summary: extension histogram (covering) and rhcert lookup
+        Index('idx_file_metadata_job_extension', 'job_id', 'extension'),
+        # Search filtered by MIME type
+        Index('idx_file_metadata_job_mime', 'job_id', 'mime_type'),
     )
 
-    def to_dict(self):
-        """Convert to dictionary"""
+    def to_dict(self, parent_path=''):
+        """
+        Convert to dictionary
+
+        Args:
+            parent_path: Relative path of the parent directory
+        """
         return {
             'id': self.id,
             'name': self.name,
-            'path': self.relative_path,
+            'path': f'{parent_path}/{self.name}' if parent_path else self.name,
             'size': self.size,
             'extension': self.extension,
-            'is_directory': self.is_directory,
-            'parent_path': self.parent_path,
+            'is_directory': False,
+            'parent_path': parent_path,
+            'is_binary': self.is_binary,
+            'encoding': self.encoding,
+            'mime_type': self.mime_type,
+            'line_count': self.line_count,
+            'compression': self.compression,
         }
 
     def __repr__(self):
-        return f'<FileMetadata {self.name} ({self.relative_path})>'
+        return f'<FileMetadata {self.name} (directory {self.parent_id})>'
@@ -3,7 +3,7 @@ Job Model - Tracks extraction jobs
 """
 
 from datetime import datetime
-from sqlalchemy import Column, String, Integer, Boolean, Float, DateTime, Text
+from sqlalchemy import Column, String, Integer, BigInteger, Boolean, Float, DateTime, Text
 from app.database import Base
 
 
@@ -18,7 +18,7 @@ class Job(Base):
     # Job metadata
     filename = Column(String(255), nullable=False)
     status = Column(String(20), nullable=False, default='uploading')
-    # Status values: 'uploading', 'extracting', 'indexing', 'completed', 'error'
+    # Status values: 'uploading', 'queued', 'extracting', 'indexing', 'completed', 'error', 'cancelled'
 
     progress = Column(Integer, default=0)  # 0-100
     message = Column(Text, nullable=True)
@@ -26,7 +26,14 @@ class Job(Base):
     # Extraction results
     total_files = Column(Integer, default=0)
     total_directories = Column(Integer, default=0)
-    total_size = Column(Integer, default=0)  # bytes
+    total_size = Column(BigInteger, default=0)  # bytes
+
+    # Final throughput figures (capacity planning)
+    compressed_bytes = Column(BigInteger, nullable=True)  # archive bytes read
+    uncompressed_bytes = Column(BigInteger, nullable=True)  # bytes written to disk
+    members_extracted = Column(Integer, nullable=True)
+    extract_seconds = Column(Float, nullable=True)
+    index_seconds = Column(Float, nullable=True)
 
     # Test analysis flags
     has_rhoso_tests = Column(Boolean, default=False)
@@ -34,6 +41,8 @@ class Job(Base):
     # Timestamps
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    last_accessed_at = Column(DateTime, nullable=True)  # last API request for the job (retention LRU)
+    packed_at = Column(DateTime, nullable=True)  # extracted files moved to the cold tier
 
     def to_dict(self):
         """Convert to dictionary"""
@@ -47,8 +56,32 @@ class Job(Base):
             'total_directories': self.total_directories,
             'total_size': self.total_size,
             'has_rhoso_tests': self.has_rhoso_tests,
+            'throughput': self.throughput_summary(),
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'last_accessed_at': self.last_accessed_at.isoformat() if self.last_accessed_at else None,
+            'packed_at': self.packed_at.isoformat() if self.packed_at else None,
+        }
+
+    def throughput_summary(self):
+        """Final throughput figures with derived rates, or None before extraction finished"""
+        if self.extract_seconds is None:
+            return None
+
+        def per_second(value, seconds):
+            return round(value / seconds, 1) if value and seconds else 0
+
+        return {
+            'compressed_bytes': self.compressed_bytes,
+            'uncompressed_bytes': self.uncompressed_bytes,
+            'members_extracted': self.members_extracted,
+            'extract_seconds': self.extract_seconds,
+            'index_seconds': self.index_seconds,
+            'read_bytes_per_sec': per_second(self.compressed_bytes, self.extract_seconds),
+            'write_bytes_per_sec': per_second(self.uncompressed_bytes, self.extract_seconds),
+            'members_per_sec': per_second(self.members_extracted, self.extract_seconds),
+            'index_entries_per_sec': per_second((self.total_files or 0) + (self.total_directories or 0),
+                                                self.index_seconds),
         }
 
     def __repr__(self):
@@ -0,0 +1,66 @@
+"""
+Job Stats Model - Index-time summary statistics of a job
+"""
+
+import json
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, BigInteger, ForeignKey, DateTime, Text
+from app.database import Base
+
+
+class JobStats(Base):
+    """
+    Summary statistics of everything indexed for a job
+
+    Collected while indexing (and merged when nested archives or rhcert
+    attachments are indexed), so the summary endpoint is a primary-key
+    lookup instead of a scan of the job's files.
+    """
+
+    __tablename__ = 'job_stats'
+
+    job_id = Column(String(36), ForeignKey('jobs.id', ondelete='CASCADE'), primary_key=True)
+
+    total_files = Column(Integer, nullable=False, default=0)
+    total_directories = Column(Integer, nullable=False, default=0)
+    total_size = Column(BigInteger, nullable=False, default=0)  # bytes
+
+    extensions = Column(Text, nullable=True)  # JSON object: extension ('' for none) -> [count, bytes]
+    size_histogram = Column(Text, nullable=True)  # JSON object: log2 bucket (size.bit_length()) -> count
+    largest_files = Column(Text, nullable=True)  # JSON array of [relative_path, size], largest first
+    rhoso_folders = Column(Text, nullable=True)  # JSON array of relative paths
+    rhcert_files = Column(Text, nullable=True)  # JSON array of relative paths
+
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        histogram = json.loads(self.size_histogram) if self.size_histogram else {}
+        return {
+            'job_id': self.job_id,
+            'total_files': self.total_files,
+            'total_directories': self.total_directories,
+            'total_size': self.total_size,
+            'extensions': {
+                extension or 'no extension': {'count': count, 'bytes': size}
+                for extension, (count, size) in (json.loads(self.extensions) if self.extensions else {}).items()
+            },
+            'size_histogram': [
+                {
+                    'min_size': 1 << (bucket - 1) if bucket else 0,
+                    'max_size': (1 << bucket) - 1,
+                    'count': histogram[str(bucket)]
+                }
+                for bucket in sorted(int(bucket) for bucket in histogram)
+            ],
+            'largest_files': [
+                {'path': path, 'size': size}
+                for path, size in (json.loads(self.largest_files) if self.largest_files else [])
+            ],
+            'rhoso_folders': json.loads(self.rhoso_folders) if self.rhoso_folders else [],
+            'rhcert_files': json.loads(self.rhcert_files) if self.rhcert_files else [],
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+    def __repr__(self):
+        return f'<JobStats {self.job_id}: {self.total_files} files>'
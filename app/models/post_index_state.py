@@ -0,0 +1,42 @@
+"""
+Post-Index State Model - Progress of the background stages run over a job's files
+"""
+
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, BigInteger, ForeignKey, DateTime
+from app.database import Base
+
+
+class PostIndexState(Base):
+    """
+    How far a post-index stage (e.g. the content index) has got for a job
+
+    Files are processed in id order, so last_file_id is a watermark: files
+    added later (nested extraction) have higher ids and are picked up by
+    the next run. completed_at is cleared whenever the job's index grows.
+    """
+
+    __tablename__ = 'post_index_state'
+
+    job_id = Column(String(36), ForeignKey('jobs.id', ondelete='CASCADE'), primary_key=True)
+    stage = Column(String(32), primary_key=True)
+
+    last_file_id = Column(Integer, nullable=False, default=0)
+    files = Column(Integer, nullable=False, default=0)  # files the stage took in
+    bytes = Column(BigInteger, nullable=False, default=0)  # bytes of those files
+
+    completed_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'stage': self.stage,
+            'files': self.files,
+            'bytes': self.bytes,
+            'completed': self.completed_at is not None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+        }
+
+    def __repr__(self):
+        return f'<PostIndexState {self.job_id} {self.stage} @{self.last_file_id}>'
@@ -0,0 +1,48 @@
+"""
+Stage Timing Model - Per-job pipeline stage instrumentation
+"""
+
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, BigInteger, ForeignKey, DateTime, Float, Index
+from app.database import Base
+
+
+class JobStageTiming(Base):
+    """Wall time, CPU time and volume of one pipeline stage of a job"""
+
+    __tablename__ = 'job_stage_timings'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String(36), ForeignKey('jobs.id', ondelete='CASCADE'), nullable=False)
+
+    # Stage name: 'upload_save', 'extract', 'index_walk', 'index_insert',
+    # 'nested_extract', 'nested_index', 'rhcert_extract', 'rhcert_index'
+    stage = Column(String(50), nullable=False)
+
+    wall_seconds = Column(Float, nullable=False, default=0.0)
+    cpu_seconds = Column(Float, nullable=False, default=0.0)  # CPU time of the worker thread
+    bytes_processed = Column(BigInteger, nullable=True)
+    items = Column(Integer, nullable=True)  # files/members/entries handled
+
+    started_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('idx_stage_timings_job', 'job_id'),
+        Index('idx_stage_timings_stage', 'stage', 'started_at'),
+    )
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'id': self.id,
+            'job_id': self.job_id,
+            'stage': self.stage,
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'bytes_processed': self.bytes_processed,
+            'items': self.items,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+        }
+
+    def __repr__(self):
+        return f'<JobStageTiming {self.job_id} {self.stage} {self.wall_seconds:.3f}s>'
@@ -0,0 +1,180 @@
+"""
+Bulk Insert Service
+Streams plain row tuples into a table in one transaction at raw driver speed
+"""
+
+import io
+import time
+from contextlib import contextmanager
+
+from app.database import engine
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Adaptive batch sizing: each flush aims to take about this long, so batches
+# grow on fast local disks and shrink when the database is slow
+TARGET_FLUSH_SECONDS = 0.25
+MIN_BATCH_SIZE = 500
+MAX_BATCH_SIZE = 50000
+INITIAL_BATCH_SIZE = 2000
+
+
+class BulkLoader:
+    """
+    Buffers row tuples and writes them in batches on one connection
+
+    Rows are tuples in the order of `columns`. SQLite and other drivers get a
+    pre-built INSERT through DBAPI executemany; PostgreSQL (psycopg2) gets
+    COPY FROM STDIN unless conflicts must be ignored. Nothing is committed
+    until the surrounding BulkInsertService.load() block exits.
+    """
+
+    def __init__(self, connection, table, columns, ignore_conflicts=False):
+        """
+        Args:
+            connection: SQLAlchemy Connection with an open transaction
+            table: Target Table
+            columns: Column names, in row tuple order
+            ignore_conflicts: Skip rows that violate a unique index (ON CONFLICT DO NOTHING)
+        """
+        self.connection = connection
+        self.table = table
+        self.columns = tuple(columns)
+        self.ignore_conflicts = ignore_conflicts
+        self.batch_size = INITIAL_BATCH_SIZE
+        self.rows_written = 0
+        self._rows = []
+
+        dialect = connection.dialect
+        self._copy_sql = self._build_copy_sql(dialect)
+        self._insert_sql = None if self._copy_sql else self._build_insert_sql(dialect)
+
+    @property
+    def batch_full(self):
+        """True once enough rows are buffered for the next flush"""
+        return len(self._rows) >= self.batch_size
+
+    def append(self, row):
+        """Buffer one row tuple"""
+        self._rows.append(row)
+
+    def flush(self):
+        """Write buffered rows and adapt the batch size to how long it took"""
+        if not self._rows:
+            return
+
+        rows = self._rows
+        self._rows = []
+
+        started = time.perf_counter()
+        if self._copy_sql:
+            self._copy(rows)
+        elif self._insert_sql:
+            self.connection.exec_driver_sql(self._insert_sql, rows)
+        else:
+            self.connection.execute(self.table.insert(), [dict(zip(self.columns, row)) for row in rows])
+        elapsed = time.perf_counter() - started
+
+        self.rows_written += len(rows)
+        self._adapt(len(rows), elapsed)
+
+    def _adapt(self, count, elapsed):
+        """Grow or shrink the batch size towards TARGET_FLUSH_SECONDS"""
+        if count < self.batch_size:
+            return  # partial (final) batch says nothing about the rate
+        if elapsed < TARGET_FLUSH_SECONDS / 2:
+            self.batch_size = min(self.batch_size * 2, MAX_BATCH_SIZE)
+        elif elapsed > TARGET_FLUSH_SECONDS * 2:
+            self.batch_size = max(self.batch_size // 2, MIN_BATCH_SIZE)
+
+    def _build_insert_sql(self, dialect):
+        """Positional INSERT for the driver's paramstyle (None for named styles)"""
+        count = len(self.columns)
+        if dialect.paramstyle == 'qmark':
+            markers = ['?'] * count
+        elif dialect.paramstyle in ('format', 'pyformat'):
+            markers = ['%s'] * count
+        elif dialect.paramstyle == 'numeric':
+            markers = [f':{i}' for i in range(1, count + 1)]
+        else:
+            return None
+
+        preparer = dialect.identifier_preparer
+        column_list = ', '.join(preparer.quote(column) for column in self.columns)
+        sql = (f'INSERT INTO {preparer.format_table(self.table)} ({column_list}) '
+               f'VALUES ({", ".join(markers)})')
+        if self.ignore_conflicts and dialect.name in ('sqlite', 'postgresql'):
+            sql += ' ON CONFLICT DO NOTHING'
+        return sql
+
+    def _build_copy_sql(self, dialect):
+        """COPY statement when the connection is PostgreSQL through psycopg2"""
+        if dialect.name != 'postgresql' or dialect.driver != 'psycopg2' or self.ignore_conflicts:
+            return None
+
+        preparer = dialect.identifier_preparer
+        column_list = ', '.join(preparer.quote(column) for column in self.columns)
+        return f'COPY {preparer.format_table(self.table)} ({column_list}) FROM STDIN WITH (FORMAT csv)'
+
+    def _copy(self, rows):
+        """Stream rows through COPY as CSV (unquoted empty field = NULL)"""
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write(','.join(_csv_field(value) for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        cursor = self.connection.connection.cursor()
+        try:
+            cursor.copy_expert(self._copy_sql, buffer)
+        finally:
+            cursor.close()
+
+
+def _csv_field(value):
+    """Format one COPY CSV field - strings are always quoted so '' stays distinct from NULL"""
+    if value is None:
+        return ''
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class BulkInsertService:
+    """Opens bulk load transactions"""
+
+    @contextmanager
+    def load(self, table, columns, ignore_conflicts=False, bind=None):
+        """
+        Load rows into a table in a single transaction
+
+        Usage:
+            with bulk_insert_service.load(FileMetadata.__table__, columns) as loader:
+                loader.append(row)
+                if loader.batch_full:
+                    loader.flush()
+
+        Remaining rows are flushed and the transaction committed on exit; an
+        exception rolls back everything written by the block.
+
+        Args:
+            table: Target Table
+            columns: Column names, in row tuple order
+            ignore_conflicts: Skip rows that violate a unique index
+            bind: Engine to load into (default: the main database)
+        """
+        with (bind or engine).begin() as connection:
+            loader = BulkLoader(connection, table, columns, ignore_conflicts)
+            yield loader
+            loader.flush()
+
+        logger.debug(f"Bulk loaded {loader.rows_written} rows into {table.name}")
+
+
+# Global bulk insert service instance
+bulk_insert_service = BulkInsertService()
@@ -0,0 +1,546 @@
+"""
+Cold Storage Service
+Packs idle jobs' extracted trees into one seekable compressed file and expands them on demand
+"""
+
+import io
+import json
+import os
+import posixpath
+import stat
+import struct
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from app.database import db_session
+from app.models import Job
+from app.services.job_writer import job_writer
+from app.utils.locks import KeyedLocks
+from config import settings
+import logging
+
+try:
+    import zstandard
+except ImportError:  # optional - zlib is used instead
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Pack layout: header, compressed frames, compressed JSON index
+MAGIC = b'FPPK'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQQ')  # magic, version, codec, index offset, index length
+
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+# Members are concatenated into one stream that is compressed in frames of
+# this many bytes, so small files share frames and any byte range can be
+# read by decompressing only the frames it overlaps
+FRAME_SIZE = 1024 * 1024
+
+# Decompressed frames kept per open pack (neighbouring members share frames)
+FRAME_CACHE_SIZE = 8
+
+# Seconds after startup before the first tiering sweep
+STARTUP_DELAY = 120
+
+
+def _compressor(codec, level):
+    """Frame compression function of a codec"""
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=level).compress
+    return lambda data: zlib.compress(data, level)
+
+
+def _decompressor(codec):
+    """Frame decompression function of a codec"""
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError('Pack was written with zstd but the zstandard module is not installed')
+        return zstandard.ZstdDecompressor().decompress
+    return zlib.decompress
+
+
+class PackWriter:
+    """Writes a pack file from a directory tree"""
+
+    def __init__(self, path, codec, level):
+        self.path = path
+        self.codec = codec
+        self._compress = _compressor(codec, level)
+        self._file = None
+        self._buffer = bytearray()
+        self._offset = 0  # uncompressed stream position
+        self.frames = []  # [compressed offset, compressed length]
+        self.members = []  # [relative path, stream offset, size, mtime]
+        self.directories = []
+        self.links = []  # [relative path, link target]
+
+    def write_tree(self, root):
+        """
+        Pack every file, directory and symlink below root
+
+        Args:
+            root: Directory to pack
+
+        Returns:
+            int: Bytes packed (uncompressed)
+        """
+        with open(self.path, 'wb') as self._file:
+            self._file.write(HEADER.pack(MAGIC, VERSION, self.codec, 0, 0))
+
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames.sort()
+                relative_dir = os.path.relpath(dirpath, root).replace(os.sep, '/')
+                relative_dir = '' if relative_dir == '.' else relative_dir
+                if relative_dir:
+                    self.directories.append(relative_dir)
+
+                for name in sorted(filenames) + [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]:
+                    full_path = os.path.join(dirpath, name)
+                    relative_path = posixpath.join(relative_dir, name)
+                    info = os.lstat(full_path)
+                    if stat.S_ISLNK(info.st_mode):
+                        self.links.append([relative_path, os.readlink(full_path)])
+                    elif stat.S_ISREG(info.st_mode):
+                        self._add_file(full_path, relative_path, info)
+
+            self._flush_frames(final=True)
+            index_offset = self._file.tell()
+            index = zlib.compress(json.dumps({
+                'frame_size': FRAME_SIZE,
+                'frames': self.frames,
+                'members': self.members,
+                'directories': self.directories,
+                'links': self.links,
+            }, separators=(',', ':')).encode())
+            self._file.write(index)
+
+            self._file.seek(0)
+            self._file.write(HEADER.pack(MAGIC, VERSION, self.codec, index_offset, len(index)))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+        return self._offset
+
+    def _add_file(self, full_path, relative_path, info):
+        self.members.append([relative_path, self._offset, info.st_size, info.st_mtime])
+        with open(full_path, 'rb') as f:
+            while True:
+                chunk = f.read(FRAME_SIZE)
+                if not chunk:
+                    break
+                self._buffer += chunk
+                self._offset += len(chunk)
+                self._flush_frames()
+
+    def _flush_frames(self, final=False):
+        """Compress every full frame in the buffer (and the partial last one when final)"""
+        while len(self._buffer) >= FRAME_SIZE or (final and self._buffer):
+            frame = bytes(self._buffer[:FRAME_SIZE])
+            del self._buffer[:FRAME_SIZE]
+            compressed = self._compress(frame)
+            self.frames.append([self._file.tell(), len(compressed)])
+            self._file.write(compressed)
+
+
+class ColdPack:
+    """
+    Read access to one pack file
+
+    The index is loaded once; members are read with positional reads, so a
+    pack can be shared between request threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = os.open(path, os.O_RDONLY)
+        try:
+            info = os.fstat(self._fd)
+            self.signature = (info.st_ino, info.st_mtime_ns)
+
+            magic, version, codec, index_offset, index_length = HEADER.unpack(os.pread(self._fd, HEADER.size, 0))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f'Not a pack file: {path}')
+            self._decompress = _decompressor(codec)
+
+            index = json.loads(zlib.decompress(os.pread(self._fd, index_length, index_offset)))
+        except Exception:
+            self.close()
+            raise
+
+        self.frame_size = index['frame_size']
+        self._frames = index['frames']
+        self.members = {path: (offset, size, mtime) for path, offset, size, mtime in index['members']}
+        self.directories = set(index['directories'])
+        self.links = dict(index['links'])
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def close(self):
+        if getattr(self, '_fd', None) is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __del__(self):
+        self.close()
+
+    def resolve(self, relative_path):
+        """
+        Member path a relative path refers to, following in-tree symlinks
+
+        Returns:
+            str: Member path, or None if no file exists at that path
+        """
+        for _ in range(8):
+            if relative_path in self.members:
+                return relative_path
+            target = self.links.get(relative_path)
+            if target is None or target.startswith('/'):
+                return None
+            relative_path = posixpath.normpath(posixpath.join(posixpath.dirname(relative_path), target))
+        return None
+
+    def is_directory(self, relative_path):
+        """Whether a relative path is a directory of the packed tree"""
+        return relative_path == '' or relative_path in self.directories
+
+    def size(self, member):
+        return self.members[member][1]
+
+    def read(self, member, start=0, length=None):
+        """
+        Read a byte range of a member
+
+        Args:
+            member: Member path (see resolve())
+            start: Offset within the member
+            length: Bytes to read (default: to the end)
+
+        Returns:
+            bytes: Member data
+        """
+        offset, size, _ = self.members[member]
+        start = min(start, size)
+        end = size if length is None else min(size, start + length)
+
+        data = bytearray()
+        position = offset + start
+        stop = offset + end
+        while position < stop:
+            frame_index, frame_offset = divmod(position, self.frame_size)
+            frame = self._frame(frame_index)
+            piece = frame[frame_offset:frame_offset + (stop - position)]
+            data += piece
+            position += len(piece)
+        return bytes(data)
+
+    def open(self, member):
+        """Binary file object reading a member (e.g. for send_file)"""
+        return io.BufferedReader(_MemberReader(self, member), FRAME_SIZE)
+
+    def iter_chunks(self, member, chunk_size=FRAME_SIZE):
+        """Yield a member's data in chunks (streaming downloads)"""
+        size = self.size(member)
+        for start in range(0, size, chunk_size):
+            yield self.read(member, start, chunk_size)
+
+    def _frame(self, frame_index):
+        with self._lock:
+            frame = self._cache.get(frame_index)
+            if frame is not None:
+                self._cache.move_to_end(frame_index)
+                return frame
+
+        offset, length = self._frames[frame_index]
+        frame = self._decompress(os.pread(self._fd, length, offset))
+
+        with self._lock:
+            self._cache[frame_index] = frame
+            while len(self._cache) > FRAME_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return frame
+
+    def expand(self, destination):
+        """
+        Recreate the packed tree under destination
+
+        Args:
+            destination: Empty directory to write into
+        """
+        for relative_dir in sorted(self.directories):
+            os.makedirs(os.path.join(destination, relative_dir), exist_ok=True)
+
+        # Stream order, so every frame is decompressed once
+        for member, (offset, size, mtime) in sorted(self.members.items(), key=lambda item: item[1][0]):
+            full_path = os.path.join(destination, member)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'wb') as f:
+                for chunk in self.iter_chunks(member):
+                    f.write(chunk)
+            os.utime(full_path, (mtime, mtime))
+
+        for relative_path, target in self.links.items():
+            os.symlink(target, os.path.join(destination, relative_path))
+
+
+class _MemberReader(io.RawIOBase):
+    """Sequential raw reader over one pack member"""
+
+    def __init__(self, pack, member):
+        self.pack = pack
+        self.member = member
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.pack.read(self.member, self.position, len(buffer))
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class ColdStorageService:
+    """
+    Moves idle jobs' extracted files to the cold tier and back
+
+    A sweep packs every completed job not accessed for COLD_TIER_IDLE_DAYS
+    into COLD_TIER_FOLDER/<job_id>.pack and removes its loose files; the
+    index (and so browsing and search) is unaffected. The viewer reads
+    members straight from the pack. Anything that needs real paths (nested
+    and rhcert extraction, test analysis) calls ensure_hot(), which expands
+    the pack back into EXTRACT_FOLDER.
+
+    Loose files always win: while a job is being packed or expanded, the
+    tree on disk is used.
+    """
+
+    def __init__(self, max_open=None):
+        self.max_open = max_open or settings.COLD_TIER_HANDLES
+        self._packs = OrderedDict()  # job_id -> ColdPack
+        self._lock = threading.Lock()
+        self._job_locks = KeyedLocks()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self):
+        """Whether idle jobs are packed"""
+        return bool(settings.COLD_TIER_IDLE_DAYS)
+
+    def pack_path(self, job_id):
+        """Path of a job's pack file"""
+        return os.path.join(settings.COLD_TIER_FOLDER, f'{job_id}.pack')
+
+    def extract_path(self, job_id):
+        """Path of a job's loose extracted tree"""
+        return os.path.join(settings.EXTRACT_FOLDER, job_id)
+
+    def is_cold(self, job_id):
+        """Whether a job's files are only available from its pack"""
+        return not os.path.isdir(self.extract_path(job_id)) and os.path.exists(self.pack_path(job_id))
+
+    def get(self, job_id):
+        """
+        Open pack of a cold job
+
+        Returns:
+            ColdPack: Pack, or None if the job's files are on disk (or missing)
+        """
+        if not self.is_cold(job_id):
+            return None
+
+        try:
+            signature = os.stat(self.pack_path(job_id))
+        except FileNotFoundError:
+            return None
+        signature = (signature.st_ino, signature.st_mtime_ns)
+
+        with self._lock:
+            pack = self._packs.get(job_id)
+            if pack is not None and pack.signature == signature:
+                self._packs.move_to_end(job_id)
+                return pack
+
+        pack = ColdPack(self.pack_path(job_id))
+        with self._lock:
+            previous = self._packs.pop(job_id, None)
+            self._packs[job_id] = pack
+            while len(self._packs) > self.max_open:
+                self._packs.popitem(last=False)
+        # Open readers keep their own reference; the descriptor closes with the last one
+        del previous
+        return pack
+
+    def pack(self, job_id):
+        """
+        Move a job's extracted tree into a pack
+
+        Args:
+            job_id: UUID of the job
+
+        Returns:
+            int: Bytes packed, or 0 if there was nothing to pack (or the job is in use)
+        """
+        from app.services.job_control import job_control_service
+        from app.services.post_index import post_index_pipeline
+
+        with self._job_lock(job_id):
+            source = self.extract_path(job_id)
+            # Left for a later sweep while a worker or the post-index stages read the tree
+            if (not os.path.isdir(source) or job_control_service.is_running(job_id)
+                    or post_index_pipeline.is_pending(job_id)):
+                return 0
+
+            os.makedirs(settings.COLD_TIER_FOLDER, exist_ok=True)
+            codec = CODEC_ZSTD if settings.COLD_TIER_CODEC == 'zstd' and zstandard is not None else CODEC_ZLIB
+            temp_path = f'{self.pack_path(job_id)}.{uuid.uuid4().hex[:8]}.tmp'
+            started = time.perf_counter()
+            try:
+                packed = PackWriter(temp_path, codec, settings.COLD_TIER_LEVEL).write_tree(source)
+                os.replace(temp_path, self.pack_path(job_id))
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+            job_control_service.discard_directory(source)
+            job_writer.update(job_id, packed_at=datetime.utcnow())
+
+        packed_size = os.path.getsize(self.pack_path(job_id))
+        logger.info(f"Packed job {job_id}: {packed} bytes into {packed_size} "
+                    f"in {time.perf_counter() - started:.1f}s")
+        return packed
+
+    def ensure_hot(self, job_id):
+        """
+        Make sure a job's files are on disk, expanding its pack if needed
+
+        Args:
+            job_id: UUID of the job
+
+        Returns:
+            bool: True if the pack was expanded
+        """
+        if not os.path.exists(self.pack_path(job_id)):
+            return False
+
+        with self._job_lock(job_id):
+            destination = self.extract_path(job_id)
+            pack_path = self.pack_path(job_id)
+            if not os.path.exists(pack_path):
+                return False
+
+            expanded = False
+            if not os.path.isdir(destination):
+                started = time.perf_counter()
+                temp_dir = f'{destination}.{uuid.uuid4().hex[:8]}.rehydrating'
+                try:
+                    pack = ColdPack(pack_path)
+                    try:
+                        pack.expand(temp_dir)
+                    finally:
+                        pack.close()
+                    os.rename(temp_dir, destination)
+                except Exception:
+                    from app.services.job_control import job_control_service
+                    job_control_service.discard_directory(temp_dir)
+                    raise
+                expanded = True
+                logger.info(f"Rehydrated job {job_id} in {time.perf_counter() - started:.1f}s")
+
+            # The loose tree is authoritative again (also clears a pack left by an interrupted run)
+            self.delete(job_id)
+            job_writer.update(job_id, packed_at=None)
+
+            from app.services.tree_watcher import tree_watcher_service
+            tree_watcher_service.watch(job_id)
+            return expanded
+
+    def delete(self, job_id):
+        """Remove a job's pack"""
+        with self._lock:
+            self._packs.pop(job_id, None)
+        try:
+            os.remove(self.pack_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def plan(self, now=None):
+        """
+        Completed jobs idle for COLD_TIER_IDLE_DAYS whose files are still loose
+
+        Returns:
+            list: Job ids, least recently accessed first
+        """
+        now = now or datetime.utcnow()
+        cutoff = now - timedelta(days=settings.COLD_TIER_IDLE_DAYS)
+        jobs = db_session.query(
+            Job.id, Job.created_at, Job.updated_at, Job.last_accessed_at
+        ).filter(Job.status == 'completed', Job.packed_at == None).all()
+        db_session.rollback()
+
+        def last_access(job):
+            return job.last_accessed_at or job.updated_at or job.created_at or now
+
+        return [job.id for job in sorted(jobs, key=last_access) if last_access(job) < cutoff]
+
+    def sweep(self):
+        """
+        Pack every idle job
+
+        Returns:
+            list: Ids of the jobs packed
+        """
+        packed = []
+        try:
+            for job_id in self.plan():
+                if self._stop.is_set():
+                    break
+                try:
+                    if self.pack(job_id):
+                        packed.append(job_id)
+                except Exception as e:
+                    logger.error(f"Could not pack job {job_id}: {e}")
+        finally:
+            db_session.remove()
+        return packed
+
+    def start(self):
+        """Run tiering sweeps every COLD_TIER_INTERVAL seconds in a background thread (if enabled)"""
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='cold-tier', daemon=True)
+        self._thread.start()
+        logger.info(f"Cold tier sweeps every {settings.COLD_TIER_INTERVAL}s "
+                    f"(jobs idle for {settings.COLD_TIER_IDLE_DAYS} days)")
+
+    def stop(self):
+        """Stop the background sweeps"""
+        self._stop.set()
+
+    def _run(self):
+        delay = STARTUP_DELAY
+        while not self._stop.wait(delay):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Cold tier sweep failed: {e}", exc_info=True)
+            delay = settings.COLD_TIER_INTERVAL
+
+    def _job_lock(self, job_id):
+        """Lock serializing packing and expansion of one job"""
+        return self._job_locks.lock(job_id)
+
+
+# Global cold storage service instance
+cold_storage_service = ColdStorageService()
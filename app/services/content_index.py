@@ -0,0 +1,239 @@
+"""
+Content Index Service
+SQLite FTS5 full-text index of the text files of a job
+"""
+
+import html
+import re
+
+from sqlalchemy import text
+
+from app.database import engine
+from app.services.file_classifier import SNIFF_SIZE, text_codec, text_encoding
+from app.services.index_store import index_store
+from app.services.post_index import FtsStage, post_index_pipeline
+from app.utils.trigram_plan import fts_phrase
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Snippet match markers (replaced by <mark> after HTML escaping)
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+# Tokens of context around matches in a snippet
+SNIPPET_TOKENS = 16
+
+# Quoted phrases and bare words (a trailing * makes a bare word a prefix query)
+QUERY_TERM = re.compile(r'"([^"]*)"|(\S+)')
+
+
+class ContentIndexService(FtsStage):
+    """
+    Full-text content index stage and search
+
+    Runs in the post-index pipeline: text files up to
+    CONTENT_INDEX_MAX_FILE_SIZE are decoded into file_text (keyed by file
+    id, in the job's index database - the main database or its shard);
+    binaries are skipped. Two FTS5 tables index file_text as external
+    content, kept in step by triggers: file_content (words; ranked search
+    with snippets) and, with GREP_INDEX, file_trigrams (trigrams; candidate
+    files for regex grep). With a server database the stage is disabled and
+    search covers names and paths.
+    """
+
+    name = 'content_index'
+    table = 'file_content'
+    text_table = 'file_text'
+    grep_table = 'file_trigrams'
+
+    def enabled(self, index_engine):
+        """Whether content is indexed for jobs in index_engine"""
+        return settings.CONTENT_INDEX and super().enabled(index_engine)
+
+    def ensure_table(self, connection):
+        """Create (or upgrade) the content tables and triggers in the connection's database"""
+        if connection.engine in self._ready:
+            return
+
+        tables = {name for (name,) in connection.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"))}
+        # FTS tables created over existing text are rebuilt from it
+        rebuild = self.text_table in tables
+        if not rebuild:
+            connection.execute(text(
+                f'CREATE TABLE {self.text_table} (id INTEGER PRIMARY KEY, job_id VARCHAR(36) NOT NULL, content TEXT)'
+            ))
+            connection.execute(text(
+                f'CREATE INDEX idx_{self.text_table}_job_id ON {self.text_table} (job_id)'
+            ))
+            if self.table in tables:
+                # file_content used to hold the text itself: move it into file_text
+                connection.execute(text(
+                    f'INSERT INTO {self.text_table} (id, job_id, content) '
+                    f'SELECT rowid, job_id, content FROM {self.table}'
+                ))
+                connection.execute(text(f'DROP TABLE {self.table}'))
+                tables.discard(self.table)
+                rebuild = True
+
+        fts_tables = {self.table: None}
+        if settings.GREP_INDEX:
+            fts_tables[self.grep_table] = 'trigram'
+        elif self.grep_table in tables:
+            connection.execute(text(f'DROP TABLE {self.grep_table}'))
+
+        for table, tokenize in fts_tables.items():
+            if table in tables:
+                continue
+            options = f", tokenize='{tokenize}'" if tokenize else ''
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE {table} USING fts5(content, job_id, "
+                f"content='{self.text_table}', content_rowid='id'{options})"
+            ))
+            if rebuild:
+                connection.execute(text(f"INSERT INTO {table} ({table}) VALUES ('rebuild')"))
+
+        # Triggers maintain exactly the FTS tables that exist
+        inserts = ''.join(f'INSERT INTO {table} (rowid, content, job_id) '
+                          f'VALUES (new.id, new.content, new.job_id); ' for table in fts_tables)
+        deletes = ''.join(f"INSERT INTO {table} ({table}, rowid, content, job_id) "
+                          f"VALUES ('delete', old.id, old.content, old.job_id); " for table in fts_tables)
+        for trigger, when, body in (('file_text_ai', 'AFTER INSERT', inserts), ('file_text_ad', 'AFTER DELETE', deletes)):
+            connection.execute(text(f'DROP TRIGGER IF EXISTS {trigger}'))
+            connection.execute(text(
+                f'CREATE TRIGGER {trigger} {when} ON {self.text_table} BEGIN {body}END'
+            ))
+        self._ready.add(connection.engine)
+
+    def has_grep_index(self, connection):
+        """Whether the connection's database has the trigram table"""
+        return settings.GREP_INDEX and connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+        ), {'name': self.grep_table}).first() is not None
+
+    def process(self, connection, job_id, files):
+        """
+        Add the text files of a batch to the index
+
+        Args:
+            connection: Connection of the batch's transaction
+            job_id: UUID of the job
+            files: IndexedFile list
+
+        Returns:
+            tuple: (files indexed, bytes indexed)
+        """
+        self.ensure_table(connection)
+
+        rows = []
+        indexed_bytes = 0
+        for item in files:
+            # Text as the classifier detects it (a character cut at the end of the sample is not binary)
+            encoding = text_encoding(item.data[:SNIFF_SIZE]) if item.data else None
+            if encoding is None:
+                continue
+            rows.append({'id': item.id, 'content': item.data.decode(text_codec(encoding), errors='replace'),
+                         'job_id': job_id})
+            indexed_bytes += len(item.data)
+
+        if rows:
+            # A batch re-run after a crash replaces its rows (the delete trigger unindexes them)
+            connection.execute(text(f'DELETE FROM {self.text_table} WHERE id = :id'), rows)
+            connection.execute(text(
+                f'INSERT INTO {self.text_table} (id, job_id, content) VALUES (:id, :job_id, :content)'
+            ), rows)
+        return len(rows), indexed_bytes
+
+    def delete(self, job_id):
+        """Remove a job's rows from the main database (in short transactions)"""
+        if not self.enabled(engine):
+            return
+
+        while True:
+            with engine.begin() as connection:
+                if not self._has_text_table(connection):
+                    return
+                deleted = connection.execute(text(
+                    f'DELETE FROM {self.text_table} WHERE id IN ('
+                    f'SELECT id FROM {self.text_table} WHERE job_id = :job_id LIMIT :limit)'
+                ), {'job_id': job_id, 'limit': settings.DELETE_BATCH_ROWS}).rowcount
+            if deleted < settings.DELETE_BATCH_ROWS:
+                return
+
+    def remove(self, connection, job_id, file_ids, directory_ids):
+        """Remove the text of removed files (the delete trigger unindexes it)"""
+        if file_ids and self._has_text_table(connection):
+            connection.execute(text(f'DELETE FROM {self.text_table} WHERE id = :id'),
+                               [{'id': file_id} for file_id in file_ids])
+
+    def _has_text_table(self, connection):
+        return connection.engine in self._ready or connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+        ), {'name': self.text_table}).first() is not None
+
+    def search(self, job_id, query, limit=None):
+        """
+        Files of a job whose content matches a query
+
+        Words must all occur (in any order); "quoted words" must occur as a
+        phrase; word* matches a prefix.
+
+        Args:
+            job_id: UUID of the job
+            query: Search query string
+            limit: Maximum matches (default CONTENT_SEARCH_LIMIT)
+
+        Returns:
+            list: (file_id, snippet HTML, bm25 score) tuples, best (lowest score) first
+        """
+        index_engine = index_store.engine(job_id)
+        expression = match_expression(query)
+        if expression is None or not self.enabled(index_engine):
+            return []
+
+        with index_engine.connect() as connection:
+            if not self.has_table(connection):
+                return []
+            rows = connection.execute(text(
+                f"SELECT rowid, snippet({self.table}, 0, :start, :end, '…', {SNIPPET_TOKENS}), "
+                f'bm25({self.table}, 1.0, 0.0) AS score '
+                f'FROM {self.table} WHERE {self.table} MATCH :match '
+                f'ORDER BY score LIMIT :limit'
+            ), {
+                'start': MATCH_START, 'end': MATCH_END,
+                'match': f'content : ({expression}) AND {self.job_filter(job_id)}',
+                'limit': limit or settings.CONTENT_SEARCH_LIMIT,
+            }).all()
+
+        return [(file_id, snippet_html(snippet), score) for file_id, snippet, score in rows]
+
+
+def match_expression(query):
+    """
+    FTS5 expression for a user query (every term quoted, so FTS5 syntax
+    characters in the query are searched for literally)
+
+    Returns:
+        str: Expression, or None if the query has no searchable term
+    """
+    terms = []
+    for phrase, word in QUERY_TERM.findall(query):
+        if phrase:
+            terms.append(fts_phrase(phrase))
+        elif word.endswith('*') and word.rstrip('*'):
+            terms.append(fts_phrase(word.rstrip('*')) + '*')
+        elif word.strip('*'):
+            terms.append(fts_phrase(word))
+    return ' AND '.join(terms) if terms else None
+
+
+def snippet_html(snippet):
+    """Escape a snippet for HTML and turn its match markers into <mark> elements"""
+    return html.escape(snippet).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+# Global content index service instance
+content_index_service = ContentIndexService()
+post_index_pipeline.register(content_index_service)
@@ -0,0 +1,137 @@
+"""
+Database Migration Service
+Copies the application database from SQLite into a server database (PostgreSQL)
+"""
+
+from sqlalchemy import Integer, func, inspect, or_, select, text
+
+from app.database import Base
+from app.services.bulk_insert import BulkLoader
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched from the source per round trip
+SOURCE_BATCH_ROWS = 5000
+
+
+class DatabaseMigrationError(Exception):
+    """The source or target database cannot be migrated"""
+    pass
+
+
+class DatabaseMigrationService:
+    """
+    Copies every model table from one database to another
+
+    All tables are loaded in one target transaction, so a failed migration
+    leaves the target empty and can simply be re-run. Tables are copied in
+    foreign key order and rows in primary key order (parent directories
+    before their children); rows are streamed from the source and written
+    through BulkLoader, i.e. COPY on PostgreSQL.
+    """
+
+    def copy(self, source, target, progress=None):
+        """
+        Copy all model tables from source to target
+
+        Args:
+            source: Engine of the database to read (usually SQLite)
+            target: Engine of the empty database to fill (tables already created)
+            progress: Optional callback(table_name, rows_copied, rows_skipped)
+
+        Returns:
+            dict: Table name -> rows copied
+
+        Raises:
+            DatabaseMigrationError: Source not converted yet or target not empty
+        """
+        source_inspector = inspect(source)
+        if source_inspector.has_table('file_metadata') and 'relative_path' in {
+                column['name'] for column in source_inspector.get_columns('file_metadata')}:
+            raise DatabaseMigrationError(
+                'The source database still has the pre-hierarchy file index - '
+                'start the application once against it to convert it'
+            )
+
+        tables = [table for table in Base.metadata.sorted_tables if source_inspector.has_table(table.name)]
+        self._check_empty(target, tables)
+
+        copied = {}
+        strip_nul = target.dialect.name == 'postgresql'
+        with source.connect() as source_conn, target.begin() as target_conn:
+            for table in tables:
+                source_columns = {column['name'] for column in source_inspector.get_columns(table.name)}
+                columns = [column for column in table.columns if column.name in source_columns]
+
+                total = source_conn.execute(select(func.count()).select_from(table)).scalar()
+                rows = source_conn.execution_options(yield_per=SOURCE_BATCH_ROWS).execute(
+                    select(*columns)
+                    .where(*self._orphan_filters(table))
+                    .order_by(*table.primary_key.columns)
+                )
+
+                loader = BulkLoader(target_conn, table, [column.name for column in columns])
+                for row in rows:
+                    loader.append(tuple(_strip_nul(value) for value in row) if strip_nul else tuple(row))
+                    if loader.batch_full:
+                        loader.flush()
+                loader.flush()
+
+                copied[table.name] = loader.rows_written
+                skipped = total - loader.rows_written
+                if skipped:
+                    logger.warning(f"Skipped {skipped} rows of {table.name} referencing deleted rows")
+                if progress:
+                    progress(table.name, loader.rows_written, skipped)
+
+            if target.dialect.name == 'postgresql':
+                self._reset_sequences(target_conn, tables)
+
+        logger.info(f"Migrated {sum(copied.values())} rows in {len(copied)} tables")
+        return copied
+
+    def _check_empty(self, target, tables):
+        """Refuse to load into a target that already holds rows"""
+        with target.connect() as conn:
+            for table in tables:
+                if conn.execute(select(table).limit(1)).first() is not None:
+                    raise DatabaseMigrationError(f'Target table {table.name} is not empty')
+
+    def _orphan_filters(self, table):
+        """
+        Conditions dropping rows whose referenced row no longer exists
+
+        SQLite does not enforce foreign keys, so deleted jobs can leave rows
+        behind that the target would reject.
+        """
+        filters = []
+        for foreign_key in table.foreign_keys:
+            if foreign_key.column.table is table:
+                continue
+            column = foreign_key.parent
+            filters.append(or_(column.is_(None), column.in_(select(foreign_key.column))))
+        return filters
+
+    def _reset_sequences(self, connection, tables):
+        """Move serial sequences past the copied ids"""
+        for table in tables:
+            columns = list(table.primary_key.columns)
+            if len(columns) != 1 or not isinstance(columns[0].type, Integer):
+                continue
+            column = columns[0]
+            connection.execute(text(
+                f'SELECT setval(pg_get_serial_sequence(:table, :column), '
+                f'COALESCE(MAX({column.name}), 0) + 1, false) FROM {table.name}'
+            ), {'table': table.name, 'column': column.name})
+
+
+def _strip_nul(value):
+    """PostgreSQL text cannot hold NUL characters"""
+    if isinstance(value, str) and '\x00' in value:
+        return value.replace('\x00', '')
+    return value
+
+
+# Global database migration service instance
+database_migration_service = DatabaseMigrationService()
@@ -0,0 +1,142 @@
+"""
+Directory Service
+Directory rows of the file index and a cached per-job id <-> path map
+"""
+
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+from app.models import Directory
+from app.services.index_store import index_store
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class DirectoryMap:
+    """Maps a job's directory ids to relative paths and back"""
+
+    def __init__(self, rows):
+        """
+        Args:
+            rows: (id, relative_path) of every directory of the job
+        """
+        self.paths = {}
+        self.ids = {}
+        self.root_id = None
+
+        for directory_id, relative_path in rows:
+            self.paths[directory_id] = relative_path
+            self.ids[relative_path] = directory_id
+            if relative_path == '':
+                self.root_id = directory_id
+
+    def path_of(self, directory_id):
+        """Relative path of a directory"""
+        return self.paths.get(directory_id)
+
+    def id_of(self, relative_path):
+        """Directory id of a relative path ('' is the root), or None"""
+        return self.ids.get(relative_path)
+
+    def file_path(self, parent_id, name):
+        """Relative path of a file from its parent id and name"""
+        parent_path = self.paths.get(parent_id, '')
+        return f'{parent_path}/{name}' if parent_path else name
+
+
+class DirectoryService:
+    """Creates directory rows and caches directory maps for recently used jobs"""
+
+    def __init__(self, max_jobs=None):
+        self.max_jobs = max_jobs or settings.DIRECTORY_CACHE_JOBS
+        self._maps = OrderedDict()
+        self._generation = 0  # invalidate() calls so far (one counter: nothing kept per job)
+        self._lock = threading.Lock()
+
+    def path_map(self, job_id, refresh=False):
+        """
+        Get the directory map of a job (LRU cached)
+
+        Args:
+            job_id: UUID of the job
+            refresh: Bypass the cache and reload from the database
+
+        Returns:
+            DirectoryMap: Map of the job's directories
+        """
+        with self._lock:
+            if not refresh and job_id in self._maps:
+                self._maps.move_to_end(job_id)
+                return self._maps[job_id]
+            generation = self._generation
+
+        rows = index_store.session(job_id).query(Directory.id, Directory.relative_path).filter(
+            Directory.job_id == job_id
+        ).all()
+        dir_map = DirectoryMap(rows)
+
+        with self._lock:
+            # Don't cache a map read while a job was being (re)indexed
+            if self._generation == generation:
+                self._maps[job_id] = dir_map
+                self._maps.move_to_end(job_id)
+                while len(self._maps) > self.max_jobs:
+                    self._maps.popitem(last=False)
+
+        return dir_map
+
+    def invalidate(self, job_id):
+        """Drop the cached map of a job after its directories changed"""
+        with self._lock:
+            self._maps.pop(job_id, None)
+            self._generation += 1
+
+    def ensure_root(self, connection, job_id):
+        """
+        Get or create the root directory of a job
+
+        Args:
+            connection: SQLAlchemy Connection (usually a bulk load transaction)
+            job_id: UUID of the job
+
+        Returns:
+            int: Root directory id
+        """
+        root_id = connection.execute(
+            select(Directory.id).where(Directory.job_id == job_id, Directory.parent_id.is_(None))
+        ).scalar()
+        if root_id is None:
+            root_id = connection.execute(
+                Directory.__table__.insert().values(job_id=job_id, parent_id=None, name='', relative_path='')
+            ).inserted_primary_key[0]
+        return root_id
+
+    def add_directories(self, connection, job_id, parent_id, entries):
+        """
+        Insert sibling directories and return the ids of the parent's children
+
+        Args:
+            connection: SQLAlchemy Connection (usually a bulk load transaction)
+            job_id: UUID of the job
+            parent_id: Id of the directory they are in
+            entries: WalkEntry items of the new directories
+
+        Returns:
+            dict: relative_path -> id for every child directory of parent_id
+        """
+        connection.execute(Directory.__table__.insert(), [
+            {'job_id': job_id, 'parent_id': parent_id, 'name': entry.name, 'relative_path': entry.relative_path}
+            for entry in entries
+        ])
+        rows = connection.execute(
+            select(Directory.relative_path, Directory.id).where(Directory.parent_id == parent_id)
+        )
+        return dict(rows.all())
+
+
+# Global directory service instance
+directory_service = DirectoryService()
@@ -0,0 +1,197 @@
+"""
+Directory Stats Service
+Recursive per-directory aggregates (file count, bytes, newest mtime)
+"""
+
+from sqlalchemy import bindparam, case, delete, func, select, update
+
+from app.database import engine
+from app.models import Directory, DirectoryStats, FileMetadata
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _depth(relative_path):
+    """Depth of a directory ('' is the root at depth 0)"""
+    return relative_path.count('/') + 1 if relative_path else 0
+
+
+class DirectoryTotals:
+    """
+    Accumulates direct totals per directory path during an index pass
+
+    rollup() turns them into recursive totals in one bottom-up pass: every
+    directory is visited once, deepest first, and adds its totals to its
+    parent's.
+    """
+
+    def __init__(self):
+        # relative_path -> [files, directories, bytes, max_mtime]
+        self._totals = {}
+
+    def _get(self, relative_path):
+        totals = self._totals.get(relative_path)
+        if totals is None:
+            totals = self._totals[relative_path] = [0, 0, 0, None]
+        return totals
+
+    def add_directory(self, relative_path):
+        """Record a new directory (counted in its parent's directory_count)"""
+        self._get(relative_path)
+        if relative_path:
+            self._get(relative_path.rpartition('/')[0])[1] += 1
+
+    def remove_directory(self, relative_path):
+        """Record a directory removed from the index (uncounted from its parent's directory_count)"""
+        self._get(relative_path)
+        self._get(relative_path.rpartition('/')[0])[1] -= 1
+
+    def add_files(self, parent_path, count, size, mtime=None):
+        """Record count new files totalling size bytes in the directory parent_path (negative: removed)"""
+        totals = self._get(parent_path)
+        totals[0] += count
+        totals[2] += size or 0
+        if mtime is not None and (totals[3] is None or mtime > totals[3]):
+            totals[3] = mtime
+
+    def rollup(self):
+        """
+        Recursive totals of every touched directory and all of its ancestors
+
+        Returns:
+            dict: relative_path -> (files, directories, bytes, max_mtime)
+        """
+        totals = self._totals
+        for relative_path in list(totals):
+            while relative_path:
+                relative_path = relative_path.rpartition('/')[0]
+                if relative_path in totals:
+                    break
+                totals[relative_path] = [0, 0, 0, None]
+
+        for relative_path in sorted(totals, key=_depth, reverse=True):
+            if not relative_path:
+                continue
+            files, directories, size, mtime = totals[relative_path]
+            parent = totals[relative_path.rpartition('/')[0]]
+            parent[0] += files
+            parent[1] += directories
+            parent[2] += size
+            if mtime is not None and (parent[3] is None or mtime > parent[3]):
+                parent[3] = mtime
+
+        self._totals = {}
+        return {relative_path: tuple(values) for relative_path, values in totals.items()}
+
+
+class DirectoryStatsService:
+    """Stores and reads recursive directory aggregates"""
+
+    def write(self, connection, job_id, dir_ids, totals, new_paths=None):
+        """
+        Store rolled-up totals
+
+        Directories in new_paths (all of them when new_paths is None) get a
+        fresh stats row; the totals of the others are added to their
+        existing row.
+
+        Args:
+            connection: SQLAlchemy Connection (usually the index load transaction)
+            job_id: UUID of the job
+            dir_ids: relative_path -> directory id
+            totals: DirectoryTotals.rollup() result
+            new_paths: Paths of directories created by this index pass
+        """
+        inserts = []
+        updates = []
+        for relative_path, (files, directories, size, mtime) in totals.items():
+            directory_id = dir_ids[relative_path]
+            if new_paths is None or relative_path in new_paths:
+                inserts.append({
+                    'directory_id': directory_id, 'job_id': job_id, 'file_count': files,
+                    'directory_count': directories, 'total_size': size, 'max_mtime': mtime
+                })
+            elif files or directories:
+                updates.append({
+                    'b_directory_id': directory_id, 'b_files': files,
+                    'b_directories': directories, 'b_size': size, 'b_mtime': mtime
+                })
+
+        if inserts:
+            connection.execute(DirectoryStats.__table__.insert(), inserts)
+        if updates:
+            connection.execute(self._increment_statement(), updates)
+
+    def _increment_statement(self):
+        """UPDATE adding one directory's delta to its stats row (executemany)"""
+        stats = DirectoryStats.__table__
+        new_mtime = bindparam('b_mtime')
+        return update(stats).where(stats.c.directory_id == bindparam('b_directory_id')).values(
+            file_count=stats.c.file_count + bindparam('b_files'),
+            directory_count=stats.c.directory_count + bindparam('b_directories'),
+            total_size=stats.c.total_size + bindparam('b_size'),
+            max_mtime=case(
+                (stats.c.max_mtime.is_(None) | (stats.c.max_mtime < new_mtime), new_mtime),
+                else_=stats.c.max_mtime
+            )
+        )
+
+    def rebuild(self, connection, job_id):
+        """
+        Recompute a job's stats from its indexed rows
+
+        Used for jobs indexed before stats existed; file mtimes were not
+        recorded then, so max_mtime stays empty.
+
+        Args:
+            connection: SQLAlchemy Connection
+            job_id: UUID of the job
+
+        Returns:
+            int: Number of directories with stats
+        """
+        directories = connection.execute(
+            select(Directory.id, Directory.relative_path).where(Directory.job_id == job_id)
+        ).all()
+        file_totals = {parent_id: (count, size) for parent_id, count, size in connection.execute(
+            select(FileMetadata.parent_id, func.count(), func.coalesce(func.sum(FileMetadata.size), 0))
+            .where(FileMetadata.job_id == job_id)
+            .group_by(FileMetadata.parent_id)
+        )}
+
+        totals = DirectoryTotals()
+        dir_ids = {}
+        for directory_id, relative_path in directories:
+            dir_ids[relative_path] = directory_id
+            totals.add_directory(relative_path)
+            if directory_id in file_totals:
+                totals.add_files(relative_path, *file_totals[directory_id])
+
+        connection.execute(delete(DirectoryStats).where(DirectoryStats.job_id == job_id))
+        rolled_up = {path: values for path, values in totals.rollup().items() if path in dir_ids}
+        self.write(connection, job_id, dir_ids, rolled_up)
+        return len(rolled_up)
+
+    def backfill(self):
+        """
+        Compute stats for every indexed job that has none (e.g. after an upgrade)
+
+        Only the main database is checked; shards are always created with stats.
+        """
+        stats = DirectoryStats.__table__
+        with engine.begin() as connection:
+            job_ids = [row[0] for row in connection.execute(
+                select(Directory.job_id)
+                .outerjoin(stats, stats.c.directory_id == Directory.id)
+                .where(Directory.parent_id.is_(None), stats.c.directory_id.is_(None))
+            )]
+            for job_id in job_ids:
+                self.rebuild(connection, job_id)
+
+        if job_ids:
+            logger.info(f"Computed directory stats for {len(job_ids)} previously indexed jobs")
+
+
+# Global directory stats service instance
+directory_stats_service = DirectoryStatsService()
@@ -9,23 +9,37 @@ import tarfile
 import gzip
 import bz2
 import lzma
-import shutil
 import threading
-from datetime import datetime
 
 from app.database import db_session
 from app.models import Job
+from app.services.job_control import job_control_service, JobCancelledError
+from app.services.job_writer import job_writer
+from app.services.progress_bus import progress_bus
+from app.services.resource_governor import ResourceGovernor, ResourceLimitExceeded
+from app.services.stage_timing import stage_timing_service
+from app.services.throughput import ThroughputMeter, format_eta
+from app.utils.security import get_file_size_human
 from config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Chunk size for streamed decompression (checked for cancellation between chunks)
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Seconds between cancellation checks while waiting for a worker slot
+SLOT_WAIT_INTERVAL = 1.0
+
 
 class ExtractionService:
     """Handles archive extraction with progress tracking"""
 
     def __init__(self):
+        # job_id -> ThroughputMeter of the running extraction
         self.extraction_progress = {}
+        # Bounds concurrent extractions so one heavy job cannot starve the rest
+        self._worker_slots = threading.BoundedSemaphore(settings.MAX_CONCURRENT_EXTRACTIONS)
 
     def extract_archive_async(self, job_id, file_path, extract_to):
         """
@@ -36,6 +50,9 @@ class ExtractionService:
             file_path: Path to uploaded archive
             extract_to: Destination directory for extraction
         """
+        # Register before the thread starts so a cancel right after upload is honoured
+        job_control_service.register(job_id)
+
         thread = threading.Thread(
             target=self._extract_archive,
             args=(job_id, file_path, extract_to)
@@ -52,65 +69,179 @@ class ExtractionService:
             file_path: Path to uploaded archive
             extract_to: Destination directory for extraction
         """
+        slot_acquired = False
         try:
+            slot_acquired = self._acquire_worker_slot(job_id)
+
             # Update job status
             self._update_job(job_id, status='extracting', progress=0, message='Initializing extraction...')
 
-            filename = os.path.basename(file_path)
-            file_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
-
-            # Handle ZIP archives
-            if file_ext == 'zip':
-                self._extract_zip(job_id, file_path, extract_to)
-
-            # Handle compressed files (gz, bz2, xz) - could be tar or plain compressed
-            elif file_ext in ['tar', 'gz', 'bz2', 'xz', 'tgz'] or 'tar' in filename:
-                # First try as plain compressed file (faster check)
-                if file_ext in ['gz', 'bz2', 'xz'] and not filename.endswith('.tar.gz') and not filename.endswith('.tar.bz2') and not filename.endswith('.tar.xz'):
-                    try:
-                        if self._extract_compressed_file(job_id, file_path, extract_to, filename, file_ext):
-                            # Successfully extracted as plain compressed file
-                            pass
-                        else:
-                            # Not a plain compressed file, try as tar archive
+            with stage_timing_service.stage(job_id, 'extract') as sample:
+                filename = os.path.basename(file_path)
+                file_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+                # Handle ZIP archives
+                if file_ext == 'zip':
+                    self._extract_zip(job_id, file_path, extract_to)
+
+                # Handle compressed files (gz, bz2, xz) - could be tar or plain compressed
+                elif file_ext in ['tar', 'gz', 'bz2', 'xz', 'tgz'] or 'tar' in filename:
+                    # First try as plain compressed file (faster check)
+                    if file_ext in ['gz', 'bz2', 'xz'] and not filename.endswith('.tar.gz') and not filename.endswith('.tar.bz2') and not filename.endswith('.tar.xz'):
+                        try:
+                            if self._extract_compressed_file(job_id, file_path, extract_to, filename, file_ext):
+                                # Successfully extracted as plain compressed file
+                                pass
+                            else:
+                                # Not a plain compressed file, try as tar archive
+                                self._extract_tar(job_id, file_path, extract_to, filename, file_ext)
+                        except (JobCancelledError, ResourceLimitExceeded):
+                            raise
+                        except Exception:
+                            # If plain extraction fails, try tar
                             self._extract_tar(job_id, file_path, extract_to, filename, file_ext)
-                    except Exception:
-                        # If plain extraction fails, try tar
+                    else:
+                        # Definitely a tar archive
                         self._extract_tar(job_id, file_path, extract_to, filename, file_ext)
+
                 else:
-                    # Definitely a tar archive
-                    self._extract_tar(job_id, file_path, extract_to, filename, file_ext)
+                    self._update_job(job_id, status='error', progress=0,
+                                   message=f'Unsupported file format: {file_ext}')
+                    return
 
-            else:
-                self._update_job(job_id, status='error', progress=0,
-                               message=f'Unsupported file format: {file_ext}')
-                return
+                figures = self._final_figures(job_id)
+                sample.bytes_processed = figures.get('uncompressed_bytes')
+                sample.items = figures.get('members_extracted')
 
-            # Mark extraction as complete and start indexing
+            # Mark extraction as complete and start indexing (persists final throughput)
             self._update_job(job_id, status='indexing', progress=95,
-                           message='Indexing files for search...')
+                           message='Indexing files for search...',
+                           **figures)
 
             # Index extracted files
             from app.services.indexing import indexing_service
             indexing_service.index_extraction(job_id)
 
+        except JobCancelledError:
+            logger.info(f"Extraction cancelled for job {job_id}, cleaning up partial output")
+            try:
+                job_control_service.cleanup_job_data(job_id)
+            except Exception as e:
+                logger.error(f"Cleanup after cancellation failed for job {job_id}: {e}")
+            self._update_job(job_id, status='cancelled', progress=0, message='Cancelled by user')
+
+        except ResourceLimitExceeded as e:
+            logger.warning(f"Extraction aborted for job {job_id}: {e}")
+            try:
+                job_control_service.cleanup_job_data(job_id)
+            except Exception as cleanup_error:
+                logger.error(f"Cleanup after aborted extraction failed for job {job_id}: {cleanup_error}")
+            self._update_job(job_id, status='error', progress=0, message=f'Aborted: {e}')
+
         except Exception as e:
             logger.error(f"Extraction error for job {job_id}: {str(e)}", exc_info=True)
             self._update_job(job_id, status='error', progress=0, message=f'Error: {str(e)}')
 
+        finally:
+            if slot_acquired:
+                self._worker_slots.release()
+            self.extraction_progress.pop(job_id, None)
+            job_control_service.release(job_id)
+            # Progress reads fall back to the Job row once the bus forgets the job
+            job_writer.flush()
+            progress_bus.discard(job_id)
+
+    def _acquire_worker_slot(self, job_id):
+        """
+        Wait for a free extraction slot, staying cancellable while queued
+
+        Returns:
+            bool: True once the slot is held
+        """
+        if self._worker_slots.acquire(blocking=False):
+            return True
+
+        self._update_job(job_id, status='queued', progress=0, message='Waiting for a free extraction slot...')
+        while not self._worker_slots.acquire(timeout=SLOT_WAIT_INTERVAL):
+            job_control_service.raise_if_cancelled(job_id)
+        return True
+
+    def _start_meter(self, job_id, total_bytes):
+        """Start tracking extraction throughput for a job"""
+        meter = ThroughputMeter(total=total_bytes)
+        self.extraction_progress[job_id] = meter
+        return meter
+
+    def _report_extraction(self, job_id, meter, bytes_read, bytes_written, members, force=False):
+        """
+        Record extraction counters and publish progress when a report is due
+
+        Progress between 10 and 90 follows the compressed bytes read.
+
+        Args:
+            job_id: UUID of the job
+            meter: ThroughputMeter of the extraction
+            bytes_read: Compressed archive bytes consumed so far
+            bytes_written: Uncompressed bytes written so far
+            members: Archive members processed so far
+            force: Publish even if the report interval has not elapsed
+        """
+        if not meter.update(bytes_read, bytes_written=bytes_written, members=members) and not force:
+            return
+
+        snapshot = meter.snapshot()
+        eta = format_eta(meter.eta_seconds())
+        message = (f'Extracted {members} files, {get_file_size_human(bytes_written)} '
+                   f'({get_file_size_human(snapshot["bytes_written_per_sec"])}/s'
+                   f'{", ETA " + eta if eta else ""})')
+
+        self._update_job(job_id, progress=10 + int((meter.fraction() or 0) * 80),
+                         message=message, throughput={'stage': 'extract', **snapshot})
+
+    def _final_figures(self, job_id):
+        """
+        Final extraction throughput figures to persist on the Job
+
+        Returns:
+            dict: Job column values (empty if no extraction was metered)
+        """
+        meter = self.extraction_progress.pop(job_id, None)
+        if meter is None:
+            return {}
+
+        return {
+            'compressed_bytes': meter.done,
+            'uncompressed_bytes': meter.counters.get('bytes_written', 0),
+            'members_extracted': meter.counters.get('members', 0),
+            'extract_seconds': round(meter.elapsed, 3),
+        }
+
     def _extract_zip(self, job_id, file_path, extract_to):
-        """Extract ZIP archive (FAST - bulk extraction)"""
+        """Extract ZIP archive member by member (cancellable, byte-accurate progress)"""
         self._update_job(job_id, status='extracting', progress=10, message='Extracting ZIP archive...')
 
         try:
             with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                total_files = len(zip_ref.namelist())
-
-                # Bulk extract - fastest method, no file-by-file iteration
-                self._update_job(job_id, progress=50, message=f'Extracting {total_files} files...')
-                zip_ref.extractall(extract_to)
-                self._update_job(job_id, progress=90, message=f'Extracted {total_files} files')
-
+                members = zip_ref.infolist()
+                total_files = len(members)
+                meter = self._start_meter(job_id, sum(member.compress_size for member in members))
+                governor = ResourceGovernor(extract_to, meter.total)
+
+                self._update_job(job_id, message=f'Extracting {total_files} files...')
+                bytes_read = 0
+                bytes_written = 0
+                for count, member in enumerate(members, 1):
+                    job_control_service.raise_if_cancelled(job_id)
+                    governor.check_member(member.file_size)
+                    zip_ref.extract(member, extract_to)
+                    bytes_read += member.compress_size
+                    bytes_written += member.file_size
+                    self._report_extraction(job_id, meter, bytes_read, bytes_written, count)
+
+                self._report_extraction(job_id, meter, bytes_read, bytes_written, total_files, force=True)
+
+        except (JobCancelledError, ResourceLimitExceeded):
+            raise
         except Exception as e:
             logger.error(f"ZIP extraction error: {e}")
             raise
@@ -136,24 +267,38 @@ class ExtractionService:
         os.makedirs(extract_to, exist_ok=True)
 
         try:
-            # Select appropriate decompression module
+            # Select appropriate decompression module (wraps the raw file so bytes read can be tracked)
             if file_ext == 'gz':
-                open_func = gzip.open
+                open_func = lambda raw: gzip.GzipFile(fileobj=raw, mode='rb')
             elif file_ext == 'bz2':
-                open_func = bz2.open
+                open_func = bz2.BZ2File
             elif file_ext == 'xz':
-                open_func = lzma.open
+                open_func = lzma.LZMAFile
             else:
                 return False
 
-            self._update_job(job_id, progress=30, message='Decompressing file...')
+            self._update_job(job_id, message='Decompressing file...')
 
-            # Decompress file
-            with open_func(file_path, 'rb') as f_in:
+            # Decompress file in chunks so cancellation is honoured mid-stream
+            with open(file_path, 'rb') as raw, open_func(raw) as f_in:
+                meter = self._start_meter(job_id, os.fstat(raw.fileno()).st_size)
+                governor = ResourceGovernor(extract_to, meter.total)
+                governor.check_member(0)
+                bytes_written = 0
                 with open(output_path, 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out)
+                    while True:
+                        chunk = f_in.read(COPY_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        job_control_service.raise_if_cancelled(job_id)
+                        governor.check_chunk(len(chunk))
+                        f_out.write(chunk)
+                        bytes_written += len(chunk)
+                        self._report_extraction(job_id, meter, raw.tell(), bytes_written, 1)
+
+                self._report_extraction(job_id, meter, raw.tell(), bytes_written, 1, force=True)
+                file_size = bytes_written
 
-            file_size = os.path.getsize(output_path)
             self._update_job(job_id, progress=90,
                            message=f'Decompressed to {output_filename} ({file_size} bytes)')
 
@@ -203,19 +348,51 @@ class ExtractionService:
 
         return member
 
+    def _extract_tar_members(self, job_id, tar_ref, raw, extract_to):
+        """
+        Stream members out of an open TAR archive
+
+        Members are read in a single pass (no getmembers() pre-scan, which would
+        decompress the whole archive twice) and cancellation is checked between
+        members. Directory attributes are not applied so read-only directories
+        never block extraction of their contents. Progress follows the position
+        in the raw (compressed) archive file.
+
+        Args:
+            job_id: UUID of the job
+            tar_ref: Open TarFile
+            raw: Raw archive file object the TarFile reads from
+            extract_to: Destination directory
+
+        Returns:
+            int: Number of members processed
+        """
+        meter = self._start_meter(job_id, os.fstat(raw.fileno()).st_size)
+        governor = ResourceGovernor(extract_to, meter.total)
+        count = 0
+        bytes_written = 0
+        for member in tar_ref:
+            job_control_service.raise_if_cancelled(job_id)
+            governor.check_member(member.size if member.isreg() else 0)
+            tar_ref.extract(member, extract_to, set_attrs=not member.isdir(), filter=self._safe_tar_filter)
+            count += 1
+            if member.isreg():
+                bytes_written += member.size
+            self._report_extraction(job_id, meter, raw.tell(), bytes_written, count)
+
+        self._report_extraction(job_id, meter, raw.tell(), bytes_written, count, force=True)
+        return count
+
     def _extract_tar(self, job_id, file_path, extract_to, filename, file_ext):
-        """Extract TAR archive (FAST - bulk extraction with safe symlink handling)"""
+        """Extract TAR archive (streamed, cancellable, with safe symlink handling)"""
         self._update_job(job_id, status='extracting', progress=10, message='Extracting TAR archive...')
 
         try:
             # Try auto-detect mode first (works for most archives)
             try:
-                with tarfile.open(file_path, 'r:*') as tar_ref:
-                    total_files = len(tar_ref.getmembers())
-
-                    # Bulk extract with custom filter for safe symlink handling
-                    self._update_job(job_id, progress=50, message=f'Extracting {total_files} files...')
-                    tar_ref.extractall(extract_to, filter=self._safe_tar_filter)
+                with open(file_path, 'rb') as raw, tarfile.open(fileobj=raw, mode='r:*') as tar_ref:
+                    # Stream extract with custom filter for safe symlink handling
+                    total_files = self._extract_tar_members(job_id, tar_ref, raw, extract_to)
                     self._update_job(job_id, progress=90, message=f'Extracted {total_files} files')
                     return
             except tarfile.ReadError:
@@ -237,10 +414,8 @@ class ExtractionService:
             last_error = None
             for mode in modes_to_try:
                 try:
-                    with tarfile.open(file_path, mode) as tar_ref:
-                        total_files = len(tar_ref.getmembers())
-                        self._update_job(job_id, progress=50, message=f'Extracting {total_files} files...')
-                        tar_ref.extractall(extract_to, filter=self._safe_tar_filter)
+                    with open(file_path, 'rb') as raw, tarfile.open(fileobj=raw, mode=mode) as tar_ref:
+                        total_files = self._extract_tar_members(job_id, tar_ref, raw, extract_to)
                         self._update_job(job_id, progress=90, message=f'Extracted {total_files} files')
                         return
                 except (tarfile.ReadError, EOFError) as e:
@@ -253,28 +428,36 @@ class ExtractionService:
                 f"Please verify the file and try uploading again. Last error: {str(last_error)}"
             )
 
+        except (JobCancelledError, ResourceLimitExceeded):
+            raise
         except Exception as e:
             logger.error(f"TAR extraction error for {filename}: {e}")
             raise
 
     def _update_job(self, job_id, **kwargs):
         """
-        Update job in database
+        Publish job progress and hand it to the job writer
+
+        Every update goes to the in-process progress bus at once. The Job row
+        is written by the job writer thread, which coalesces progress-only
+        updates and writes status transitions right away.
+
+        Nested extractions of a finished job run without a registered worker
+        and must not touch the job's state, so their updates are ignored.
 
         Args:
             job_id: UUID of the job
             **kwargs: Fields to update (status, progress, message)
         """
-        try:
-            job = db_session.query(Job).filter_by(id=job_id).first()
-            if job:
-                for key, value in kwargs.items():
-                    setattr(job, key, value)
-                job.updated_at = datetime.utcnow()
-                db_session.commit()
-        except Exception as e:
-            logger.error(f"Error updating job {job_id}: {e}")
-            db_session.rollback()
+        if not job_control_service.is_running(job_id):
+            return
+
+        previous = progress_bus.get(job_id)
+        progress_bus.publish(job_id, **kwargs)
+
+        status = kwargs.get('status')
+        transition = status is not None and (previous is None or previous.get('status') != status)
+        job_writer.update(job_id, urgent=transition, **kwargs)
 
     def get_progress(self, job_id):
         """
@@ -286,16 +469,32 @@ class ExtractionService:
         Returns:
             dict: Progress information or None if not found
         """
+        snapshot = progress_bus.get(job_id)
+        if snapshot is not None:
+            return {
+                'status': snapshot.get('status'),
+                'progress': snapshot.get('progress', 0),
+                'message': snapshot.get('message'),
+                'has_rhoso_tests': snapshot.get('has_rhoso_tests', False),
+                'throughput': snapshot.get('throughput'),
+            }
+
         job = db_session.query(Job).filter_by(id=job_id).first()
         if not job:
             return None
 
-        return {
+        progress = {
             'status': job.status,
             'progress': job.progress,
             'message': job.message,
+            'has_rhoso_tests': job.has_rhoso_tests,
+            'throughput': job.throughput_summary(),
         }
 
+        # End the read transaction so repeated calls see fresh rows
+        db_session.rollback()
+        return progress
+
 
 # Global extraction service instance
 extraction_service = ExtractionService()
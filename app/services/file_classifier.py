@@ -0,0 +1,324 @@
+"""
+File Classifier Service
+Text/binary, encoding, MIME type, line count and compression of every indexed file
+"""
+
+import codecs
+import mimetypes
+
+from sqlalchemy import text
+
+from app.models import FileMetadata
+from app.services.directories import directory_service
+from app.services.index_store import index_store
+from app.services.post_index import ChunkConsumer, PostIndexStage, post_index_pipeline
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Leading bytes examined
+SNIFF_SIZE = 8192
+
+# Byte order marks, longest first (UTF-32 LE starts with the UTF-16 LE mark)
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+)
+
+# Leading bytes of compressed data
+COMPRESSION_MAGIC = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bzip2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+    (b'\x04\x22\x4d\x18', 'lz4'),
+    (b'PK\x03\x04', 'zip'),
+    (b'7z\xbc\xaf\x27\x1c', '7z'),
+)
+
+# MIME types of well-known binary formats, when the name does not tell
+MAGIC_MIME_TYPES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF8', 'image/gif'),
+    (b'%PDF-', 'application/pdf'),
+    (b'\x7fELF', 'application/x-executable'),
+    (b'SQLite format 3\x00', 'application/vnd.sqlite3'),
+)
+
+COMPRESSION_MIME_TYPES = {
+    'gzip': 'application/gzip',
+    'bzip2': 'application/x-bzip2',
+    'xz': 'application/x-xz',
+    'zstd': 'application/zstd',
+    'lz4': 'application/x-lz4',
+    'zip': 'application/zip',
+    '7z': 'application/x-7z-compressed',
+}
+
+# Control bytes that occur in text files (tab, newlines, form feed, backspace, escape)
+TEXT_CONTROL_BYTES = frozenset(b'\t\n\r\f\b\x1b')
+
+# Share of printable bytes above which undecodable data is taken as single-byte text
+TEXT_THRESHOLD = 0.95
+
+# Codecs reading a whole file of a detected encoding (utf-16/utf-32 consume the byte order mark)
+DECODE_CODECS = {
+    'ascii': 'utf-8',
+    'utf-16-le': 'utf-16', 'utf-16-be': 'utf-16',
+    'utf-32-le': 'utf-32', 'utf-32-be': 'utf-32',
+}
+
+# Columns the stage writes (None until a file is classified)
+CLASSIFICATION_COLUMNS = ('is_binary', 'encoding', 'mime_type', 'line_count', 'compression')
+
+
+def classify(name, head):
+    """
+    Classify a file from its name and leading bytes
+
+    Args:
+        name: File name
+        head: Up to SNIFF_SIZE leading bytes
+
+    Returns:
+        dict: is_binary, encoding (None for binaries), mime_type and compression (or None)
+    """
+    compression = _compression(head)
+    encoding = None if compression else _text_encoding(head)
+
+    mime_type, _ = mimetypes.guess_type(name, strict=False)
+    if mime_type is None:
+        if compression:
+            mime_type = COMPRESSION_MIME_TYPES[compression]
+        elif encoding is None:
+            mime_type = next((mime for magic, mime in MAGIC_MIME_TYPES if head.startswith(magic)),
+                             'application/octet-stream')
+        else:
+            mime_type = 'text/plain'
+
+    return {
+        'is_binary': encoding is None,
+        'encoding': encoding,
+        'mime_type': mime_type,
+        'compression': compression,
+    }
+
+
+def text_encoding(head):
+    """
+    Encoding of a file's text, detected from its leading bytes the way classify() does
+
+    Args:
+        head: Up to SNIFF_SIZE leading bytes
+
+    Returns:
+        str: 'ascii', 'utf-8', a BOM encoding or 'latin-1'; None for binary and compressed data
+    """
+    if _compression(head):
+        return None
+    return _text_encoding(head)
+
+
+def _compression(head):
+    """Compression format of data from its magic bytes, or None"""
+    return next((kind for magic, kind in COMPRESSION_MAGIC if head.startswith(magic)), None)
+
+
+def _text_encoding(head):
+    """Encoding of text data ('ascii', 'utf-8', a BOM encoding or 'latin-1'), or None if binary"""
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    if b'\0' in head:
+        return None
+    if head.isascii():
+        return 'ascii'
+    try:
+        # A multi-byte character may be cut at the end of the sample
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    printable = sum(1 for byte in head if byte >= 0x20 and byte != 0x7f or byte in TEXT_CONTROL_BYTES)
+    return 'latin-1' if printable >= TEXT_THRESHOLD * len(head) else None
+
+
+class _LineCounter:
+    """Lines in a text file's content, fed in chunks (a last line without a newline counts)"""
+
+    def __init__(self, newline):
+        self.newline = newline
+        self.lines = 0
+        self.last = b''
+
+    def update(self, chunk):
+        if chunk:
+            self.lines += chunk.count(self.newline)
+            self.last = chunk
+
+    def total(self):
+        return self.lines + (1 if self.last and not self.last.endswith(self.newline) else 0)
+
+
+def _classify_content(name, head):
+    """classify() plus, for text, a line counter (None for binaries)"""
+    result = classify(name, head)
+    result['line_count'] = None
+    counter = None if result['is_binary'] else _LineCounter('\n'.encode(_codec(result['encoding'])))
+    return result, counter
+
+
+class _StreamedClassification(ChunkConsumer):
+    """
+    Classification of a file larger than the pipeline reads, fed by the
+    reader: chunks are held until SNIFF_SIZE bytes are in, then counted
+    (text) or no longer needed (binary)
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.held = []
+        self.held_size = 0
+        self.classification = None
+        self.counter = None
+
+    def update(self, chunk):
+        if self.classification is None:
+            self.held.append(chunk)
+            self.held_size += len(chunk)
+            if self.held_size < SNIFF_SIZE:
+                return False
+            self._classify()
+        elif self.counter is not None:
+            self.counter.update(chunk)
+        return self.counter is None
+
+    def result(self):
+        if self.classification is None:
+            self._classify()
+        if self.counter is not None:
+            self.classification['line_count'] = self.counter.total()
+        return self.classification
+
+    def _classify(self):
+        self.classification, self.counter = _classify_content(self.name, b''.join(self.held)[:SNIFF_SIZE])
+        if self.counter is not None:
+            for chunk in self.held:
+                self.counter.update(chunk)
+        self.held = None
+
+
+class FileClassifierService(PostIndexStage):
+    """
+    File classification stage
+
+    The pipeline's reader threads classify each file from its leading
+    bytes and count the lines of text files; the batch's transaction
+    stores the result in FileMetadata (is_binary, encoding, mime_type,
+    line_count, compression), so the viewer does not sniff files and
+    search filters on type in SQL.
+    """
+
+    name = 'file_type'
+
+    def enabled(self, index_engine):
+        """Whether files are classified"""
+        return settings.FILE_CLASSIFICATION
+
+    def prepare(self, job_id, item, open_file):
+        """
+        Classify one file (in a reader thread)
+
+        Returns:
+            dict: Values of CLASSIFICATION_COLUMNS (a ChunkConsumer computing them for larger files)
+        """
+        name = item.path.rsplit('/', 1)[-1]
+        if item.data is None or len(item.data) != item.size:
+            return _StreamedClassification(name)
+
+        result, counter = _classify_content(name, item.data[:SNIFF_SIZE])
+        if counter is not None:
+            counter.update(item.data)
+            result['line_count'] = counter.total()
+        return result
+
+    def process(self, connection, job_id, files):
+        """
+        Store the classification of a batch
+
+        Returns:
+            tuple: (files classified, 0)
+        """
+        rows = [dict(item.prepared[self.name], id=item.id) for item in files
+                if item.prepared and item.prepared.get(self.name)]
+        if rows:
+            assignments = ', '.join(f'{column} = :{column}' for column in CLASSIFICATION_COLUMNS)
+            connection.execute(text(f'UPDATE file_metadata SET {assignments} WHERE id = :id'), rows)
+        return len(rows), 0
+
+    def lookup(self, job_id, relative_path):
+        """
+        Stored classification of a file
+
+        Args:
+            job_id: UUID of the job
+            relative_path: Relative path of the file
+
+        Returns:
+            dict: Values of CLASSIFICATION_COLUMNS, or None if the file is not classified (yet)
+        """
+        parent_path, _, name = relative_path.strip('/').rpartition('/')
+        parent_id = directory_service.path_map(job_id).ids.get(parent_path)
+        if parent_id is None:
+            return None
+        row = index_store.session(job_id).query(
+            *(getattr(FileMetadata, column) for column in CLASSIFICATION_COLUMNS)
+        ).filter(FileMetadata.parent_id == parent_id, FileMetadata.name == name).first()
+        if row is None or row.is_binary is None:
+            return None
+        return dict(zip(CLASSIFICATION_COLUMNS, row))
+
+
+def type_criteria(binary=None, mime=None, encoding=None, compression=None):
+    """
+    SQL criteria on FileMetadata selecting classified files of a type
+
+    Args:
+        binary: True for binary files, False for text files
+        mime: MIME type or prefix (e.g. 'text/' or 'image')
+        encoding: Detected text encoding (e.g. 'utf-8')
+        compression: Compression format (e.g. 'gzip')
+
+    Returns:
+        list: Filter criteria (empty if no filter is given)
+    """
+    criteria = []
+    if binary is not None:
+        criteria.append(FileMetadata.is_binary == binary)
+    if mime:
+        criteria.append(FileMetadata.mime_type.startswith(mime.lower(), autoescape=True))
+    if encoding:
+        criteria.append(FileMetadata.encoding == encoding.lower())
+    if compression:
+        criteria.append(FileMetadata.compression == compression.lower())
+    return criteria
+
+
+def _codec(encoding):
+    """Codec encoding a newline the way a file of this encoding does"""
+    return 'utf-8' if encoding in ('ascii', 'utf-8-sig') else encoding
+
+
+def text_codec(encoding):
+    """Codec decoding a whole text file of a detected encoding (a byte order mark is dropped)"""
+    return DECODE_CODECS.get(encoding, encoding or 'utf-8')
+
+
+# Global file classifier instance
+file_classifier_service = FileClassifierService()
+post_index_pipeline.register(file_classifier_service)
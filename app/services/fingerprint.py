@@ -0,0 +1,100 @@
+"""
+Fingerprint Service
+Content hash of every indexed file, computed in the post-index pipeline
+"""
+
+import hashlib
+
+from sqlalchemy import text
+
+from app.services.post_index import ChunkConsumer, PostIndexStage, post_index_pipeline
+from config import settings
+import logging
+
+try:
+    import xxhash
+except ImportError:  # optional - BLAKE2b is used instead
+    xxhash = None
+
+logger = logging.getLogger(__name__)
+
+# Hashes are '<algorithm>:<32 hex digits>' (128 bits), so hashes of different algorithms never compare equal
+DIGEST_HEX_LENGTH = 32
+
+
+def new_hasher():
+    """
+    Hash object for a file's content: XXH3-128 if the xxhash package is
+    installed, BLAKE2b-128 otherwise
+
+    Returns:
+        tuple: (algorithm name, hash object)
+    """
+    if xxhash is not None:
+        return 'xxh3', xxhash.xxh3_128()
+    return 'blake2b', hashlib.blake2b(digest_size=DIGEST_HEX_LENGTH // 2)
+
+
+class _StreamedHash(ChunkConsumer):
+    """Hash of a file larger than the pipeline reads, fed by the reader"""
+
+    def __init__(self):
+        self.algorithm, self.hasher = new_hasher()
+
+    def update(self, chunk):
+        self.hasher.update(chunk)
+        return False
+
+    def result(self):
+        return f'{self.algorithm}:{self.hasher.hexdigest()}'
+
+
+class FingerprintService(PostIndexStage):
+    """
+    Content hash stage
+
+    The pipeline's reader threads hash each file as it is read (files
+    larger than the pipeline reads are streamed through the hash, in the
+    pass that also counts their lines), and
+    the batch's transaction stores the hashes in FileMetadata.content_hash
+    of the job's index database. Job diffs compare them.
+    """
+
+    name = 'content_hash'
+
+    def enabled(self, index_engine):
+        """Whether content hashes are computed"""
+        return settings.CONTENT_HASH
+
+    def prepare(self, job_id, item, open_file):
+        """
+        Hash one file (in a reader thread)
+
+        Returns:
+            str: '<algorithm>:<hex digest>' (a ChunkConsumer computing it for larger files)
+        """
+        if item.data is None or len(item.data) != item.size:
+            return _StreamedHash()
+        algorithm, hasher = new_hasher()
+        hasher.update(item.data)
+        return f'{algorithm}:{hasher.hexdigest()}'
+
+    def process(self, connection, job_id, files):
+        """
+        Store the hashes of a batch
+
+        Returns:
+            tuple: (files hashed, bytes hashed)
+        """
+        rows = [{'id': item.id, 'content_hash': item.prepared[self.name]} for item in files
+                if item.prepared and item.prepared.get(self.name)]
+        if rows:
+            connection.execute(text(
+                'UPDATE file_metadata SET content_hash = :content_hash WHERE id = :id'
+            ), rows)
+        return len(rows), sum(item.size for item in files if item.prepared and item.prepared.get(self.name))
+
+
+# Global fingerprint service instance
+fingerprint_service = FingerprintService()
+post_index_pipeline.register(fingerprint_service)
@@ -0,0 +1,292 @@
+"""
+Global Index Service
+Name and path index spanning every job, with search grouped by job
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import and_, func, text
+
+from app.database import db_session, engine
+from app.models import Job, FileMetadata, PostIndexState
+from app.services.content_index import content_index_service, match_expression, snippet_html, \
+    MATCH_START, MATCH_END, SNIPPET_TOKENS
+from app.services.directories import directory_service
+from app.services.index_store import index_store
+from app.services.post_index import PostIndexStage, post_index_pipeline
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# bm25 weights of the name and path columns (a hit in the file name ranks first)
+NAME_WEIGHT = 10.0
+PATH_WEIGHT = 1.0
+
+
+class GlobalIndexService(PostIndexStage):
+    """
+    Cross-job file index stage and search
+
+    Every indexed file of every job (sharded or not) gets a row in
+    global_files in the main database - job id, file id, name and path -
+    indexed by the FTS5 table global_paths as external content, kept in
+    step by triggers. A search is one ranked MATCH joined to the jobs
+    table, so upload date and filename filters apply in the same query.
+    Content matches come from the jobs' own content indexes: one query
+    over the main database, plus one per sharded job that passes the
+    filters.
+    """
+
+    name = 'global_index'
+    reads_content = False
+    main_database = True
+    table = 'global_paths'
+    files_table = 'global_files'
+
+    def __init__(self):
+        self._ready = False
+
+    def enabled(self, index_engine):
+        """Whether files are added to the global index (FTS5 needs a SQLite main database)"""
+        return settings.GLOBAL_INDEX and engine.dialect.name == 'sqlite'
+
+    def ensure_table(self, connection):
+        """Create the global tables and triggers if needed"""
+        if self._ready:
+            return
+        connection.execute(text(
+            f'CREATE TABLE IF NOT EXISTS {self.files_table} ('
+            f'id INTEGER PRIMARY KEY, job_id VARCHAR(36) NOT NULL, file_id INTEGER NOT NULL, '
+            f'name TEXT NOT NULL, path TEXT NOT NULL, UNIQUE (job_id, file_id))'
+        ))
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5(name, path, "
+            f"content='{self.files_table}', content_rowid='id')"
+        ))
+        connection.execute(text(
+            f'CREATE TRIGGER IF NOT EXISTS {self.files_table}_ai AFTER INSERT ON {self.files_table} BEGIN '
+            f'INSERT INTO {self.table} (rowid, name, path) VALUES (new.id, new.name, new.path); END'
+        ))
+        connection.execute(text(
+            f'CREATE TRIGGER IF NOT EXISTS {self.files_table}_ad AFTER DELETE ON {self.files_table} BEGIN '
+            f"INSERT INTO {self.table} ({self.table}, rowid, name, path) "
+            f"VALUES ('delete', old.id, old.name, old.path); END"
+        ))
+        self._ready = True
+
+    def has_table(self, connection):
+        """Whether the main database has the global tables"""
+        return self._ready or connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+        ), {'name': self.table}).first() is not None
+
+    def process(self, connection, job_id, files):
+        """
+        Add a batch of files to the global index
+
+        Returns:
+            tuple: (files indexed, 0)
+        """
+        self.ensure_table(connection)
+        # A batch re-run after a crash finds its rows already there
+        connection.execute(text(
+            f'INSERT OR IGNORE INTO {self.files_table} (job_id, file_id, name, path) '
+            f'VALUES (:job_id, :file_id, :name, :path)'
+        ), [{'job_id': job_id, 'file_id': item.id, 'name': item.path.rsplit('/', 1)[-1], 'path': item.path}
+            for item in files])
+        return len(files), 0
+
+    def delete(self, job_id):
+        """Remove a job's rows (in short transactions)"""
+        if not self.enabled(engine):
+            return
+
+        while True:
+            with engine.begin() as connection:
+                if not self.has_table(connection):
+                    return
+                deleted = connection.execute(text(
+                    f'DELETE FROM {self.files_table} WHERE id IN ('
+                    f'SELECT id FROM {self.files_table} WHERE job_id = :job_id LIMIT :limit)'
+                ), {'job_id': job_id, 'limit': settings.DELETE_BATCH_ROWS}).rowcount
+            if deleted < settings.DELETE_BATCH_ROWS:
+                return
+
+    def remove(self, connection, job_id, file_ids, directory_ids):
+        """Remove the rows of removed files"""
+        if file_ids and self.has_table(connection):
+            connection.execute(text(
+                f'DELETE FROM {self.files_table} WHERE job_id = :job_id AND file_id = :file_id'
+            ), [{'job_id': job_id, 'file_id': file_id} for file_id in file_ids])
+
+    def search(self, query, content=False, path=None, since=None, until=None, filename=None, limit=None,
+               per_job=None):
+        """
+        Files of all jobs matching a query, grouped by job
+
+        Words must all occur in the file's path (any order); "quoted words"
+        must occur as a phrase; word* matches a prefix.
+
+        Args:
+            query: Search query string
+            content: Also search file contents (jobs whose content index is built)
+            path: Only files whose path contains this (case-insensitive), e.g.
+                nova-compute.log with a content query
+            since: Only jobs uploaded at or after this datetime
+            until: Only jobs uploaded before this datetime
+            filename: Only jobs whose uploaded filename contains this (case-insensitive)
+            limit: Maximum hits over all jobs (default GLOBAL_SEARCH_LIMIT)
+            per_job: Maximum hits returned per job (default GLOBAL_SEARCH_PER_JOB)
+
+        Returns:
+            list: Job dictionaries (job_id, filename, created_at, score, total_hits,
+                hits), best match first; hits carry path, name, match ('path' or
+                'content'), score and, for content matches, an HTML snippet
+        """
+        expression = match_expression(query)
+        if expression is None or not self.enabled(engine):
+            return []
+        limit = limit or settings.GLOBAL_SEARCH_LIMIT
+        per_job = per_job or settings.GLOBAL_SEARCH_PER_JOB
+
+        conditions = ["j.status = 'completed'"]
+        params = {'match': expression, 'limit': limit}
+        if since is not None:
+            conditions.append('j.created_at >= :since')
+            params['since'] = str(since)  # the format DateTime columns are stored in
+        if until is not None:
+            conditions.append('j.created_at < :until')
+            params['until'] = str(until)
+        if filename:
+            conditions.append("lower(j.filename) LIKE :filename ESCAPE '\\'")
+            params['filename'] = _contains(filename)
+        job_filter = ' AND '.join(conditions)
+        path_filter = ''
+        if path:
+            path_filter = " AND lower(f.path) LIKE :path ESCAPE '\\'"
+            params['path'] = _contains(path)
+
+        hits = []
+        with engine.connect() as connection:
+            if self.has_table(connection):
+                rows = connection.execute(text(
+                    f'SELECT f.job_id, f.file_id, f.path, bm25({self.table}, {NAME_WEIGHT}, {PATH_WEIGHT}) AS score '
+                    f'FROM {self.table} JOIN {self.files_table} f ON f.id = {self.table}.rowid '
+                    f'JOIN jobs j ON j.id = f.job_id '
+                    f'WHERE {self.table} MATCH :match AND {job_filter}{path_filter} ORDER BY score LIMIT :limit'
+                ), params).all()
+                hits += [{'job_id': job_id, 'file_id': file_id, 'path': path, 'match': 'path', 'score': score}
+                         for job_id, file_id, path, score in rows]
+
+            if content:
+                hits += self._content_hits(connection, query, expression, job_filter, path, params, per_job)
+
+        return self._group(hits, per_job)
+
+    def pending_jobs(self):
+        """Number of completed jobs not fully in the global index yet"""
+        if not self.enabled(engine):
+            return 0
+        return db_session.query(func.count(Job.id)).outerjoin(PostIndexState, and_(
+            PostIndexState.job_id == Job.id, PostIndexState.stage == self.name
+        )).filter(Job.status == 'completed', PostIndexState.completed_at == None).scalar()
+
+    def _content_hits(self, connection, query, expression, job_filter, path, params, per_job):
+        """Content matches from the main database's content index and each sharded job's"""
+        hits = []
+        text_table = content_index_service.text_table
+        content_table = content_index_service.table
+        if content_index_service.enabled(engine) and content_index_service.has_table(connection) \
+                and (not path or self.has_table(connection)):
+            # Paths of main database files are in global_files
+            path_join = (f'JOIN {self.files_table} f ON f.job_id = t.job_id AND f.file_id = t.id '
+                         f"AND lower(f.path) LIKE :path ESCAPE '\\' " if path else '')
+            rows = connection.execute(text(
+                f"SELECT t.job_id, t.id, snippet({content_table}, 0, :start, :end, '…', {SNIPPET_TOKENS}), "
+                f'bm25({content_table}, 1.0, 0.0) AS score '
+                f'FROM {content_table} JOIN {text_table} t ON t.id = {content_table}.rowid {path_join}'
+                f'JOIN jobs j ON j.id = t.job_id '
+                f'WHERE {content_table} MATCH :content_match AND {job_filter} ORDER BY score LIMIT :limit'
+            ), dict(params, content_match=f'content : ({expression})', start=MATCH_START, end=MATCH_END)).all()
+            hits += [{'job_id': job_id, 'file_id': file_id, 'snippet': snippet_html(snippet),
+                      'match': 'content', 'score': score} for job_id, file_id, snippet, score in rows]
+
+        job_ids = [job_id for (job_id,) in connection.execute(text(
+            f'SELECT j.id FROM jobs j WHERE {job_filter}'), params) if index_store.is_sharded(job_id)]
+        if job_ids:
+            def search_job(job_id):
+                try:
+                    # With a path filter, take every match and keep those in matching files
+                    matches = content_index_service.search(job_id, query, None if path else per_job)
+                    job_hits = [{'job_id': job_id, 'file_id': file_id, 'snippet': snippet,
+                                 'match': 'content', 'score': score} for file_id, snippet, score in matches]
+                    if path:
+                        self._add_paths(job_id, job_hits)
+                        job_hits = [hit for hit in job_hits if path.lower() in hit['path'].lower()][:per_job]
+                    return job_hits
+                except Exception as e:
+                    logger.warning(f"Content search of job {job_id} failed: {e}")
+                    return []
+                finally:
+                    index_store.remove_sessions()
+
+            with ThreadPoolExecutor(max_workers=settings.CONTENT_INDEX_WORKERS,
+                                    thread_name_prefix='global-search') as pool:
+                for job_hits in pool.map(search_job, job_ids):
+                    hits += job_hits
+        return hits
+
+    def _group(self, hits, per_job):
+        """Hits grouped by job (a file matching by path and content is one hit), best group first"""
+        by_job = {}
+        for hit in sorted(hits, key=lambda hit: hit['score']):
+            files = by_job.setdefault(hit['job_id'], {})
+            if hit['file_id'] in files:
+                files[hit['file_id']].setdefault('snippet', hit.get('snippet'))
+            else:
+                files[hit['file_id']] = hit
+
+        jobs = {job.id: job for job in db_session.query(Job).filter(Job.id.in_(list(by_job)))} if by_job else {}
+        groups = []
+        for job_id, files in by_job.items():
+            job = jobs.get(job_id)
+            if job is None:
+                continue
+            shown = list(files.values())[:per_job]
+            self._add_paths(job_id, shown)
+            groups.append({
+                'job_id': job_id,
+                'filename': job.filename,
+                'created_at': job.created_at.isoformat() if job.created_at else None,
+                'score': shown[0]['score'],
+                'total_hits': len(files),
+                'hits': [{key: value for key, value in hit.items() if key not in ('job_id', 'file_id')}
+                         for hit in shown],
+            })
+        groups.sort(key=lambda group: group['score'])
+        return groups
+
+    def _add_paths(self, job_id, hits):
+        """Fill in path and name of hits found by content (paths come from the job's index)"""
+        missing = [hit for hit in hits if 'path' not in hit]
+        if missing:
+            dir_map = directory_service.path_map(job_id)
+            rows = dict((file_id, (parent_id, name)) for file_id, parent_id, name in
+                        index_store.session(job_id).query(FileMetadata.id, FileMetadata.parent_id, FileMetadata.name)
+                        .filter(FileMetadata.id.in_([hit['file_id'] for hit in missing])))
+            for hit in missing:
+                parent_id, name = rows.get(hit['file_id'], (None, ''))
+                hit['path'] = dir_map.file_path(parent_id, name) if parent_id is not None else name
+        for hit in hits:
+            hit['name'] = hit['path'].rsplit('/', 1)[-1]
+
+
+def _contains(value):
+    """LIKE pattern (escape '\\') matching lower-cased text containing value"""
+    return '%' + value.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+# Global cross-job index service instance
+global_index_service = GlobalIndexService()
+post_index_pipeline.register(global_index_service)
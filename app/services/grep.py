@@ -0,0 +1,394 @@
+"""
+Grep Service
+Regular expression search through the text files of a job, line by line
+"""
+
+import codecs
+import os
+import re
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+
+from sqlalchemy import func, select, text
+
+from app.models import FileMetadata
+from app.services.content_index import content_index_service
+from app.services.directories import directory_service
+from app.services.file_classifier import SNIFF_SIZE, text_codec, text_encoding
+from app.services.index_store import index_store
+from app.services.post_index import post_index_pipeline
+from app.utils.security import check_file_access
+from app.utils.trigram_plan import regex_expression
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A file to search: index row, relative path and stored text encoding (None if not classified)
+GrepFile = namedtuple('GrepFile', ['id', 'path', 'size', 'encoding'])
+
+# Candidate ids looked up per query
+LOOKUP_BATCH = 500
+
+# Bytes read from a file at a time (GREP_TIMEOUT is checked between reads)
+READ_CHUNK = 1024 * 1024
+
+# Longest unfinished line carried between reads before it is searched in pieces
+MAX_CARRY = 16 * 1024 * 1024
+
+# Lines read past a line before it is searched, so a match starting on it that
+# spans lines (e.g. 'error\nTraceback') is not cut off at a chunk boundary
+MATCH_SPAN_LINES = 16
+
+
+class GrepError(ValueError):
+    """The pattern is not a valid regular expression"""
+    pass
+
+
+class GrepRun:
+    """
+    One grep over a job's candidate files
+
+    Iterating yields hits ({'path', 'line', 'text', 'before', 'after'}) in
+    path order while GREP_WORKERS threads verify the following files; stops
+    after max_hits hits or GREP_TIMEOUT seconds (a file being searched when
+    the time is up contributes the hits found so far). summary() describes
+    the run once iteration has ended.
+    """
+
+    def __init__(self, job_id, regex, files, indexed, total_files, context, max_hits):
+        self.job_id = job_id
+        self.regex = regex
+        self.files = files
+        self.indexed = indexed
+        self.total_files = total_files
+        self.context = context
+        self.max_hits = max_hits
+        self.files_searched = 0
+        self.hits = 0
+        self.truncated = False
+        self.timed_out = False
+        self._started = time.monotonic()
+
+    def __iter__(self):
+        from app.services.cold_storage import cold_storage_service
+
+        pack = cold_storage_service.get(self.job_id)
+        deadline = self._started + settings.GREP_TIMEOUT
+        files = iter(self.files)
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=settings.GREP_WORKERS, thread_name_prefix='grep') as pool:
+            def fill():
+                while len(pending) < settings.GREP_WORKERS * 4:
+                    grep_file = next(files, None)
+                    if grep_file is None:
+                        return
+                    pending.append((grep_file, pool.submit(self._search_file, pack, grep_file, deadline)))
+
+            try:
+                fill()
+                while pending:
+                    grep_file, future = pending.popleft()
+                    hits = future.result()
+                    self.files_searched += 1
+                    for hit in hits:
+                        yield dict(hit, path=grep_file.path)
+                        self.hits += 1
+                        if self.hits >= self.max_hits:
+                            self.truncated = True
+                            return
+                    if time.monotonic() > deadline:
+                        self.truncated = self.timed_out = True
+                        return
+                    fill()
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+    def summary(self):
+        """Counts of the run"""
+        return {
+            'done': True,
+            'hits': self.hits,
+            'files_searched': self.files_searched,
+            'candidate_files': len(self.files),
+            'total_files': self.total_files,
+            'indexed': self.indexed,
+            'truncated': self.truncated,
+            'timed_out': self.timed_out,
+            'seconds': round(time.monotonic() - self._started, 3),
+        }
+
+    def _search_file(self, pack, grep_file, deadline):
+        """Hits in one file, read in chunks (empty for binaries and unreadable files)"""
+        try:
+            if pack is not None:
+                member = pack.resolve(grep_file.path)
+                if member is None:
+                    return []
+                stream = pack.open(member)
+            else:
+                is_safe, full_path, _ = check_file_access(self.job_id, grep_file.path)
+                if not is_safe or not os.path.isfile(full_path):
+                    return []
+                stream = open(full_path, 'rb')
+
+            with stream:
+                chunks = iter(lambda: stream.read(READ_CHUNK), b'')
+                first = next(chunks, b'')
+                if not first:
+                    return []
+                encoding = grep_file.encoding or text_encoding(first[:SNIFF_SIZE])
+                if encoding is None:
+                    return []
+                chunks = chain([first], chunks)
+                if encoding not in ('ascii', 'utf-8'):
+                    # The pattern is UTF-8: search the text re-encoded
+                    chunks = (part.encode('utf-8') for part in
+                              codecs.iterdecode(chunks, text_codec(encoding), errors='replace'))
+                return stream_line_hits(chunks, self.regex, self.context, self.max_hits, deadline)
+        except (OSError, ValueError) as e:
+            logger.debug(f"Could not grep {grep_file.path} of job {self.job_id}: {e}")
+            return []
+
+
+class GrepService:
+    """
+    Regex grep across a job
+
+    The content index stage keeps a trigram index of every indexed text
+    file (file_trigrams). The literals the pattern requires become a
+    trigram AND/OR query selecting the candidate files; files too large to
+    be indexed are always candidates, files classified as binary never.
+    Candidates are then verified with the compiled pattern, reading each
+    file (or cold pack member) in chunks and decoding text of another
+    encoding than UTF-8. Without a usable plan (or before the job's index
+    is built) every file is searched.
+    """
+
+    def search(self, job_id, pattern, ignore_case=False, path_prefix='', context=0, max_hits=None):
+        """
+        Prepare a grep
+
+        Args:
+            job_id: UUID of the job
+            pattern: Regular expression (^ and $ match at line boundaries)
+            ignore_case: Case-insensitive matching
+            path_prefix: Only files in this directory (relative path)
+            context: Lines of context before and after each hit
+            max_hits: Maximum hits (default GREP_MAX_HITS)
+
+        Returns:
+            GrepRun: Iterable of hits
+
+        Raises:
+            GrepError: Invalid regular expression
+        """
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        try:
+            regex = re.compile(pattern.encode('utf-8'), flags)
+            expression = regex_expression(pattern, flags)
+        except (re.error, RecursionError) as e:
+            raise GrepError(f'Invalid regular expression: {e}')
+
+        index_engine = index_store.engine(job_id)
+        dir_map = directory_service.path_map(job_id)
+        table = FileMetadata.__table__
+        indexed = (content_index_service.enabled(index_engine)
+                   and post_index_pipeline.status(job_id, content_index_service.name) == 'complete')
+
+        columns = (table.c.id, table.c.parent_id, table.c.name, table.c.size, table.c.is_binary, table.c.encoding)
+
+        with index_engine.connect() as connection:
+            indexed = indexed and content_index_service.has_grep_index(connection)
+            total_files = connection.execute(
+                select(func.count()).select_from(table).where(table.c.job_id == job_id)
+            ).scalar()
+
+            if indexed and expression:
+                candidate_ids = connection.execute(text(
+                    f'SELECT rowid FROM {content_index_service.grep_table} '
+                    f'WHERE {content_index_service.grep_table} MATCH :match'
+                ), {'match': f'content : ({expression}) AND {content_index_service.job_filter(job_id)}'}
+                ).scalars().all()
+                rows = []
+                for start in range(0, len(candidate_ids), LOOKUP_BATCH):
+                    rows += connection.execute(
+                        select(*columns)
+                        .where(table.c.id.in_(candidate_ids[start:start + LOOKUP_BATCH]))
+                    ).all()
+                # Not in the index: larger than the content index takes
+                rows += connection.execute(
+                    select(*columns)
+                    .where(table.c.job_id == job_id, table.c.size > settings.CONTENT_INDEX_MAX_FILE_SIZE)
+                ).all()
+            else:
+                rows = connection.execute(
+                    select(*columns)
+                    .where(table.c.job_id == job_id)
+                ).all()
+
+        prefix = path_prefix.strip('/')
+        files = {}
+        for file_id, parent_id, name, size, is_binary, encoding in rows:
+            if is_binary:
+                continue
+            path = dir_map.file_path(parent_id, name)
+            if not prefix or path.startswith(prefix + '/'):
+                files[file_id] = GrepFile(file_id, path, size or 0, encoding)
+
+        return GrepRun(job_id, regex, sorted(files.values(), key=lambda f: f.path), indexed and bool(expression),
+                       total_files, context, max_hits or settings.GREP_MAX_HITS)
+
+
+def stream_line_hits(chunks, regex, context=0, limit=None, deadline=None):
+    """
+    line_hits() over data read in chunks
+
+    Only the lines not searched yet are held: a line cut by a chunk boundary
+    is carried into the next chunk along with the context lines before it,
+    and a line is searched once its after-context and MATCH_SPAN_LINES
+    following lines are read, so the hits are those of line_hits() over
+    the whole file for any match spanning up to that many line breaks.
+    Past MAX_CARRY bytes without enough line breaks, what is held is
+    searched as it is (a longer line in pieces).
+
+    Args:
+        chunks: Iterable of bytes
+        regex: Compiled bytes pattern
+        context: Lines of context before and after each hit
+        limit: Maximum hits
+        deadline: time.monotonic() value after which the hits so far are returned
+
+    Returns:
+        list: {'line', 'text', 'before', 'after'} dictionaries
+    """
+    hits = []
+    buffer = b''
+    searched_to = 0  # offset in buffer of the first line not searched yet
+    resume = 0  # offset the next search starts at (past the end of a match taken in)
+    first_line = 1  # line number of the buffer's first line
+
+    for chunk in chunks:
+        if deadline is not None and time.monotonic() > deadline:
+            return hits
+        buffer += chunk
+        complete = buffer.rfind(b'\n') + 1
+        oversized = len(buffer) - searched_to >= MAX_CARRY
+        if complete <= searched_to:
+            if not oversized:
+                continue
+            complete = len(buffer)
+
+        # Hold back the last lines until their after-context and the lines a match may span are read
+        end = complete
+        if not oversized:
+            for _ in range(max(context, MATCH_SPAN_LINES)):
+                if end <= searched_to:
+                    break
+                end = buffer.rfind(b'\n', 0, end - 1) + 1
+            if end <= searched_to:
+                continue
+
+        found, scanned_to = _line_hits(buffer, regex, context, None if limit is None else limit - len(hits),
+                                       max(searched_to, resume), end, first_line)
+        hits += found
+        if limit is not None and len(hits) >= limit:
+            return hits
+
+        # Keep the before-context of the next line to search
+        keep = end
+        for _ in range(context):
+            if keep == 0:
+                break
+            keep = buffer.rfind(b'\n', 0, keep - 1) + 1
+        keep = max(keep, end - MAX_CARRY)
+        first_line += buffer.count(b'\n', 0, keep)
+        buffer = buffer[keep:]
+        searched_to = end - keep
+        resume = max(scanned_to, end) - keep
+
+    hits += _line_hits(buffer, regex, context, None if limit is None else limit - len(hits),
+                       max(searched_to, resume), None, first_line)[0]
+    return hits
+
+
+def line_hits(data, regex, context=0, limit=None):
+    """
+    Lines of a buffer matching a compiled bytes pattern (one hit per line)
+
+    Args:
+        data: bytes
+        regex: Compiled bytes pattern
+        context: Lines of context before and after each hit
+        limit: Maximum hits
+
+    Returns:
+        list: {'line', 'text', 'before', 'after'} dictionaries
+    """
+    return _line_hits(data, regex, context, limit)[0]
+
+
+def _line_hits(data, regex, context, limit, from_offset=0, to_offset=None, first_line=1):
+    """
+    line_hits() over part of a buffer
+
+    Args:
+        from_offset: Offset to search from
+        to_offset: Only matches starting before this offset (default: all)
+        first_line: Line number of the buffer's first line
+
+    Returns:
+        tuple: (hits, offset where the matches taken in end - the next search starts there)
+    """
+    hits = []
+    line_number = first_line
+    counted_to = 0
+    last_start = -1
+    scanned_to = from_offset
+    size = len(data)
+
+    for match in regex.finditer(data, from_offset):
+        if to_offset is not None and match.start() >= to_offset:
+            break
+        scanned_to = match.end()
+        start = data.rfind(b'\n', 0, match.start()) + 1
+        if start == last_start:
+            continue
+        line_number += data.count(b'\n', counted_to, start)
+        counted_to = last_start = start
+        end = data.find(b'\n', start)
+        end = size if end == -1 else end
+
+        before = []
+        position = start
+        while len(before) < context and position > 0:
+            previous = data.rfind(b'\n', 0, position - 1) + 1
+            before.insert(0, _line_text(data[previous:position - 1]))
+            position = previous
+
+        after = []
+        position = end
+        while len(after) < context and position < size - 1:
+            following = data.find(b'\n', position + 1)
+            following = size if following == -1 else following
+            after.append(_line_text(data[position + 1:following]))
+            position = following
+
+        hits.append({'line': line_number, 'text': _line_text(data[start:end]), 'before': before, 'after': after})
+        if limit is not None and len(hits) >= limit:
+            break
+    return hits, scanned_to
+
+
+def _line_text(raw):
+    """Decoded line, cut to GREP_MAX_LINE_LENGTH characters"""
+    return raw.decode('utf-8', errors='replace').rstrip('\r')[:settings.GREP_MAX_LINE_LENGTH]
+
+
+# Global grep service instance
+grep_service = GrepService()
@@ -0,0 +1,141 @@
+"""
+Index Store Service
+Locates a job's file index: the main database or a per-job SQLite shard
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from app.database import Base, db_session, engine, migrate_schema, set_sqlite_pragmas
+from app.models import Directory, DirectoryStats, FileMetadata
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tables that hold a job's file index (everything else stays in the main database)
+INDEX_TABLES = [Directory.__table__, FileMetadata.__table__, DirectoryStats.__table__]
+
+
+class _Shard:
+    """Engine and thread-local sessions of one open shard database"""
+
+    def __init__(self, path):
+        self.path = path
+        self.engine = create_engine(
+            f'sqlite:///{path}',
+            connect_args={'check_same_thread': False, 'timeout': settings.SQLITE_BUSY_TIMEOUT},
+            echo=settings.DEBUG
+        )
+        event.listen(self.engine, 'connect', set_sqlite_pragmas)
+        Base.metadata.create_all(bind=self.engine, tables=INDEX_TABLES)
+        migrate_schema(self.engine, INDEX_TABLES)
+        self.session = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=self.engine))
+
+    def close(self):
+        self.session.remove()
+        self.engine.dispose()
+
+
+class IndexStore:
+    """
+    Routes file index reads and writes for a job
+
+    With INDEX_SHARDS enabled, each newly indexed job gets its own SQLite
+    file, so its long index transaction never holds the main database's
+    writer lock and deleting the job is an unlink. A job uses its shard
+    whenever the shard file exists, so jobs indexed before sharding was
+    enabled (or after it was disabled) keep working. Open shards are kept
+    in a small LRU.
+    """
+
+    def __init__(self, max_handles=None):
+        self.max_handles = max_handles or settings.INDEX_SHARD_HANDLES
+        self._shards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def shard_path(self, job_id):
+        """Path of a job's shard database"""
+        return os.path.join(settings.INDEX_SHARD_FOLDER, f'{job_id}.db')
+
+    def is_sharded(self, job_id):
+        """Whether a job's index lives in its own shard"""
+        return job_id in self._shards or os.path.exists(self.shard_path(job_id))
+
+    def engine(self, job_id, create=False):
+        """
+        Engine holding a job's file index
+
+        Args:
+            job_id: UUID of the job
+            create: Whether a job being indexed from scratch should get a new
+                shard (only when INDEX_SHARDS is enabled)
+
+        Returns:
+            Engine: Shard engine or the main database engine
+        """
+        if self.is_sharded(job_id) or (create and settings.INDEX_SHARDS):
+            return self._open(job_id).engine
+        return engine
+
+    def session(self, job_id):
+        """
+        Session for querying a job's file index
+
+        Returns:
+            scoped_session: Shard session or the main db_session
+        """
+        if self.is_sharded(job_id):
+            return self._open(job_id).session
+        return db_session
+
+    def _open(self, job_id):
+        """Get an open shard, opening (and creating) it and evicting the least recently used"""
+        with self._lock:
+            shard = self._shards.get(job_id)
+            if shard is not None:
+                self._shards.move_to_end(job_id)
+                return shard
+
+            os.makedirs(settings.INDEX_SHARD_FOLDER, exist_ok=True)
+            shard = self._shards[job_id] = _Shard(self.shard_path(job_id))
+            while len(self._shards) > self.max_handles:
+                _, evicted = self._shards.popitem(last=False)
+                evicted.close()
+            return shard
+
+    def drop(self, job_id):
+        """
+        Delete a job's shard
+
+        Returns:
+            bool: True if the job had a shard
+        """
+        with self._lock:
+            shard = self._shards.pop(job_id, None)
+        if shard is not None:
+            shard.close()
+
+        path = self.shard_path(job_id)
+        existed = os.path.exists(path)
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+        return existed
+
+    def remove_sessions(self, exception=None):
+        """Release the current thread's shard sessions (app context teardown)"""
+        with self._lock:
+            shards = list(self._shards.values())
+        for shard in shards:
+            shard.session.remove()
+
+
+# Global index store instance
+index_store = IndexStore()
@@ -4,20 +4,49 @@ Indexes extracted files for search and browsing
 """
 
 import os
-from datetime import datetime
+import posixpath
+import threading
+
+from sqlalchemy import and_, case, delete, or_
 
 from app.database import db_session
-from app.models import Job, FileMetadata
+from app.models import Job, JobStats, Directory, DirectoryStats, FileMetadata
+from app.services.bulk_insert import bulk_insert_service
+from app.services.content_index import content_index_service
+from app.services.directories import directory_service
+from app.services.directory_stats import directory_stats_service, DirectoryTotals
+from app.services.index_store import index_store
+from app.services.job_control import job_control_service, JobCancelledError
+from app.services.job_stats import job_stats_service, JobStatsCollector
+from app.services.job_writer import job_writer
+from app.services.manifest import manifest_service
+from app.services.path_index import path_index_service
+from app.services.post_index import post_index_pipeline
+from app.services.progress_bus import progress_bus
+from app.services.stage_timing import stage_timing_service, StageSample
+from app.services.throughput import ThroughputMeter, format_eta
 from app.utils.file_utils import get_file_extension, format_file_info
+from app.utils.locks import KeyedLocks
+from app.utils.walker import walk_tree, WalkEntry
 from config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+# file_metadata columns written by the bulk loader (content_preview is left NULL -
+# contents are indexed by the post-index pipeline, see content_index_service)
+INDEX_COLUMNS = ('job_id', 'parent_id', 'name', 'size', 'extension')
+
+# Server databases enforce the column length ("file.<60 characters>" would abort the load)
+EXTENSION_MAX_LENGTH = FileMetadata.__table__.c.extension.type.length
+
 
 class IndexingService:
     """Handles file indexing for search and browsing"""
 
+    def __init__(self):
+        self._job_locks = KeyedLocks(threading.RLock)
+
     def index_extraction(self, job_id):
         """
         Index all files from an extraction (OPTIMIZED for speed)
@@ -42,112 +71,142 @@ class IndexingService:
             'rhcert_files': []
         }
 
-        try:
-            batch_items = []
-            batch_size = 500  # Commit every 500 items for better performance
-
-            # Walk through all files and directories
-            for root, dirs, files in os.walk(extract_path):
-                # Index directories
-                for dir_name in dirs:
-                    dir_path = os.path.join(root, dir_name)
-                    rel_path = os.path.relpath(dir_path, extract_path)
-                    parent_path = os.path.dirname(rel_path) if rel_path != '.' else None
-
-                    # Check if this is a RHOSO test folder
-                    if dir_name.startswith('rhoso'):
-                        stats['rhoso_folders'].append(rel_path)
-
-                    # Create metadata entry (batched)
-                    metadata = FileMetadata(
-                        job_id=job_id,
-                        name=dir_name,
-                        path=dir_path,
-                        relative_path=rel_path,
-                        size=None,
-                        extension=None,
-                        is_directory=True,
-                        parent_path=parent_path,
-                        content_preview=None
-                    )
-                    batch_items.append(metadata)
-                    stats['directories_indexed'] += 1
-
-                    # Batch commit for performance
-                    if len(batch_items) >= batch_size:
-                        db_session.bulk_save_objects(batch_items)
-                        db_session.commit()
-                        batch_items = []
-
-                # Index files
-                for filename in files:
-                    file_path = os.path.join(root, filename)
-                    rel_path = os.path.relpath(file_path, extract_path)
-                    parent_path = os.path.dirname(rel_path) if rel_path != '.' else None
-
-                    try:
-                        file_size = os.path.getsize(file_path)
-                        stats['total_size'] += file_size
-
-                        # Check if this is a rhcert XML file
-                        if filename.lower().endswith('.xml') and 'rhcert' in filename.lower():
-                            stats['rhcert_files'].append(rel_path)
+        # Extracted member count (published when extraction finished) estimates the entries to index
+        meter = ThroughputMeter(total=(progress_bus.get(job_id) or {}).get('members_extracted'))
 
-                        # OPTIMIZATION: Skip content preview - not needed for browsing
-                        # This saves thousands of file reads
+        # Directory walk and DB inserts are timed separately
+        walk_sample = StageSample(job_id, 'index_walk')
+        insert_sample = StageSample(job_id, 'index_insert')
+        walk_sample.start()
 
-                        # Create metadata entry (batched)
-                        metadata = FileMetadata(
-                            job_id=job_id,
-                            name=filename,
-                            path=file_path,
-                            relative_path=rel_path,
-                            size=file_size,
-                            extension=get_file_extension(filename),
-                            is_directory=False,
-                            parent_path=parent_path,
-                            content_preview=None  # Skip for speed
-                        )
-                        batch_items.append(metadata)
+        try:
+            # Scanner threads walk the tree; this thread is the single DB writer.
+            # All rows go in one transaction, so a cancelled or failed job
+            # leaves no partial index behind.
+            # With INDEX_SHARDS on, a new job is indexed into its own database
+            index_engine = index_store.engine(job_id, create=True)
+            with bulk_insert_service.load(FileMetadata.__table__, INDEX_COLUMNS, bind=index_engine) as loader:
+                dir_ids = {'': directory_service.ensure_root(loader.connection, job_id)}
+                totals = DirectoryTotals()
+                totals.add_directory('')
+                collector = JobStatsCollector()
+
+                # Each batch lists one directory, whose own row was written with the parent's batch
+                for entries in walk_tree(extract_path):
+                    parent_id = dir_ids[entries[0].parent_path]
+
+                    subdirs = [entry for entry in entries if entry.is_directory]
+                    if subdirs:
+                        with insert_sample.measure():
+                            dir_ids.update(directory_service.add_directories(
+                                loader.connection, job_id, parent_id, subdirs))
+
+                    for entry in entries:
+                        if entry.is_directory:
+                            totals.add_directory(entry.relative_path)
+                            # Also picks up RHOSO test folders
+                            collector.add_directory(entry.relative_path, entry.name)
+                            stats['directories_indexed'] += 1
+                            continue
+
+                        stats['total_size'] += entry.size
+                        totals.add_files(entry.parent_path, 1, entry.size, entry.mtime)
                         stats['files_indexed'] += 1
 
-                        # Batch commit for performance
-                        if len(batch_items) >= batch_size:
-                            db_session.bulk_save_objects(batch_items)
-                            db_session.commit()
-                            batch_items = []
-
-                    except (PermissionError, OSError) as e:
-                        logger.warning(f"Skipped indexing {file_path}: {e}")
-
-            # Commit remaining items
-            if batch_items:
-                db_session.bulk_save_objects(batch_items)
-                db_session.commit()
+                        # OPTIMIZATION: Skip content preview - not needed for browsing
+                        # This saves thousands of file reads
+                        row = self._row_from_entry(job_id, parent_id, entry)
+                        loader.append(row)
+                        # Also picks up rhcert XML files
+                        collector.add_file(entry.relative_path, entry.name, entry.size, row[-1])
+
+                        if loader.batch_full:
+                            job_control_service.raise_if_cancelled(job_id)
+                            with insert_sample.measure():
+                                loader.flush()
+                            self._report_indexing(job_id, meter, stats)
+
+                # Remaining rows are flushed and committed when the load block exits
+                job_control_service.raise_if_cancelled(job_id)
+                insert_sample.start()
+                directory_stats_service.write(loader.connection, job_id, dir_ids, totals.rollup())
+            insert_sample.stop()
+            directory_service.invalidate(job_id)
+
+            # Summary stats live in the main database, committed before the job completes
+            job_stats_service.save(db_session.connection(), job_id, collector)
+            db_session.commit()
+            stats['rhoso_folders'] = collector.rhoso_folders
+            stats['rhcert_files'] = collector.rhcert_files
 
             # Update job with statistics
+            job_writer.update(
+                job_id,
+                urgent=True,
+                total_files=stats['files_indexed'],
+                total_directories=stats['directories_indexed'],
+                total_size=stats['total_size'],
+                # Set has_rhoso_tests to True if either rhoso folders or rhcert files are found
+                has_rhoso_tests=len(stats['rhoso_folders']) > 0 or len(stats['rhcert_files']) > 0,
+                status='completed',
+                progress=100,
+                message='Extraction completed',
+                index_seconds=round(meter.elapsed, 3)
+            )
+            self._write_manifest(job_id)
+
+            # Read back the completed row (with the extraction figures) for subscribers
+            job_writer.flush()
             job = db_session.query(Job).filter_by(id=job_id).first()
             if job:
-                job.total_files = stats['files_indexed']
-                job.total_directories = stats['directories_indexed']
-                job.total_size = stats['total_size']
-                # Set has_rhoso_tests to True if either rhoso folders or rhcert files are found
-                job.has_rhoso_tests = len(stats['rhoso_folders']) > 0 or len(stats['rhcert_files']) > 0
-                job.status = 'completed'
-                job.progress = 100
-                job.message = 'Extraction completed'
-                job.updated_at = datetime.utcnow()
+                progress_bus.publish(job_id, status=job.status, progress=job.progress,
+                                     message=job.message, has_rhoso_tests=job.has_rhoso_tests,
+                                     throughput=job.throughput_summary())
 
-            db_session.commit()
+            # Content indexing and other per-file stages run after the job is browsable
+            post_index_pipeline.submit(job_id)
+
+            # Changes made to the tree from now on are indexed as they happen (if enabled)
+            from app.services.tree_watcher import tree_watcher_service
+            tree_watcher_service.watch(job_id)
             logger.info(f"FAST INDEXED {stats['files_indexed']} files and {stats['directories_indexed']} directories for job {job_id} (rhoso: {len(stats['rhoso_folders'])}, rhcert: {len(stats['rhcert_files'])})")
 
+        except JobCancelledError:
+            # The load transaction has already been rolled back
+            db_session.rollback()
+            raise
+
         except Exception as e:
             logger.error(f"Error indexing job {job_id}: {e}", exc_info=True)
             db_session.rollback()
             stats['error'] = str(e)
 
+        finally:
+            walk_sample.stop()
+            walk_sample.subtract(insert_sample)
+            walk_sample.bytes_processed = stats['total_size']
+            walk_sample.items = stats['files_indexed'] + stats['directories_indexed']
+            insert_sample.items = walk_sample.items
+            stage_timing_service.record(walk_sample)
+            stage_timing_service.record(insert_sample)
+
         return stats
 
+    def _report_indexing(self, job_id, meter, stats):
+        """Publish indexing progress (95-99) with entry rate and ETA when a report is due"""
+        indexed = stats['files_indexed'] + stats['directories_indexed']
+        if not meter.update(indexed, bytes_indexed=stats['total_size']):
+            return
+
+        snapshot = meter.snapshot()
+        eta = format_eta(meter.eta_seconds())
+        progress_bus.publish(
+            job_id,
+            progress=95 + int((meter.fraction() or 0) * 4),
+            message=f'Indexed {indexed} entries ({snapshot["rate_per_sec"]:.0f}/s{", ETA " + eta if eta else ""})',
+            throughput={'stage': 'index', **snapshot}
+        )
+
     def index_directory(self, job_id, directory_path, relative_base_path=''):
         """
         Index files in a specific directory (used for nested extractions)
@@ -164,98 +223,334 @@ class IndexingService:
             logger.error(f"Directory not found: {directory_path}")
             return 0
 
+        entries = (entry for batch in walk_tree(directory_path, relative_base=relative_base_path)
+                   for entry in batch)
+        indexed_count = self.index_entries(job_id, entries, relative_base_path)
+        logger.info(f"Indexed {indexed_count} new files from {directory_path}")
+        return indexed_count
+
+    def index_entries(self, job_id, entries, base_path=''):
+        """
+        Incrementally index entries added below base_path of an indexed job
+
+        Existing files under base_path are fetched with one indexed join and
+        diffed in memory, so only new paths are written. File inserts use
+        ON CONFLICT DO NOTHING against the unique (parent_id, name) index, so
+        a concurrent re-index cannot create duplicates. Missing parent
+        directories (including base_path itself) are created as needed, and
+        the new files' totals are added to the stats of every ancestor.
+
+        Args:
+            job_id: UUID of the job
+            entries: Iterable of WalkEntry
+            base_path: Relative path all entries live under ('' for the whole job)
+
+        Returns:
+            int: Number of rows added
+        """
+        with self._job_lock(job_id):
+            return self._index_entries(job_id, entries, base_path)
+
+    def _index_entries(self, job_id, entries, base_path):
+        """index_entries() with the job's lock held"""
         indexed_count = 0
-        batch_items = []
-        batch_size = 500
+
+        # Browsing falls back to the database while the index is changing
+        manifest_service.delete(job_id)
 
         try:
-            for root, dirs, files in os.walk(directory_path):
-                # Index directories
-                for dir_name in dirs:
-                    dir_path = os.path.join(root, dir_name)
-                    # Calculate relative path from the base directory
-                    rel_from_dir = os.path.relpath(dir_path, directory_path)
-                    rel_path = os.path.join(relative_base_path, rel_from_dir) if relative_base_path else rel_from_dir
-                    parent_path = os.path.dirname(rel_path) if rel_path != '.' else None
-
-                    # Check if already indexed
-                    existing = db_session.query(FileMetadata).filter_by(
-                        job_id=job_id,
-                        relative_path=rel_path
-                    ).first()
-
-                    if not existing:
-                        metadata = FileMetadata(
-                            job_id=job_id,
-                            name=dir_name,
-                            path=dir_path,
-                            relative_path=rel_path,
-                            size=None,
-                            extension=None,
-                            is_directory=True,
-                            parent_path=parent_path,
-                            content_preview=None
-                        )
-                        batch_items.append(metadata)
-                        indexed_count += 1
-
-                    if len(batch_items) >= batch_size:
-                        db_session.bulk_save_objects(batch_items)
-                        db_session.commit()
-                        batch_items = []
-
-                # Index files
-                for filename in files:
-                    file_path = os.path.join(root, filename)
-                    rel_from_dir = os.path.relpath(file_path, directory_path)
-                    rel_path = os.path.join(relative_base_path, rel_from_dir) if relative_base_path else rel_from_dir
-                    parent_path = os.path.dirname(rel_path) if rel_path != '.' else None
-
-                    try:
-                        # Check if already indexed
-                        existing = db_session.query(FileMetadata).filter_by(
-                            job_id=job_id,
-                            relative_path=rel_path
-                        ).first()
-
-                        if not existing:
-                            file_size = os.path.getsize(file_path)
-
-                            metadata = FileMetadata(
-                                job_id=job_id,
-                                name=filename,
-                                path=file_path,
-                                relative_path=rel_path,
-                                size=file_size,
-                                extension=get_file_extension(filename),
-                                is_directory=False,
-                                parent_path=parent_path,
-                                content_preview=None
-                            )
-                            batch_items.append(metadata)
-                            indexed_count += 1
-
-                        if len(batch_items) >= batch_size:
-                            db_session.bulk_save_objects(batch_items)
-                            db_session.commit()
-                            batch_items = []
-
-                    except (PermissionError, OSError) as e:
-                        logger.warning(f"Skipped indexing {file_path}: {e}")
-
-            # Commit remaining items
-            if batch_items:
-                db_session.bulk_save_objects(batch_items)
-                db_session.commit()
-
-            logger.info(f"Indexed {indexed_count} new files from {directory_path}")
+            dir_ids = dict(directory_service.path_map(job_id, refresh=True).ids)
+            known_paths = set(dir_ids)
+            existing_files = self._existing_files(job_id, base_path)
+            totals = DirectoryTotals()
+            collector = JobStatsCollector()
+
+            with bulk_insert_service.load(FileMetadata.__table__, INDEX_COLUMNS, ignore_conflicts=True,
+                                          bind=index_store.engine(job_id)) as loader:
+                if '' not in dir_ids:
+                    dir_ids[''] = directory_service.ensure_root(loader.connection, job_id)
+
+                for entry in entries:
+                    if entry.is_directory:
+                        self._ensure_directory(loader.connection, job_id, entry.relative_path, dir_ids)
+                        continue
+
+                    parent_id = self._ensure_directory(loader.connection, job_id, entry.parent_path, dir_ids)
+                    if (parent_id, entry.name) in existing_files:
+                        continue
+
+                    existing_files.add((parent_id, entry.name))
+                    row = self._row_from_entry(job_id, parent_id, entry)
+                    loader.append(row)
+                    totals.add_files(entry.parent_path, 1, entry.size, entry.mtime)
+                    collector.add_file(entry.relative_path, entry.name, entry.size, row[-1])
+                    indexed_count += 1
+
+                    if loader.batch_full:
+                        loader.flush()
+
+                new_paths = set(dir_ids) - known_paths
+                for relative_path in new_paths:
+                    totals.add_directory(relative_path)
+                    if relative_path:
+                        collector.add_directory(relative_path, relative_path.rpartition('/')[2])
+                directory_stats_service.write(loader.connection, job_id, dir_ids, totals.rollup(), new_paths)
+
+            job_stats_service.merge(db_session.connection(), job_id, collector)
+            db_session.commit()
+            indexed_count += len(new_paths - {''})
+            if indexed_count:
+                post_index_pipeline.submit(job_id)
 
         except Exception as e:
-            logger.error(f"Error indexing directory {directory_path}: {e}", exc_info=True)
+            logger.error(f"Error indexing entries under {base_path or '/'} for job {job_id}: {e}", exc_info=True)
             db_session.rollback()
+            indexed_count = 0  # the load was rolled back
+
+        finally:
+            directory_service.invalidate(job_id)
+            self._write_manifest(job_id)
 
         return indexed_count
 
+    def update_paths(self, job_id, paths, modified=()):
+        """
+        Bring the index of changed paths in line with the job's tree on disk
+
+        For changes made outside an index pass (see tree_watcher_service).
+        Each path is compared with the disk - a directory with its whole
+        indexed subtree, using one range query. Entries only on disk are
+        added, entries only in the index are removed, and files whose size
+        changed or that were written in place are replaced (removed, then
+        added under a new id, so the post-index stages take them in again).
+
+        Args:
+            job_id: UUID of the job
+            paths: Relative paths that changed (files or directories, present or gone)
+            modified: Relative paths of files written in place
+
+        Returns:
+            tuple: (rows added, rows removed)
+        """
+        root = os.path.join(settings.EXTRACT_FOLDER, job_id)
+        if not os.path.isdir(root):
+            return 0, 0
+        modified = set(modified)
+
+        with self._job_lock(job_id):
+            dir_map = directory_service.path_map(job_id, refresh=True)
+            removed_files = []
+            removed_directories = []
+            entries = []
+
+            for relative_path in _outermost(paths):
+                disk_directories, disk_files = self._disk_entries(root, relative_path)
+                if relative_path in dir_map.ids:
+                    indexed_directories = {path: directory_id for path, directory_id in dir_map.ids.items()
+                                           if _is_within(path, relative_path)}
+                    indexed_files = self._indexed_files(job_id, relative_path, dir_map)
+                else:
+                    indexed_directories = {}
+                    indexed_files = self._indexed_file(job_id, relative_path, dir_map)
+
+                for path, (file_id, size) in indexed_files.items():
+                    entry = disk_files.pop(path, None)
+                    if entry is None or entry.size != size or path in modified:
+                        removed_files.append((file_id, path.rpartition('/')[0], size))
+                        if entry is not None:
+                            entries.append(entry)
+                entries.extend(disk_files.values())
+
+                removed_directories.extend((directory_id, path) for path, directory_id in indexed_directories.items()
+                                           if path and path not in disk_directories)
+                entries.extend(entry for path, entry in disk_directories.items() if path not in indexed_directories)
+
+            removed = self.remove_entries(job_id, removed_files, removed_directories) \
+                if removed_files or removed_directories else 0
+            added = 0
+            if entries:
+                base_path = posixpath.commonpath([entry.relative_path if entry.is_directory else entry.parent_path
+                                                  for entry in entries])
+                added = self.index_entries(job_id, entries, base_path)
+
+        return added, removed
+
+    def remove_entries(self, job_id, files, directories=()):
+        """
+        Remove files and directories from a job's index
+
+        The post-index stages' rows of the entries go with them, their
+        totals are subtracted from the stats of every remaining ancestor,
+        and the job's summary stats are dropped (rebuilt from the index the
+        next time they are read).
+
+        Args:
+            job_id: UUID of the job
+            files: (file id, parent path, size) of each removed file
+            directories: (directory id, relative path) of each removed directory;
+                everything below them must be removed too
+
+        Returns:
+            int: Number of rows removed
+        """
+        file_ids = [file_id for file_id, _, _ in files]
+        directory_ids = [directory_id for directory_id, _ in directories]
+        removed_paths = {relative_path for _, relative_path in directories}
+
+        with self._job_lock(job_id):
+            # Browsing falls back to the database while the index is changing
+            manifest_service.delete(job_id)
+            # A batch still holding the files must not commit after they are gone
+            post_index_pipeline.cancel(job_id)
+
+            try:
+                post_index_pipeline.remove(job_id, file_ids, directory_ids)
+
+                totals = DirectoryTotals()
+                for _, parent_path, size in files:
+                    totals.add_files(parent_path, -1, -(size or 0))
+                for _, relative_path in directories:
+                    totals.remove_directory(relative_path)
+                remaining = {path: values for path, values in totals.rollup().items() if path not in removed_paths}
+                dir_ids = directory_service.path_map(job_id, refresh=True).ids
+
+                with index_store.engine(job_id).begin() as connection:
+                    for start in range(0, len(file_ids), 500):
+                        connection.execute(delete(FileMetadata).where(
+                            FileMetadata.id.in_(file_ids[start:start + 500])))
+                    for start in range(0, len(directory_ids), 500):
+                        chunk = directory_ids[start:start + 500]
+                        connection.execute(delete(DirectoryStats).where(DirectoryStats.directory_id.in_(chunk)))
+                        connection.execute(delete(Directory).where(Directory.id.in_(chunk)))
+                    directory_stats_service.write(connection, job_id, dir_ids, remaining, new_paths=set())
+
+                db_session.query(JobStats).filter_by(job_id=job_id).delete(synchronize_session=False)
+                post_index_pipeline.rewind(job_id)
+                removed = len(file_ids) + len(directory_ids)
+
+            except Exception as e:
+                logger.error(f"Error removing {len(file_ids)} files and {len(directory_ids)} directories "
+                             f"from job {job_id}: {e}", exc_info=True)
+                db_session.rollback()
+                removed = 0
+
+            finally:
+                directory_service.invalidate(job_id)
+                post_index_pipeline.submit(job_id)
+                self._write_manifest(job_id)
+
+        return removed
+
+    def _disk_entries(self, root, relative_path):
+        """
+        Directories and files on disk at relative_path (all of them below it for a directory)
+
+        Returns:
+            tuple: (relative path -> WalkEntry of directories, relative path -> WalkEntry of files)
+        """
+        full_path = os.path.join(root, relative_path)
+        parent_path, _, name = relative_path.rpartition('/')
+        directories = {}
+        files = {}
+        if os.path.isdir(full_path):
+            directories[relative_path] = WalkEntry(name, full_path, relative_path, parent_path, True, None)
+            # Like walk_tree, a symlinked directory is listed but not followed
+            if not os.path.islink(full_path):
+                for batch in walk_tree(full_path, relative_base=relative_path):
+                    for entry in batch:
+                        (directories if entry.is_directory else files)[entry.relative_path] = entry
+        else:
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                stat = None
+            if stat is not None:
+                files[relative_path] = WalkEntry(name, full_path, relative_path, parent_path, False,
+                                                 stat.st_size, stat.st_mtime)
+        return directories, files
+
+    def _indexed_files(self, job_id, base_path, dir_map):
+        """relative path -> (id, size) of the files indexed in or below base_path"""
+        query = self._subtree(index_store.session(job_id).query(
+            FileMetadata.id, FileMetadata.parent_id, FileMetadata.name, FileMetadata.size
+        ), job_id, base_path)
+        return {dir_map.file_path(parent_id, name): (file_id, size) for file_id, parent_id, name, size in query}
+
+    def _indexed_file(self, job_id, relative_path, dir_map):
+        """{relative_path: (id, size)} if a file is indexed at relative_path, else {}"""
+        parent_path, _, name = relative_path.rpartition('/')
+        parent_id = dir_map.id_of(parent_path)
+        if parent_id is None:
+            return {}
+        row = index_store.session(job_id).query(FileMetadata.id, FileMetadata.size).filter(
+            FileMetadata.parent_id == parent_id, FileMetadata.name == name).first()
+        return {relative_path: tuple(row)} if row else {}
+
+    def _job_lock(self, job_id):
+        """Lock serializing incremental index passes of one job"""
+        return self._job_locks.lock(job_id)
+
+    def _write_manifest(self, job_id):
+        """Snapshot the committed index for database-free browsing (best effort)"""
+        try:
+            manifest_service.write(job_id)
+        except Exception as e:
+            logger.warning(f"Could not write manifest for job {job_id}: {e}")
+
+    def _existing_files(self, job_id, base_path):
+        """(parent_id, name) of files already indexed in or below base_path"""
+        return set(self._subtree(index_store.session(job_id).query(FileMetadata.parent_id, FileMetadata.name),
+                                 job_id, base_path).all())
+
+    def _subtree(self, query, job_id, base_path):
+        """Restrict a FileMetadata query to files in or below base_path"""
+        query = query.join(Directory, FileMetadata.parent_id == Directory.id).filter(Directory.job_id == job_id)
+        if base_path:
+            # '0' is the character after '/': a range scan of the (job_id, relative_path) index
+            query = query.filter(or_(
+                Directory.relative_path == base_path,
+                and_(Directory.relative_path >= base_path + '/', Directory.relative_path < base_path + '0')
+            ))
+        return query
+
+    def _ensure_directory(self, connection, job_id, relative_path, dir_ids):
+        """
+        Get the id of a directory, creating it and any missing ancestors
+
+        Args:
+            connection: Connection of the load transaction
+            job_id: UUID of the job
+            relative_path: Directory path ('' is the root)
+            dir_ids: relative_path -> id of known directories (updated in place)
+
+        Returns:
+            int: Directory id
+        """
+        directory_id = dir_ids.get(relative_path)
+        if directory_id is not None:
+            return directory_id
+
+        parent_path, _, name = relative_path.rpartition('/')
+        parent_id = self._ensure_directory(connection, job_id, parent_path, dir_ids)
+        entry = WalkEntry(name, os.path.join(settings.EXTRACT_FOLDER, job_id, relative_path),
+                          relative_path, parent_path, True, None)
+        dir_ids.update(directory_service.add_directories(connection, job_id, parent_id, [entry]))
+        return dir_ids[relative_path]
+
+    def _row_from_entry(self, job_id, parent_id, entry):
+        """
+        Build a file_metadata row tuple (INDEX_COLUMNS order) from a walked file
+
+        Args:
+            job_id: UUID of the job
+            parent_id: Id of the directory the file is in
+            entry: WalkEntry from walk_tree
+
+        Returns:
+            tuple: Row values
+        """
+        return (job_id, parent_id, entry.name, entry.size, get_file_extension(entry.name)[:EXTENSION_MAX_LENGTH])
+
     def _get_content_preview(self, file_path, max_chars=500):
         """
         Get content preview for text files
@@ -278,37 +573,105 @@ class IndexingService:
         except Exception:
             return None
 
-    def search_files(self, job_id, query, file_type=None):
+    def search_files(self, job_id, query, file_type=None, type_filter=None):
         """
-        Search indexed files
+        Search indexed files by path and content
+
+        Path matches have rank 0; content matches (from the full-text index)
+        are ranked 1, 2, ... by relevance and carry an HTML 'snippet'.
 
         Args:
             job_id: UUID of the job
             query: Search query string
             file_type: Optional filter ('file' or 'directory')
+            type_filter: Optional SQL criteria on FileMetadata (see file_classifier.type_criteria);
+                only files matching them are returned
 
         Returns:
             list: Matching file metadata
         """
-        query_lower = query.lower()
-
-        # Build base query
-        results = db_session.query(FileMetadata).filter_by(job_id=job_id)
-
-        # Filter by type
-        if file_type == 'file':
-            results = results.filter_by(is_directory=False)
-        elif file_type == 'directory':
-            results = results.filter_by(is_directory=True)
-
-        # Search in name, path, and content preview
-        results = results.filter(
-            (FileMetadata.name.ilike(f'%{query_lower}%')) |
-            (FileMetadata.relative_path.ilike(f'%{query_lower}%')) |
-            (FileMetadata.content_preview.ilike(f'%{query_lower}%'))
-        ).all()
-
-        return [r.to_dict() for r in results]
+        session = index_store.session(job_id)
+
+        # Search in path (which includes the name)
+        if post_index_pipeline.status(job_id, path_index_service.name) == 'complete':
+            matches, _ = path_index_service.search(job_id, query, file_type=file_type)
+            path_items = path_index_service.items(job_id, matches)
+        else:
+            path_items = self._search_paths(session, job_id, query, file_type)
+
+        results = [dict(item, rank=0) for item in path_items if item['is_directory']]
+        by_id = {item['id']: dict(item, rank=0) for item in path_items if not item['is_directory']}
+
+        if file_type != 'directory':
+            content_matches = content_index_service.search(job_id, query)
+            missing = [file_id for file_id, _, _ in content_matches if file_id not in by_id]
+            for start in range(0, len(missing), 500):
+                files = session.query(FileMetadata, Directory.relative_path).join(
+                    Directory, FileMetadata.parent_id == Directory.id
+                ).filter(FileMetadata.id.in_(missing[start:start + 500])).all()
+                by_id.update((f.id, f.to_dict(parent_path)) for f, parent_path in files)
+
+            for rank, (file_id, snippet, _) in enumerate(content_matches, 1):
+                item = by_id.get(file_id)
+                if item is not None:
+                    item.setdefault('rank', rank)
+                    item['snippet'] = snippet
+
+        results.extend(item for item in by_id.values() if 'rank' in item)
+        if type_filter:
+            results = self._filter_type(session, results, type_filter)
+        return results
+
+    def _filter_type(self, session, results, criteria):
+        """Files of results whose stored classification matches the criteria (directories are dropped)"""
+        file_ids = [item['id'] for item in results if not item['is_directory']]
+        matching = set()
+        for start in range(0, len(file_ids), 500):
+            matching.update(file_id for (file_id,) in session.query(FileMetadata.id).filter(
+                FileMetadata.id.in_(file_ids[start:start + 500]), *criteria))
+        return [item for item in results if not item['is_directory'] and item['id'] in matching]
+
+    def _search_paths(self, session, job_id, query, file_type):
+        """Path search by table scan (until the job's path index is built)"""
+        pattern = f'%{query.lower()}%'
+        results = []
+
+        if file_type != 'file':
+            directories = session.query(Directory).filter(
+                Directory.job_id == job_id,
+                Directory.parent_id != None,
+                Directory.relative_path.ilike(pattern)
+            ).all()
+            results.extend(d.to_dict() for d in directories)
+
+        if file_type != 'directory':
+            file_path = case(
+                (Directory.relative_path == '', FileMetadata.name),
+                else_=Directory.relative_path + '/' + FileMetadata.name
+            )
+            files = session.query(FileMetadata, Directory.relative_path).join(
+                Directory, FileMetadata.parent_id == Directory.id
+            ).filter(
+                FileMetadata.job_id == job_id,
+                file_path.ilike(pattern)
+            ).all()
+            results.extend(f.to_dict(parent_path) for f, parent_path in files)
+
+        return results
+
+
+def _is_within(path, base_path):
+    """Whether a relative path is base_path or below it ('' contains everything)"""
+    return not base_path or path == base_path or path.startswith(base_path + '/')
+
+
+def _outermost(paths):
+    """The paths not below another of them, parents first"""
+    outermost = []
+    for path in sorted(set(paths), key=lambda path: path.split('/')):
+        if not outermost or not _is_within(path, outermost[-1]):
+            outermost.append(path)
+    return outermost
 
 
 # Global indexing service instance
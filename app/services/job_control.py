@@ -0,0 +1,250 @@
+"""
+Job Control Service
+Cooperative cancellation and cleanup for running extraction and indexing jobs
+"""
+
+import glob
+import os
+import shutil
+import threading
+import uuid
+
+from sqlalchemy import delete, select
+
+from app.database import db_session, engine
+from app.models import Job, JobStats, Directory, DirectoryStats, FileMetadata, JobStageTiming, PostIndexState
+from app.services.directories import directory_service
+from app.services.index_store import index_store
+from app.services.job_writer import job_writer
+from app.services.manifest import manifest_service
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Folder under EXTRACT_FOLDER that deleted extractions are moved into before removal
+TRASH_FOLDER = '.trash'
+
+
+class JobCancelledError(Exception):
+    """Raised inside a worker when its job has been cancelled"""
+
+    def __init__(self, job_id):
+        super().__init__(f'Job {job_id} was cancelled')
+        self.job_id = job_id
+
+
+class CancellationToken:
+    """Cancellation flag shared between the API and a job's worker thread"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._event = threading.Event()
+
+    def cancel(self):
+        """Request cancellation"""
+        self._event.set()
+
+    @property
+    def is_cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        """Raise JobCancelledError if cancellation was requested"""
+        if self._event.is_set():
+            raise JobCancelledError(self.job_id)
+
+
+class JobControlService:
+    """Tracks cancellation tokens for running jobs and cleans up job data"""
+
+    def __init__(self):
+        self._tokens = {}
+        self._lock = threading.Lock()
+        self._purger = None  # thread emptying the trash folder
+
+    def register(self, job_id):
+        """
+        Register a running job
+
+        Args:
+            job_id: UUID of the job
+
+        Returns:
+            CancellationToken: Token the worker should check
+        """
+        with self._lock:
+            token = CancellationToken(job_id)
+            self._tokens[job_id] = token
+            return token
+
+    def release(self, job_id):
+        """Forget a job once its worker has finished"""
+        with self._lock:
+            self._tokens.pop(job_id, None)
+
+    def is_running(self, job_id):
+        """Check whether a worker is registered for the job"""
+        with self._lock:
+            return job_id in self._tokens
+
+    def cancel(self, job_id):
+        """
+        Request cancellation of a running job
+
+        Args:
+            job_id: UUID of the job
+
+        Returns:
+            bool: True if a running worker was signalled
+        """
+        with self._lock:
+            token = self._tokens.get(job_id)
+        if token is None:
+            return False
+        token.cancel()
+        logger.info(f"Cancellation requested for job {job_id}")
+        return True
+
+    def raise_if_cancelled(self, job_id):
+        """
+        Checkpoint for workers - raises JobCancelledError if the job was cancelled
+
+        Jobs without a registered token (e.g. nested extractions of a
+        completed job) are never cancelled.
+        """
+        with self._lock:
+            token = self._tokens.get(job_id)
+        if token is not None:
+            token.raise_if_cancelled()
+
+    def cleanup_job_data(self, job_id, delete_job=False):
+        """
+        Remove partial output and indexed rows for a job
+
+        Args:
+            job_id: UUID of the job
+            delete_job: Also delete the Job row itself
+
+        Returns:
+            int: Number of file metadata rows deleted
+        """
+        from app.services.tree_watcher import tree_watcher_service
+        tree_watcher_service.unwatch(job_id)
+
+        self.discard_directory(os.path.join(settings.EXTRACT_FOLDER, job_id))
+
+        for upload_path in glob.glob(os.path.join(settings.UPLOAD_FOLDER, f'{glob.escape(job_id)}_*')):
+            try:
+                os.remove(upload_path)
+            except OSError as e:
+                logger.warning(f"Could not remove upload {upload_path}: {e}")
+
+        manifest_service.delete(job_id)
+
+        from app.services.cold_storage import cold_storage_service
+        cold_storage_service.delete(job_id)
+
+        # Stop background stages reading the job before their rows are removed
+        from app.services.post_index import post_index_pipeline
+        post_index_pipeline.cancel(job_id)
+
+        deleted = 0
+        try:
+            post_index_pipeline.delete(job_id)
+            if index_store.is_sharded(job_id):
+                # The whole index is one file: count it, then unlink it
+                session = index_store.session(job_id)
+                deleted = session.query(FileMetadata).count() + session.query(Directory).count()
+                session.close()
+                index_store.drop(job_id)
+            else:
+                deleted = self._delete_rows(FileMetadata.__table__, job_id)
+                self._delete_rows(DirectoryStats.__table__, job_id)
+                deleted += self._delete_rows(Directory.__table__, job_id)
+            db_session.query(JobStats).filter_by(job_id=job_id).delete(synchronize_session=False)
+            db_session.query(PostIndexState).filter_by(job_id=job_id).delete(synchronize_session=False)
+            if delete_job:
+                job_writer.discard(job_id)
+                db_session.query(JobStageTiming).filter_by(job_id=job_id).delete(synchronize_session=False)
+                db_session.query(Job).filter_by(id=job_id).delete(synchronize_session=False)
+            db_session.commit()
+        except Exception as e:
+            logger.error(f"Error cleaning up job {job_id}: {e}")
+            db_session.rollback()
+            raise
+
+        directory_service.invalidate(job_id)
+
+        logger.info(f"Cleaned up job {job_id}: removed {deleted} indexed entries")
+        return deleted
+
+    def _delete_rows(self, table, job_id):
+        """
+        Delete a job's rows from an index table in short transactions
+
+        Each chunk commits on its own, so deleting a large job never holds
+        the database's write lock for long. Rows go newest first: a
+        directory's descendants have higher ids, so they are gone by the time
+        its chunk is deleted and no delete cascades beyond its own chunk.
+
+        Args:
+            table: Index table with a job_id column
+            job_id: UUID of the job
+
+        Returns:
+            int: Number of rows deleted
+        """
+        key = list(table.primary_key.columns)[0]
+        chunk = select(key).where(table.c.job_id == job_id).order_by(key.desc()).limit(settings.DELETE_BATCH_ROWS)
+
+        deleted = 0
+        while True:
+            with engine.begin() as connection:
+                ids = connection.execute(chunk).scalars().all()
+                if ids:
+                    connection.execute(delete(table).where(key.in_(ids)))
+            deleted += len(ids)
+            if len(ids) < settings.DELETE_BATCH_ROWS:
+                return deleted
+
+    def discard_directory(self, path):
+        """
+        Remove a directory tree without waiting for it
+
+        The tree is renamed into TRASH_FOLDER (one metadata operation, so
+        the job's files disappear at once) and unlinked by a background
+        thread.
+        """
+        trash = os.path.join(settings.EXTRACT_FOLDER, TRASH_FOLDER)
+        os.makedirs(trash, exist_ok=True)
+        try:
+            os.rename(path, os.path.join(trash, f'{os.path.basename(path)}-{uuid.uuid4().hex[:8]}'))
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.warning(f"Could not move {path} to the trash, removing in place: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+            return
+
+        with self._lock:
+            if self._purger is None:
+                self._purger = threading.Thread(target=self.purge_trash, name='trash-purger', daemon=True)
+                self._purger.start()
+
+    def purge_trash(self):
+        """Unlink everything in the trash until it stays empty"""
+        trash = os.path.join(settings.EXTRACT_FOLDER, TRASH_FOLDER)
+        while True:
+            with self._lock:
+                names = os.listdir(trash) if os.path.isdir(trash) else []
+                if not names:
+                    if self._purger is threading.current_thread():
+                        self._purger = None
+                    return
+            for name in names:
+                shutil.rmtree(os.path.join(trash, name), ignore_errors=True)
+
+
+# Global job control service instance
+job_control_service = JobControlService()
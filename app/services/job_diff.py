@@ -0,0 +1,183 @@
+"""
+Job Diff Service
+Compare the file trees of two jobs and diff a pair of files line by line
+"""
+
+import difflib
+import os
+import posixpath
+
+from sqlalchemy import text
+
+from app.services.fingerprint import DIGEST_HEX_LENGTH
+from app.services.index_store import index_store
+from app.utils.security import check_file_access
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Alias of the other job's database when the two indexes are in different SQLite files
+OTHER_SCHEMA = 'other'
+
+# Diff states of a path (files present in both jobs are changed, unchanged or unverified)
+STATUSES = ('added', 'removed', 'changed', 'unverified', 'unchanged')
+
+
+class DiffError(ValueError):
+    """The two jobs cannot be compared"""
+    pass
+
+
+def _path_sql(directories, files):
+    """SQL expression of a file's relative path"""
+    return (f"CASE WHEN {directories}.relative_path = '' THEN {files}.name "
+            f"ELSE {directories}.relative_path || '/' || {files}.name END")
+
+
+def _algorithm_sql(column):
+    """SQL expression of the algorithm part of a content hash"""
+    return f'substr({column}, 1, length({column}) - {DIGEST_HEX_LENGTH})'
+
+
+class JobDiffService:
+    """
+    Differences between the file trees of two jobs
+
+    Files are matched on their relative path with one SQL join of the two
+    jobs' index rows (directory path, then file name - both indexed). When
+    the jobs are indexed in different SQLite files (shards), the second
+    one is attached to the first's connection. Same-path files of
+    different size are changed; of equal size, their content hashes
+    decide - unverified while a hash is missing (not computed yet).
+    """
+
+    def compare(self, job_a, job_b, status=None, path_prefix='', limit=None, offset=0):
+        """
+        Files added, removed and changed from job_a to job_b
+
+        Args:
+            job_a: UUID of the base job
+            job_b: UUID of the job compared with it
+            status: List only files in this state (default: every state but unchanged)
+            path_prefix: Only files under this directory
+            limit: Maximum files listed (default DIFF_MAX_ENTRIES)
+            offset: Files to skip (paging)
+
+        Returns:
+            dict: counts (files per state), files ({path, status, size_a, size_b}
+                in path order) and truncated (more files follow)
+
+        Raises:
+            DiffError: The jobs' indexes cannot be joined
+        """
+        limit = limit or settings.DIFF_MAX_ENTRIES
+        engine_a = index_store.engine(job_a)
+        engine_b = index_store.engine(job_b)
+        attach = engine_b is not engine_a
+        if attach and (engine_a.dialect.name != 'sqlite' or engine_b.dialect.name != 'sqlite'):
+            raise DiffError('Jobs indexed in different server databases cannot be compared')
+
+        params = {'job_a': job_a, 'job_b': job_b, 'limit': limit + 1, 'offset': offset}
+        prefix = path_prefix.strip('/')
+        prefix_a = prefix_b = ''
+        if prefix:
+            params['prefix'] = prefix
+            params['prefix_like'] = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '/%'
+            prefix_a = " AND (da.relative_path = :prefix OR da.relative_path LIKE :prefix_like ESCAPE '\\')"
+            prefix_b = " AND (db.relative_path = :prefix OR db.relative_path LIKE :prefix_like ESCAPE '\\')"
+
+        b = f'{OTHER_SCHEMA}.' if attach else ''
+        diff = (
+            f"SELECT CASE "
+            f"WHEN fb.id IS NULL THEN 'removed' "
+            f"WHEN fa.size <> fb.size THEN 'changed' "
+            f"WHEN fa.content_hash IS NULL OR fb.content_hash IS NULL THEN 'unverified' "
+            f"WHEN fa.content_hash = fb.content_hash THEN 'unchanged' "
+            f"WHEN {_algorithm_sql('fa.content_hash')} = {_algorithm_sql('fb.content_hash')} THEN 'changed' "
+            f"ELSE 'unverified' END AS status, "
+            f"{_path_sql('da', 'fa')} AS path, fa.size AS size_a, fb.size AS size_b "
+            f"FROM file_metadata fa JOIN directories da ON da.id = fa.parent_id "
+            f"LEFT JOIN {b}directories db ON db.job_id = :job_b AND db.relative_path = da.relative_path "
+            f"LEFT JOIN {b}file_metadata fb ON fb.parent_id = db.id AND fb.name = fa.name "
+            f"WHERE fa.job_id = :job_a{prefix_a} "
+            f"UNION ALL "
+            f"SELECT 'added', {_path_sql('db', 'fb')}, NULL, fb.size "
+            f"FROM {b}file_metadata fb JOIN {b}directories db ON db.id = fb.parent_id "
+            f"LEFT JOIN directories da ON da.job_id = :job_a AND da.relative_path = db.relative_path "
+            f"LEFT JOIN file_metadata fa ON fa.parent_id = da.id AND fa.name = fb.name "
+            f"WHERE fb.job_id = :job_b AND fa.id IS NULL{prefix_b}"
+        )
+        listed = "status = :status" if status else "status <> 'unchanged'"
+        if status:
+            params['status'] = status
+
+        with engine_a.connect() as connection:
+            if attach:
+                connection.exec_driver_sql(f'ATTACH DATABASE ? AS {OTHER_SCHEMA}', (engine_b.url.database,))
+            try:
+                counts = dict(connection.execute(text(
+                    f'SELECT status, count(*) FROM ({diff}) diff GROUP BY status'), params).all())
+                rows = connection.execute(text(
+                    f'SELECT path, status, size_a, size_b FROM ({diff}) diff '
+                    f'WHERE {listed} ORDER BY path LIMIT :limit OFFSET :offset'), params).all()
+            finally:
+                if attach:
+                    connection.rollback()
+                    connection.exec_driver_sql(f'DETACH DATABASE {OTHER_SCHEMA}')
+
+        return {
+            'counts': {state: counts.get(state, 0) for state in STATUSES},
+            'files': [{'path': path, 'status': state, 'size_a': size_a, 'size_b': size_b}
+                      for path, state, size_a, size_b in rows[:limit]],
+            'truncated': len(rows) > limit,
+        }
+
+    def locate(self, job_id, file_path):
+        """
+        Size of a job's file and a function opening it (the extracted tree
+        or, for a cold job, its pack)
+
+        Returns:
+            tuple: (size, function returning a binary file object)
+
+        Raises:
+            FileNotFoundError: No such file in the job
+        """
+        from app.services.cold_storage import cold_storage_service
+
+        pack = cold_storage_service.get(job_id)
+        if pack is not None:
+            relative_path = posixpath.normpath(file_path)
+            member = None if relative_path.startswith(('/', '..')) else pack.resolve(relative_path)
+            if member is None:
+                raise FileNotFoundError(file_path)
+            return pack.size(member), lambda: pack.open(member)
+
+        is_safe, full_path, _ = check_file_access(job_id, file_path)
+        if not is_safe or not full_path or not os.path.isfile(full_path):
+            raise FileNotFoundError(file_path)
+        return os.path.getsize(full_path), lambda: open(full_path, 'rb')
+
+    def unified_diff(self, data_a, data_b, path_a, path_b, context=3):
+        """
+        Lines of a unified diff of two files' contents
+
+        Args:
+            data_a: Text in the base job
+            data_b: Text in the compared job
+            path_a: Label of the base file
+            path_b: Label of the compared file
+            context: Unchanged lines around each change
+
+        Returns:
+            iterator: Diff lines, each ending with a newline
+        """
+        lines_a = data_a.splitlines(keepends=True)
+        lines_b = data_b.splitlines(keepends=True)
+        for line in difflib.unified_diff(lines_a, lines_b, f'a/{path_a}', f'b/{path_b}', n=context):
+            yield line if line.endswith('\n') else line + '\n\\ No newline at end of file\n'
+
+
+# Global job diff service instance
+job_diff_service = JobDiffService()
@@ -0,0 +1,208 @@
+"""
+Job Stats Service
+Index-time summary statistics: extension histogram, size distribution, top-K files
+"""
+
+import heapq
+import json
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import delete, select
+
+from app.database import db_session, engine
+from app.models import FileMetadata, Job, JobStats
+from app.services.directories import directory_service
+from app.services.index_store import index_store
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def is_rhcert_file(name):
+    """Whether a file is a rhcert results XML"""
+    name_lower = name.lower()
+    return name_lower.endswith('.xml') and 'rhcert' in name_lower
+
+
+def is_rhoso_folder(name):
+    """Whether a directory is a RHOSO test folder"""
+    return name.startswith('rhoso')
+
+
+class JobStatsCollector:
+    """
+    Accumulates summary statistics while entries are indexed
+
+    Every add is O(1) (O(log K) for the largest-files heap), so collecting
+    costs nothing noticeable next to the inserts it rides along with.
+    """
+
+    def __init__(self, top_files=None):
+        self.top_files = top_files or settings.JOB_STATS_TOP_FILES
+        self.total_files = 0
+        self.total_directories = 0
+        self.total_size = 0
+        self.extensions = {}  # extension -> [count, bytes]
+        self.size_histogram = Counter()  # size.bit_length() -> count
+        self.rhoso_folders = []
+        self.rhcert_files = []
+        self._largest = []  # min-heap of (size, relative_path)
+
+    def add_directory(self, relative_path, name):
+        """Record an indexed directory"""
+        self.total_directories += 1
+        if is_rhoso_folder(name):
+            self.rhoso_folders.append(relative_path)
+
+    def add_file(self, relative_path, name, size, extension):
+        """Record an indexed file"""
+        size = size or 0
+        self.total_files += 1
+        self.total_size += size
+
+        totals = self.extensions.get(extension or '')
+        if totals is None:
+            totals = self.extensions[extension or ''] = [0, 0]
+        totals[0] += 1
+        totals[1] += size
+
+        self.size_histogram[size.bit_length()] += 1
+        self._push_largest(size, relative_path)
+
+        if is_rhcert_file(name):
+            self.rhcert_files.append(relative_path)
+
+    def _push_largest(self, size, relative_path):
+        if len(self._largest) < self.top_files:
+            heapq.heappush(self._largest, (size, relative_path))
+        elif size > self._largest[0][0]:
+            heapq.heapreplace(self._largest, (size, relative_path))
+
+    def merge(self, record):
+        """
+        Fold a stored JobStats record into this collector
+
+        Args:
+            record: JobStats row (or mapping with its columns)
+        """
+        self.total_files += record.total_files or 0
+        self.total_directories += record.total_directories or 0
+        self.total_size += record.total_size or 0
+
+        for extension, (count, size) in json.loads(record.extensions or '{}').items():
+            totals = self.extensions.setdefault(extension, [0, 0])
+            totals[0] += count
+            totals[1] += size
+        for bucket, count in json.loads(record.size_histogram or '{}').items():
+            self.size_histogram[int(bucket)] += count
+        for relative_path, size in json.loads(record.largest_files or '[]'):
+            self._push_largest(size, relative_path)
+
+        self.rhoso_folders = json.loads(record.rhoso_folders or '[]') + self.rhoso_folders
+        self.rhcert_files = json.loads(record.rhcert_files or '[]') + self.rhcert_files
+
+    def values(self):
+        """Column values of the job_stats row"""
+        return {
+            'total_files': self.total_files,
+            'total_directories': self.total_directories,
+            'total_size': self.total_size,
+            'extensions': json.dumps(self.extensions),
+            'size_histogram': json.dumps({str(bucket): count for bucket, count in sorted(self.size_histogram.items())}),
+            'largest_files': json.dumps([[path, size] for size, path in sorted(self._largest, reverse=True)]),
+            'rhoso_folders': json.dumps(self.rhoso_folders),
+            'rhcert_files': json.dumps(self.rhcert_files),
+            'updated_at': datetime.utcnow(),
+        }
+
+
+class JobStatsService:
+    """Stores and reads per-job summary statistics"""
+
+    def save(self, connection, job_id, collector):
+        """
+        Replace a job's stats with a collector's (full index)
+
+        Args:
+            connection: SQLAlchemy Connection (usually the index load transaction)
+            job_id: UUID of the job
+            collector: JobStatsCollector of the whole job
+        """
+        table = JobStats.__table__
+        connection.execute(delete(table).where(table.c.job_id == job_id))
+        connection.execute(table.insert().values(job_id=job_id, **collector.values()))
+
+    def merge(self, connection, job_id, collector):
+        """
+        Add an incremental index pass to a job's stats
+
+        Jobs without stats are left alone; they are rebuilt from the index
+        (including these rows) the first time they are read.
+
+        Args:
+            connection: SQLAlchemy Connection (usually the index load transaction)
+            job_id: UUID of the job
+            collector: JobStatsCollector of the newly indexed entries
+        """
+        table = JobStats.__table__
+        record = connection.execute(select(table).where(table.c.job_id == job_id)).first()
+        if record is None:
+            return
+
+        collector.merge(record)
+        connection.execute(table.update().where(table.c.job_id == job_id).values(**collector.values()))
+
+    def get(self, job_id):
+        """
+        Stats of a job, rebuilt from its index if it has none yet
+
+        Args:
+            job_id: UUID of the job
+
+        Returns:
+            JobStats: Stats record, or None while the job is being indexed (its
+                index load writes the stats when it commits)
+        """
+        from app.services.job_control import job_control_service
+
+        stats = db_session.get(JobStats, job_id)
+        if stats is None:
+            status = db_session.query(Job.status).filter_by(id=job_id).scalar()
+            if status != 'completed' or job_control_service.is_running(job_id):
+                return None
+            self.rebuild(job_id)
+            stats = db_session.get(JobStats, job_id)
+        return stats
+
+    def rebuild(self, job_id):
+        """
+        Recompute a job's stats from its indexed rows (jobs indexed before stats existed)
+
+        Args:
+            job_id: UUID of the job
+        """
+        collector = JobStatsCollector()
+        dir_map = directory_service.path_map(job_id)
+
+        for relative_path in dir_map.ids:
+            if relative_path:
+                collector.add_directory(relative_path, relative_path.rpartition('/')[2])
+
+        with index_store.engine(job_id).connect() as connection:
+            rows = connection.execute(
+                select(FileMetadata.parent_id, FileMetadata.name, FileMetadata.size, FileMetadata.extension)
+                .where(FileMetadata.job_id == job_id)
+            )
+            for parent_id, name, size, extension in rows:
+                collector.add_file(dir_map.file_path(parent_id, name), name, size, extension)
+
+        with engine.begin() as connection:
+            self.save(connection, job_id, collector)
+
+        logger.info(f"Rebuilt summary stats for job {job_id} ({collector.total_files} files)")
+
+
+# Global job stats service instance
+job_stats_service = JobStatsService()
@@ -0,0 +1,158 @@
+"""
+Job Writer Service
+Single background writer that owns Job row updates
+"""
+
+import threading
+from datetime import datetime
+
+from sqlalchemy import update
+
+from app.database import engine
+from app.models import Job
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Job columns an update may set (other fields, e.g. live throughput, are progress-bus only)
+JOB_COLUMNS = frozenset(Job.__table__.columns.keys()) - {'id'}
+
+# Consecutive failed writes of a batch before it is dropped
+MAX_WRITE_ATTEMPTS = 3
+
+
+class JobWriter:
+    """
+    Coalesces Job updates and writes them from one thread
+
+    Workers hand their updates over instead of committing on the shared
+    session. Only the latest value of each column per job is kept, and all
+    pending jobs are written as one short transaction every JOB_WRITE_INTERVAL
+    seconds - or right away for urgent updates (status transitions). Many
+    concurrent extractions therefore cost one small write per interval
+    instead of a SELECT and commit per message, and never hold the database
+    lock while an index load is waiting for it.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = settings.JOB_WRITE_INTERVAL if interval is None else interval
+        self._pending = {}  # job_id -> {column: value}
+        self._urgent = False
+        self._submitted = 0  # updates handed over so far
+        self._written = 0  # updates written (or given up on)
+        self._failures = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def update(self, job_id, urgent=False, **fields):
+        """
+        Queue column values for a job's row
+
+        Args:
+            job_id: UUID of the job
+            urgent: Write without waiting for the interval (state transitions)
+            **fields: Job column values; unknown keys are ignored
+        """
+        fields = {key: value for key, value in fields.items() if key in JOB_COLUMNS}
+        if fields:
+            self._queue(job_id, dict(fields, updated_at=datetime.utcnow()), urgent)
+
+    def touch(self, job_id, accessed_at):
+        """
+        Queue a job's last access time (does not count as a change to the job)
+
+        Args:
+            job_id: UUID of the job
+            accessed_at: Access time (UTC)
+        """
+        self._queue(job_id, {'last_accessed_at': accessed_at}, False)
+
+    def _queue(self, job_id, fields, urgent):
+        """Merge column values into the job's pending update"""
+        with self._cond:
+            self._pending.setdefault(job_id, {}).update(fields)
+            self._submitted += 1
+            if urgent:
+                self._urgent = True
+                self._cond.notify_all()
+            self._ensure_thread()
+
+    def flush(self, timeout=None):
+        """
+        Wait until every update queued so far has been written
+
+        Args:
+            timeout: Seconds to wait at most (None waits indefinitely)
+
+        Returns:
+            bool: True if everything was written in time
+        """
+        with self._cond:
+            target = self._submitted
+            if self._written >= target:
+                return True
+            self._urgent = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._written >= target, timeout)
+
+    def discard(self, job_id):
+        """Drop a job's pending updates (the job is being deleted)"""
+        with self._cond:
+            self._pending.pop(job_id, None)
+
+    def _ensure_thread(self):
+        """Start the writer thread on first use (caller holds the condition)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='job-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Writer loop: wait for updates, let them coalesce for an interval, write"""
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                if not self._urgent:
+                    self._cond.wait_for(lambda: self._urgent, self.interval)
+                batch, self._pending = self._pending, {}
+                submitted = self._submitted
+                self._urgent = False
+
+            written = self._write(batch)
+
+            with self._cond:
+                if written or self._failures >= MAX_WRITE_ATTEMPTS:
+                    self._failures = 0
+                    self._written = submitted
+                    self._cond.notify_all()
+                else:
+                    # Newer values queued meanwhile win over the failed ones
+                    for job_id, fields in batch.items():
+                        self._pending[job_id] = {**fields, **self._pending.get(job_id, {})}
+
+    def _write(self, batch):
+        """
+        Write one batch of coalesced updates in a single transaction
+
+        Returns:
+            bool: True on success
+        """
+        table = Job.__table__
+        try:
+            with engine.begin() as connection:
+                for job_id, fields in batch.items():
+                    # Access-only updates keep updated_at (the column's onupdate would bump it)
+                    fields.setdefault('updated_at', table.c.updated_at)
+                    connection.execute(update(table).where(table.c.id == job_id).values(**fields))
+            return True
+        except Exception as e:
+            self._failures += 1
+            if self._failures >= MAX_WRITE_ATTEMPTS:
+                logger.error(f"Dropping updates of {len(batch)} jobs after {self._failures} failed writes: {e}")
+            else:
+                logger.warning(f"Job update write failed, retrying: {e}")
+            return False
+
+
+# Global job writer instance
+job_writer = JobWriter()
@@ -0,0 +1,408 @@
+"""
+Manifest Service
+Memory-mapped per-job file manifests for browsing without the database
+
+A manifest is a read-only columnar snapshot of a job's index, written when
+indexing finishes. Directories are stored breadth-first with each
+directory's children contiguous and sorted, files are grouped by directory,
+so a listing is a slice of a few typed arrays (memoryview casts over the
+mmap - nothing is parsed when a manifest is opened).
+"""
+
+import mmap
+import os
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+
+from app.models import Directory, DirectoryStats, FileMetadata
+from app.services.index_store import index_store
+from app.utils.security import get_file_size_human
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'FPMF'
+VERSION = 1
+
+# magic, version, directories, files, extensions, browse root directory
+HEADER = struct.Struct('<4sIIIIi')
+
+# (name, array typecode or None for a UTF-8 blob)
+SECTIONS = (
+    ('dir_parent', 'i'),        # parent directory index, -1 for the root
+    ('dir_path_offsets', 'Q'),  # n_dirs + 1 offsets into dir_paths
+    ('dir_paths', None),
+    ('dir_child_start', 'I'),   # children of d: [child_start[d], child_start[d + 1])
+    ('dir_file_start', 'I'),    # files of d: [file_start[d], file_start[d + 1])
+    ('dir_file_count', 'Q'),    # recursive (directory_stats)
+    ('dir_total_size', 'Q'),    # recursive bytes (directory_stats)
+    ('file_name_offsets', 'Q'), # n_files + 1 offsets into file_names
+    ('file_names', None),
+    ('file_sizes', 'q'),        # -1 for unknown
+    ('file_exts', 'I'),         # index into the extension table, 0 for none
+    ('ext_offsets', 'Q'),       # n_exts + 1 offsets into ext_names
+    ('ext_names', None),
+)
+SECTION_TABLE = struct.Struct('<' + 'QQ' * len(SECTIONS))
+
+
+def _sort_key(name):
+    """Order of entries within a directory (case-insensitive, like the browse listing)"""
+    return (name.lower(), name)
+
+
+def _blob(strings):
+    """UTF-8 blob and offsets array of a list of strings"""
+    offsets = array('Q', [0])
+    chunks = []
+    position = 0
+    for string in strings:
+        encoded = string.encode('utf-8')
+        chunks.append(encoded)
+        position += len(encoded)
+        offsets.append(position)
+    return b''.join(chunks), offsets
+
+
+class Manifest:
+    """Read-only view of one manifest file"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            stat = os.fstat(f.fileno())
+        self.signature = (stat.st_ino, stat.st_mtime_ns)
+
+        view = memoryview(self._mm)
+        magic, version, self.n_dirs, self.n_files, self.n_exts, self.browse_root = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'Not a version {VERSION} manifest: {path}')
+
+        table = SECTION_TABLE.unpack_from(view, HEADER.size)
+        for i, (name, typecode) in enumerate(SECTIONS):
+            offset, length = table[2 * i], table[2 * i + 1]
+            section = view[offset:offset + length]
+            setattr(self, name, section.cast(typecode) if typecode else section)
+
+    # Directories
+
+    def dir_path(self, d):
+        """Relative path of directory d ('' for the root)"""
+        return bytes(self.dir_paths[self.dir_path_offsets[d]:self.dir_path_offsets[d + 1]]).decode('utf-8')
+
+    def dir_name(self, d):
+        return self.dir_path(d).rpartition('/')[2]
+
+    def children(self, d):
+        """Indexes of the subdirectories of d (sorted)"""
+        return range(self.dir_child_start[d], self.dir_child_start[d + 1])
+
+    def files(self, d):
+        """Indexes of the files in d (sorted)"""
+        return range(self.dir_file_start[d], self.dir_file_start[d + 1])
+
+    def find_directory(self, relative_path):
+        """
+        Index of a directory by path (binary search down the tree)
+
+        Returns:
+            int: Directory index, or None if there is no such directory
+        """
+        if self.n_dirs == 0:
+            return None
+        d = 0
+        for segment in relative_path.split('/') if relative_path else ():
+            key = _sort_key(segment)
+            low, high = self.dir_child_start[d], self.dir_child_start[d + 1]
+            while low < high:
+                middle = (low + high) // 2
+                if _sort_key(self.dir_name(middle)) < key:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low == self.dir_child_start[d + 1] or self.dir_name(low) != segment:
+                return None
+            d = low
+        return d
+
+    # Files
+
+    def file_name(self, f):
+        return bytes(self.file_names[self.file_name_offsets[f]:self.file_name_offsets[f + 1]]).decode('utf-8')
+
+    def file_size(self, f):
+        size = self.file_sizes[f]
+        return None if size < 0 else size
+
+    def file_extension(self, f):
+        e = self.file_exts[f]
+        if e == 0:
+            return None
+        return bytes(self.ext_names[self.ext_offsets[e - 1]:self.ext_offsets[e]]).decode('utf-8')
+
+    # Listings
+
+    def listing(self, dir_path, sort_by='name', sort_order='asc'):
+        """
+        Sorted entries of a browse listing (same order as sort_items over the items)
+
+        Only (type, index) pairs are sorted; build the items of the page
+        being returned with item().
+
+        Args:
+            dir_path: Directory path ('' lists the first top-level directory, like the database path)
+            sort_by: Item field to sort by
+            sort_order: 'asc' or 'desc'
+
+        Returns:
+            tuple: (list of ('directory' | 'file', index), path of the listed directory)
+        """
+        d = self.find_directory(dir_path) if dir_path else self.browse_root
+        if d is None:
+            return [], dir_path
+        parent_path = self.dir_path(d)
+
+        entries = [('directory', c) for c in self.children(d)] + [('file', f) for f in self.files(d)]
+        reverse = sort_order.lower() == 'desc'
+        try:
+            entries.sort(key=lambda entry: self._sort_value(entry, sort_by, parent_path), reverse=reverse)
+        except (TypeError, KeyError):
+            entries.sort(key=lambda entry: self._sort_value(entry, 'name', parent_path), reverse=reverse)
+        return entries, parent_path
+
+    def _sort_value(self, entry, field, parent_path):
+        kind, index = entry
+        if field == 'name':
+            return self.dir_name(index) if kind == 'directory' else self.file_name(index)
+        if field == 'size':
+            return None if kind == 'directory' else self.file_size(index)
+        return self.item(entry, parent_path).get(field, '')
+
+    # Items (the same dictionaries the database-backed endpoints return)
+
+    def item(self, entry, parent_path):
+        """Item of a listing entry"""
+        kind, index = entry
+        return self.directory_item(index) if kind == 'directory' else self.file_item(index, parent_path)
+
+    def directory_item(self, d):
+        relative_path = self.dir_path(d)
+        return {
+            'name': relative_path.rpartition('/')[2],
+            'path': relative_path,
+            'relative_path': relative_path,
+            'type': 'directory',
+            'size': None,
+            'size_human': 'Directory',
+            'file_count': self.dir_file_count[d],
+            'total_size': self.dir_total_size[d]
+        }
+
+    def file_item(self, f, parent_path):
+        name = self.file_name(f)
+        size = self.file_size(f)
+        relative_path = f'{parent_path}/{name}' if parent_path else name
+        return {
+            'name': name,
+            'path': relative_path,
+            'relative_path': relative_path,
+            'type': 'file',
+            'size': size,
+            'size_human': get_file_size_human(size) if size else 'Unknown',
+            'extension': self.file_extension(f)
+        }
+
+
+class ManifestService:
+    """Writes manifests and keeps recently used ones mapped"""
+
+    def __init__(self, max_jobs=None):
+        self.max_jobs = max_jobs or settings.MANIFEST_CACHE_JOBS
+        self._manifests = OrderedDict()
+        self._lock = threading.Lock()
+
+    def manifest_path(self, job_id):
+        return os.path.join(settings.MANIFEST_FOLDER, f'{job_id}.manifest')
+
+    def get(self, job_id):
+        """
+        Mapped manifest of a job
+
+        Returns:
+            Manifest: Manifest, or None if the job has none (not indexed yet,
+            being re-indexed, or manifests disabled) - use the database then
+        """
+        if not settings.ENABLE_MANIFESTS:
+            return None
+
+        path = self.manifest_path(job_id)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._forget(job_id)
+            return None
+
+        with self._lock:
+            manifest = self._manifests.get(job_id)
+            if manifest is not None and manifest.signature == (stat.st_ino, stat.st_mtime_ns):
+                self._manifests.move_to_end(job_id)
+                return manifest
+
+        try:
+            manifest = Manifest(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable manifest of job {job_id}: {e}")
+            return None
+
+        with self._lock:
+            self._manifests[job_id] = manifest
+            self._manifests.move_to_end(job_id)
+            while len(self._manifests) > self.max_jobs:
+                self._manifests.popitem(last=False)
+        return manifest
+
+    def _forget(self, job_id):
+        # Mapped views are released when the last request using them is done
+        with self._lock:
+            self._manifests.pop(job_id, None)
+
+    def delete(self, job_id):
+        """Remove a job's manifest (its index is about to change or is gone)"""
+        self._forget(job_id)
+        try:
+            os.remove(self.manifest_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def write(self, job_id):
+        """
+        Write a job's manifest from its committed index
+
+        Args:
+            job_id: UUID of the job
+
+        Returns:
+            bool: True if a manifest was written
+        """
+        if not settings.ENABLE_MANIFESTS:
+            return False
+
+        session = index_store.session(job_id)
+        directories = session.query(
+            Directory.id,
+            Directory.parent_id,
+            Directory.name,
+            Directory.relative_path,
+            DirectoryStats.file_count,
+            DirectoryStats.total_size
+        ).outerjoin(
+            DirectoryStats, DirectoryStats.directory_id == Directory.id
+        ).filter(Directory.job_id == job_id).all()
+        files = session.query(
+            FileMetadata.parent_id,
+            FileMetadata.name,
+            FileMetadata.size,
+            FileMetadata.extension
+        ).filter(FileMetadata.job_id == job_id).all()
+
+        data = self._serialize(directories, files)
+        if data is None:
+            return False
+
+        os.makedirs(settings.MANIFEST_FOLDER, exist_ok=True)
+        path = self.manifest_path(job_id)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._forget(job_id)
+
+        logger.info(f"Wrote manifest for job {job_id} ({len(directories)} directories, {len(files)} files, {len(data)} bytes)")
+        return True
+
+    def _serialize(self, directories, files):
+        """Manifest bytes of a job's directory and file rows, or None without a root directory"""
+        children = {}
+        root = None
+        for row in directories:
+            if row.parent_id is None:
+                root = row
+            else:
+                children.setdefault(row.parent_id, []).append(row)
+        if root is None:
+            return None
+
+        # Breadth-first, each directory's children sorted: children are contiguous
+        order = [root]
+        child_start = array('I')
+        position = 0
+        while position < len(order):
+            child_start.append(len(order))
+            order.extend(sorted(children.get(order[position].id, ()), key=lambda row: _sort_key(row.name)))
+            position += 1
+        child_start.append(len(order))
+        index_of = {row.id: position for position, row in enumerate(order)}
+
+        # The browse root listing starts at the first top-level directory created
+        top_level = children.get(root.id)
+        browse_root = index_of[min(row.id for row in top_level)] if top_level else 0
+
+        files_by_dir = {}
+        for row in files:
+            if row.parent_id in index_of:
+                files_by_dir.setdefault(index_of[row.parent_id], []).append(row)
+
+        file_start = array('I', [0])
+        file_rows = []
+        for position in range(len(order)):
+            file_rows.extend(sorted(files_by_dir.get(position, ()), key=lambda row: _sort_key(row.name)))
+            file_start.append(len(file_rows))
+
+        extensions = {}
+        file_exts = array('I')
+        for row in file_rows:
+            if not row.extension:
+                file_exts.append(0)
+            else:
+                file_exts.append(extensions.setdefault(row.extension, len(extensions) + 1))
+
+        dir_paths, dir_path_offsets = _blob(row.relative_path for row in order)
+        file_names, file_name_offsets = _blob(row.name for row in file_rows)
+        ext_names, ext_offsets = _blob(extensions)
+
+        columns = {
+            'dir_parent': array('i', (-1 if row.parent_id is None else index_of[row.parent_id] for row in order)),
+            'dir_path_offsets': dir_path_offsets,
+            'dir_paths': dir_paths,
+            'dir_child_start': child_start,
+            'dir_file_start': file_start,
+            'dir_file_count': array('Q', (row.file_count or 0 for row in order)),
+            'dir_total_size': array('Q', (row.total_size or 0 for row in order)),
+            'file_name_offsets': file_name_offsets,
+            'file_names': file_names,
+            'file_sizes': array('q', (-1 if row.size is None else row.size for row in file_rows)),
+            'file_exts': file_exts,
+            'ext_offsets': ext_offsets,
+            'ext_names': ext_names,
+        }
+
+        # Sections are 8-byte aligned for the typed views
+        body = bytearray()
+        table = []
+        start = HEADER.size + SECTION_TABLE.size
+        for name, _ in SECTIONS:
+            padding = -(start + len(body)) % 8
+            body += b'\0' * padding
+            chunk = columns[name] if isinstance(columns[name], bytes) else columns[name].tobytes()
+            table.extend((start + len(body), len(chunk)))
+            body += chunk
+
+        header = HEADER.pack(MAGIC, VERSION, len(order), len(file_rows), len(extensions), browse_root)
+        return header + SECTION_TABLE.pack(*table) + bytes(body)
+
+
+# Global manifest service instance
+manifest_service = ManifestService()
@@ -0,0 +1,215 @@
+"""
+Path Index Service
+Trigram index of a job's file and directory paths for substring and regex search
+"""
+
+import re
+
+from sqlalchemy import select, text
+
+from app.models import Directory, FileMetadata
+from app.services.directories import directory_service
+from app.services.index_store import index_store
+from app.services.post_index import FtsStage, post_index_pipeline
+from app.utils.trigram_plan import TRIGRAM, fts_phrase, regex_expression
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Candidates fetched per index query
+SCAN_BATCH = 500
+
+
+class PathSearchError(ValueError):
+    """The search pattern is not a valid regular expression"""
+    pass
+
+
+class PathIndexService(FtsStage):
+    """
+    Trigram path index stage and path search
+
+    Every file (rowid = file id) and directory (rowid = -directory id) of
+    a job is added to an FTS5 table with the trigram tokenizer. A search
+    turns the query - a substring, or the literals a regular expression
+    requires - into a trigram MATCH that narrows the candidates, verifies
+    each candidate path, and pages through them in rowid order with a
+    cursor, so no more than a page of matches is ever materialized.
+
+    Until a job's path index is built, candidates come from the index
+    tables in the same order (same results, without the narrowing).
+    """
+
+    name = 'path_index'
+    table = 'path_trigrams'
+    columns = ('path', 'job_id')
+    tokenize = 'trigram'
+    reads_content = False
+
+    def enabled(self, index_engine):
+        """Whether paths are indexed for jobs in index_engine"""
+        return settings.PATH_INDEX and super().enabled(index_engine)
+
+    def process(self, connection, job_id, files):
+        """
+        Add the paths of a batch of files to the index
+
+        Returns:
+            tuple: (files indexed, 0)
+        """
+        self.ensure_table(connection)
+        connection.execute(text(
+            f'INSERT OR REPLACE INTO {self.table} (rowid, path, job_id) VALUES (:id, :path, :job_id)'
+        ), [{'id': item.id, 'path': item.path, 'job_id': job_id} for item in files])
+        return len(files), 0
+
+    def finish(self, connection, job_id):
+        """Add the job's directories not indexed yet (ids only grow, so newer than the newest indexed)"""
+        self.ensure_table(connection)
+        newest = connection.execute(text(
+            f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH :match AND rowid < 0 ORDER BY rowid LIMIT 1'
+        ), {'match': self.job_filter(job_id)}).scalar()
+
+        table = Directory.__table__
+        rows = connection.execute(
+            select(table.c.id, table.c.relative_path).where(
+                table.c.job_id == job_id, table.c.parent_id != None, table.c.id > -(newest or 0))
+        ).all()
+        if rows:
+            connection.execute(text(
+                f'INSERT OR REPLACE INTO {self.table} (rowid, path, job_id) VALUES (:id, :path, :job_id)'
+            ), [{'id': -directory_id, 'path': path, 'job_id': job_id} for directory_id, path in rows])
+
+    def remove(self, connection, job_id, file_ids, directory_ids):
+        """Remove the rows of removed files and directories"""
+        self.remove_rowids(connection, list(file_ids) + [-directory_id for directory_id in directory_ids])
+
+    def search(self, job_id, query, regex=False, ignore_case=True, file_type=None,
+               cursor=None, limit=None, scan_limit=None):
+        """
+        Paths of a job containing a substring or matching a regular expression
+
+        Args:
+            job_id: UUID of the job
+            query: Substring, or regular expression (searched anywhere in the path)
+            regex: Treat query as a regular expression
+            ignore_case: Case-insensitive matching
+            file_type: Optional filter ('file' or 'directory')
+            cursor: next_cursor of the previous page (None for the first)
+            limit: Maximum matches to return (None for all)
+            scan_limit: Maximum candidates to verify in this call (None for no limit)
+
+        Returns:
+            tuple: (matches as (rowid, path) in rowid order, next_cursor or None when done)
+
+        Raises:
+            PathSearchError: Invalid regular expression
+        """
+        flags = re.IGNORECASE if ignore_case else 0
+        if regex:
+            try:
+                pattern = re.compile(query, flags)
+                expression = regex_expression(query, flags)
+            except (re.error, RecursionError) as e:
+                raise PathSearchError(f'Invalid regular expression: {e}')
+            matches_path = pattern.search
+        else:
+            expression = fts_phrase(query) if len(query) >= TRIGRAM else None
+            if ignore_case:
+                needle = query.lower()
+                matches_path = lambda path: needle in path.lower()
+            else:
+                matches_path = lambda path: query in path
+
+        index_engine = index_store.engine(job_id)
+        candidates = (self._indexed_candidates
+                      if self.enabled(index_engine) and post_index_pipeline.status(job_id, self.name) == 'complete'
+                      else self._table_candidates)
+
+        after = int(cursor) if cursor else None
+        matches = []
+        scanned = 0
+        while True:
+            batch = candidates(index_engine, job_id, expression, file_type, after)
+            for rowid, path in batch:
+                scanned += 1
+                after = rowid
+                if matches_path(path):
+                    matches.append((rowid, path))
+                    if limit is not None and len(matches) >= limit:
+                        return matches, str(after)
+                if scan_limit is not None and scanned >= scan_limit:
+                    return matches, str(after)
+            if len(batch) < SCAN_BATCH:
+                return matches, None
+
+    def items(self, job_id, matches):
+        """
+        File and directory dictionaries of search matches
+
+        Args:
+            job_id: UUID of the job
+            matches: (rowid, path) tuples from search()
+
+        Returns:
+            list: Item dictionaries in match order
+        """
+        session = index_store.session(job_id)
+        dir_map = directory_service.path_map(job_id)
+        file_ids = [rowid for rowid, _ in matches if rowid > 0]
+        directory_ids = [-rowid for rowid, _ in matches if rowid < 0]
+
+        found = {}
+        for start in range(0, len(file_ids), SCAN_BATCH):
+            for f in session.query(FileMetadata).filter(FileMetadata.id.in_(file_ids[start:start + SCAN_BATCH])):
+                found[f.id] = f.to_dict(dir_map.path_of(f.parent_id) or '')
+        for start in range(0, len(directory_ids), SCAN_BATCH):
+            for d in session.query(Directory).filter(Directory.id.in_(directory_ids[start:start + SCAN_BATCH])):
+                found[-d.id] = d.to_dict()
+        return [found[rowid] for rowid, _ in matches if rowid in found]
+
+    def _indexed_candidates(self, index_engine, job_id, expression, file_type, after):
+        """Next batch of candidates narrowed by the trigram index"""
+        match = self.job_filter(job_id)
+        if expression:
+            match = f'path : ({expression}) AND {match}'
+        conditions = [f'{self.table} MATCH :match']
+        if after is not None:
+            conditions.append('rowid > :after')
+        if file_type == 'file':
+            conditions.append('rowid > 0')
+        elif file_type == 'directory':
+            conditions.append('rowid < 0')
+
+        with index_engine.connect() as connection:
+            return connection.execute(text(
+                f'SELECT rowid, path FROM {self.table} WHERE {" AND ".join(conditions)} '
+                f'ORDER BY rowid LIMIT {SCAN_BATCH}'
+            ), {'match': match, 'after': after}).all()
+
+    def _table_candidates(self, index_engine, job_id, expression, file_type, after):
+        """Next batch of candidates from the index tables (every path of the job, in rowid order)"""
+        dir_map = directory_service.path_map(job_id)
+        batch = []
+        if file_type != 'file' and (after is None or after < 0):
+            directories = sorted(-directory_id for directory_id, path in dir_map.paths.items() if path)
+            batch = [(rowid, dir_map.path_of(-rowid)) for rowid in directories
+                     if after is None or rowid > after][:SCAN_BATCH]
+        if len(batch) == SCAN_BATCH or file_type == 'directory':
+            return batch
+
+        table = FileMetadata.__table__
+        with index_engine.connect() as connection:
+            rows = connection.execute(
+                select(table.c.id, table.c.parent_id, table.c.name)
+                .where(table.c.job_id == job_id, table.c.id > max(after or 0, 0))
+                .order_by(table.c.id)
+                .limit(SCAN_BATCH - len(batch))
+            ).all()
+        return batch + [(file_id, dir_map.file_path(parent_id, name)) for file_id, parent_id, name in rows]
+
+
+# Global path index service instance
+path_index_service = PathIndexService()
+post_index_pipeline.register(path_index_service)
@@ -0,0 +1,600 @@
+"""
+Post-Index Pipeline
+Background stages that read a job's files after the job is browsable
+"""
+
+import threading
+import weakref
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import func, select, text
+
+from app.database import db_session, engine
+from app.models import Job, FileMetadata, PostIndexState
+from app.services.directories import directory_service
+from app.services.index_store import index_store
+from app.services.stage_timing import stage_timing_service, StageSample
+from app.utils.security import check_file_access
+from app.utils.trigram_plan import fts_phrase
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A file handed to the stages: index row, its leading bytes (None if too large or
+# unreadable) and what each stage's prepare() returned for it, by stage name
+IndexedFile = namedtuple('IndexedFile', ['id', 'path', 'size', 'data', 'prepared'], defaults=(None,))
+
+# Seconds JobControlService.cleanup_job_data waits for a job's run to stop
+CANCEL_TIMEOUT = 30
+
+# Bytes read at a time from a file fed to the stages' chunk consumers
+READ_CHUNK = 1024 * 1024
+
+
+class ChunkConsumer:
+    """
+    Per-file work of a stage over the whole content of a file
+
+    A stage's prepare() returns one for a file that item.data does not
+    hold entirely; the reader then reads the file once, feeding each chunk
+    to the consumers of every stage, and hands result() to process().
+    """
+
+    def update(self, chunk):
+        """
+        Take in the next chunk of the file
+
+        Returns:
+            bool: True once the rest of the file is not needed
+        """
+        raise NotImplementedError
+
+    def result(self):
+        """Value handed to process() as item.prepared[stage name], once the file is read"""
+        raise NotImplementedError
+
+
+class PostIndexStage:
+    """
+    A stage of the post-index pipeline
+
+    Subclasses set name (the PostIndexState key and stage timing name) and
+    implement process(); delete() removes what the stage wrote for a job
+    whose index lives in the main database (a shard is dropped as a whole),
+    remove() what it wrote for files and directories dropped from an index
+    that is updated in place (see IndexingService.update_paths).
+    Stages that only need the index rows set reads_content = False; files
+    are then not read unless another stage needs them. Stages that set
+    main_database = True write the main database for every job (sharded
+    or not): process() and finish() get a connection to it, and delete()
+    is called for every job.
+    """
+
+    name = None
+    reads_content = True
+    main_database = False
+
+    def enabled(self, index_engine):
+        """Whether the stage runs for a job whose index is in index_engine"""
+        return True
+
+    def prepare(self, job_id, item, open_file):
+        """
+        Per-file work done in the reader threads, outside the batch's
+        transaction (only called when files are read; see reads_content)
+
+        Args:
+            job_id: UUID of the job
+            item: IndexedFile (data holds at most CONTENT_INDEX_MAX_FILE_SIZE bytes)
+            open_file: Function returning a binary file object of the whole file
+
+        Returns:
+            Value handed to process() as item.prepared[self.name] (None: nothing
+            to hand over), or a ChunkConsumer to be fed the whole file - files
+            are then read once for all stages rather than through open_file()
+            by each
+        """
+        return None
+
+    def process(self, connection, job_id, files):
+        """
+        Take in a batch of files
+
+        Args:
+            connection: Connection of the batch's transaction on the job's index
+                database (the main database for main_database stages)
+            job_id: UUID of the job
+            files: IndexedFile list, in id order
+
+        Returns:
+            tuple: (files taken in, bytes taken in)
+        """
+        raise NotImplementedError
+
+    def finish(self, connection, job_id):
+        """Called in its own transaction once all of a job's files are processed"""
+        pass
+
+    def delete(self, job_id):
+        """Remove the stage's rows of a job from the main database"""
+        pass
+
+    def remove(self, connection, job_id, file_ids, directory_ids):
+        """
+        Remove the stage's rows of files and directories dropped from a job's index
+
+        Args:
+            connection: Connection of a transaction on the job's index database
+                (the main database for main_database stages)
+            job_id: UUID of the job
+            file_ids: Ids of the removed FileMetadata rows
+            directory_ids: Ids of the removed Directory rows
+        """
+        pass
+
+
+class FtsStage(PostIndexStage):
+    """
+    Stage writing an SQLite FTS5 table in the job's index database
+
+    Subclasses set table and columns (the last column must be job_id, which
+    is indexed so a MATCH can be restricted to one job in the shared main
+    database) and optionally tokenize. FTS5 is SQLite only, so the stage
+    is disabled for jobs indexed in a server database.
+    """
+
+    table = None
+    columns = ()
+    tokenize = None
+
+    def __init__(self):
+        self._ready = weakref.WeakSet()  # engines whose database has the table
+
+    def enabled(self, index_engine):
+        return index_engine.dialect.name == 'sqlite'
+
+    def ensure_table(self, connection):
+        """Create the FTS5 table in the connection's database if needed"""
+        if connection.engine in self._ready:
+            return
+        options = f", tokenize='{self.tokenize}'" if self.tokenize else ''
+        connection.execute(text(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5({", ".join(self.columns)}{options})'
+        ))
+        self._ready.add(connection.engine)
+
+    def has_table(self, connection):
+        """Whether the connection's database has the FTS5 table"""
+        if connection.engine in self._ready:
+            return True
+        return connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+        ), {'name': self.table}).first() is not None
+
+    def job_filter(self, job_id):
+        """MATCH expression selecting a job's rows"""
+        return f'job_id : {fts_phrase(job_id)}'
+
+    def delete(self, job_id):
+        """Remove a job's rows from the main database's table (in short transactions)"""
+        if not self.enabled(engine):
+            return
+
+        while True:
+            with engine.begin() as connection:
+                if not self.has_table(connection):
+                    return
+                deleted = connection.execute(text(
+                    f'DELETE FROM {self.table} WHERE rowid IN ('
+                    f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH :match LIMIT :limit)'
+                ), {'match': self.job_filter(job_id), 'limit': settings.DELETE_BATCH_ROWS}).rowcount
+            if deleted < settings.DELETE_BATCH_ROWS:
+                return
+
+    def remove(self, connection, job_id, file_ids, directory_ids):
+        """Remove the rows of removed files (rowid = file id)"""
+        self.remove_rowids(connection, file_ids)
+
+    def remove_rowids(self, connection, rowids):
+        """Delete rows of the FTS5 table by rowid"""
+        if not rowids or not self.has_table(connection):
+            return
+        connection.execute(text(f'DELETE FROM {self.table} WHERE rowid = :rowid'),
+                           [{'rowid': rowid} for rowid in rowids])
+
+
+class PostIndexPipeline:
+    """
+    Runs the registered stages over every indexed file of a job
+
+    Jobs are queued once their index is committed (and again when nested
+    extraction adds files), so stages never delay time-to-browse. One
+    background thread works through the queue; a job's files are read once,
+    by CONTENT_INDEX_WORKERS threads, and each batch is handed to all
+    stages in one short transaction on the job's index database. Progress
+    is a per-stage file id watermark in PostIndexState, so an interrupted
+    run (restart, cancelled job) resumes where it stopped.
+    """
+
+    def __init__(self):
+        self._stages = []
+        self._queue = deque()
+        self._current = None
+        self._cancelled = set()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def register(self, stage):
+        """Add a stage (stages run in registration order)"""
+        if stage not in self._stages:
+            self._stages.append(stage)
+
+    def submit(self, job_id):
+        """
+        Queue a job whose index was created or extended
+
+        Args:
+            job_id: UUID of the job
+        """
+        if not self._stages:
+            return
+
+        # Completed stages have files to catch up on
+        db_session.query(PostIndexState).filter_by(job_id=job_id).update(
+            {PostIndexState.completed_at: None}, synchronize_session=False)
+        db_session.commit()
+
+        with self._cond:
+            self._cancelled.discard(job_id)
+            if job_id not in self._queue:
+                self._queue.append(job_id)
+                self._cond.notify_all()
+            self._ensure_thread()
+
+    def cancel(self, job_id, timeout=CANCEL_TIMEOUT):
+        """
+        Stop processing a job (it is being deleted or re-indexed)
+
+        Waits until a run in progress has finished its current batch.
+
+        Args:
+            job_id: UUID of the job
+            timeout: Seconds to wait at most
+        """
+        with self._cond:
+            try:
+                self._queue.remove(job_id)
+            except ValueError:
+                pass
+            if self._current == job_id:
+                self._cancelled.add(job_id)
+                self._cond.wait_for(lambda: self._current != job_id, timeout)
+
+    def is_pending(self, job_id):
+        """Whether a job is queued or being processed"""
+        with self._cond:
+            return job_id == self._current or job_id in self._queue
+
+    def resume(self):
+        """Queue completed jobs that a stage has not finished (e.g. after a restart)"""
+        if not self._stages:
+            return
+
+        finished = {}
+        for job_id, stage in db_session.query(PostIndexState.job_id, PostIndexState.stage).filter(
+                PostIndexState.completed_at != None):
+            finished.setdefault(job_id, set()).add(stage)
+        stage_names = {stage.name for stage in self._stages}
+        job_ids = [job_id for (job_id,) in db_session.query(Job.id).filter(Job.status == 'completed')
+                   .order_by(Job.created_at.desc()) if not stage_names <= finished.get(job_id, set())]
+        db_session.rollback()
+
+        with self._cond:
+            for job_id in job_ids:
+                if job_id not in self._queue:
+                    self._queue.append(job_id)
+            if job_ids:
+                self._cond.notify_all()
+                self._ensure_thread()
+        if job_ids:
+            logger.info(f"Resuming post-index stages of {len(job_ids)} jobs")
+
+    def status(self, job_id, stage_name):
+        """
+        State of a stage for a job
+
+        Returns:
+            str: 'complete', 'pending' or 'disabled'
+        """
+        stage = next((stage for stage in self._stages if stage.name == stage_name), None)
+        if stage is None or not stage.enabled(index_store.engine(job_id)):
+            return 'disabled'
+        completed_at = db_session.query(PostIndexState.completed_at).filter_by(
+            job_id=job_id, stage=stage_name).scalar()
+        return 'complete' if completed_at else 'pending'
+
+    def remove(self, job_id, file_ids, directory_ids=()):
+        """
+        Remove what the stages wrote for files and directories dropped from
+        a job's index, one transaction per database
+
+        The job's run must be stopped first (cancel()), and once the rows
+        are deleted, the job rewound (rewind()) and submitted again, so no
+        batch still holding the files commits later and no new file is missed.
+
+        Args:
+            job_id: UUID of the job
+            file_ids: Ids of the removed FileMetadata rows
+            directory_ids: Ids of the removed Directory rows
+        """
+        index_engine = index_store.engine(job_id)
+        databases = {}
+        for stage in self._stages:
+            if stage.enabled(index_engine):
+                databases.setdefault(engine if stage.main_database else index_engine, []).append(stage)
+
+        for database, stages in databases.items():
+            with database.begin() as connection:
+                for stage in stages:
+                    stage.remove(connection, job_id, list(file_ids), list(directory_ids))
+
+    def rewind(self, job_id):
+        """
+        Lower a job's watermarks to the highest file id in use after rows were removed
+
+        SQLite reuses the ids above the highest remaining row, so files
+        added later could otherwise get ids the stages have already passed.
+        Commits db_session.
+        """
+        table = FileMetadata.__table__
+        with index_store.engine(job_id).connect() as connection:
+            highest = connection.execute(select(func.max(table.c.id))).scalar() or 0
+        db_session.query(PostIndexState).filter(
+            PostIndexState.job_id == job_id, PostIndexState.last_file_id > highest
+        ).update({PostIndexState.last_file_id: highest}, synchronize_session=False)
+        db_session.commit()
+
+    def delete(self, job_id):
+        """Remove what the stages wrote for a job in the main database (a shard is dropped as a whole)"""
+        sharded = index_store.is_sharded(job_id)
+        for stage in self._stages:
+            if stage.main_database or not sharded:
+                stage.delete(job_id)
+
+    def _ensure_thread(self):
+        """Start the worker thread on first use (caller holds the condition)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='post-index', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Worker loop: process queued jobs one at a time"""
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue)
+                job_id = self._current = self._queue.popleft()
+
+            try:
+                self._process(job_id)
+            except Exception as e:
+                logger.error(f"Post-index stages failed for job {job_id}: {e}", exc_info=True)
+                db_session.rollback()
+            finally:
+                db_session.remove()
+                index_store.remove_sessions()
+                with self._cond:
+                    self._current = None
+                    self._cancelled.discard(job_id)
+                    self._cond.notify_all()
+
+    def _is_cancelled(self, job_id):
+        with self._cond:
+            return job_id in self._cancelled
+
+    def _process(self, job_id):
+        """Run every enabled stage over the job's files it has not seen yet"""
+        index_engine = index_store.engine(job_id)
+        stages = [stage for stage in self._stages if stage.enabled(index_engine)]
+        if not stages or db_session.query(Job.id).filter_by(id=job_id).first() is None:
+            return
+
+        states = {state.stage: state for state in
+                  db_session.query(PostIndexState).filter_by(job_id=job_id)}
+        for stage in stages:
+            if stage.name not in states:
+                states[stage.name] = PostIndexState(job_id=job_id, stage=stage.name,
+                                                    last_file_id=0, files=0, bytes=0)
+                db_session.add(states[stage.name])
+        db_session.commit()
+
+        read_sample = StageSample(job_id, 'post_index_read')
+        samples = {stage.name: StageSample(job_id, stage.name) for stage in stages}
+        watermark = min(states[stage.name].last_file_id for stage in stages)
+        readers = [stage for stage in stages if stage.reads_content]
+        files = read_bytes = 0
+
+        # Each batch runs in one transaction per database written
+        databases = {}
+        for stage in stages:
+            databases.setdefault(engine if stage.main_database else index_engine, []).append(stage)
+
+        try:
+            with ThreadPoolExecutor(max_workers=settings.CONTENT_INDEX_WORKERS,
+                                    thread_name_prefix='post-index-read') as pool:
+                while not self._is_cancelled(job_id):
+                    # Stages catching up to the readers (e.g. newly added) do not need the files read
+                    read_from = min((states[stage.name].last_file_id for stage in readers), default=None)
+                    reads_content = read_from is not None and watermark >= read_from
+                    rows = self._next_batch(index_engine, job_id, watermark, reads_content,
+                                            None if reads_content else read_from)
+                    if not rows and not reads_content and read_from is not None:
+                        watermark = read_from
+                        continue
+                    if not rows:
+                        break
+
+                    if reads_content:
+                        with read_sample.measure():
+                            batch = list(pool.map(self._reader(job_id, stages), rows))
+                    else:
+                        batch = [IndexedFile(file_id, path, size, None) for file_id, path, size in rows]
+                    files += len(batch)
+                    read_bytes += sum(len(item.data) for item in batch if item.data is not None)
+
+                    for database, database_stages in databases.items():
+                        with database.begin() as connection:
+                            for stage in database_stages:
+                                state = states[stage.name]
+                                new_files = [item for item in batch if item.id > state.last_file_id]
+                                if not new_files:
+                                    continue
+                                with samples[stage.name].measure():
+                                    taken, taken_bytes = stage.process(connection, job_id, new_files)
+                                state.files += taken
+                                state.bytes += taken_bytes
+
+                    # The stages' rows are committed; a crash from here re-runs the batch (stages upsert)
+                    watermark = batch[-1].id
+                    for stage in stages:
+                        states[stage.name].last_file_id = max(states[stage.name].last_file_id, watermark)
+                    db_session.commit()
+
+            if not self._is_cancelled(job_id):
+                for database, database_stages in databases.items():
+                    with database.begin() as connection:
+                        for stage in database_stages:
+                            with samples[stage.name].measure():
+                                stage.finish(connection, job_id)
+                now = datetime.utcnow()
+                for stage in stages:
+                    states[stage.name].completed_at = now
+                db_session.commit()
+                logger.info(f"Post-index stages {', '.join(samples)} done for job {job_id} "
+                            f"({files} files, {read_bytes} bytes read in {read_sample.wall_seconds:.1f}s)")
+        finally:
+            read_sample.bytes_processed = read_bytes
+            read_sample.items = files
+            if files:
+                if reads_content:
+                    stage_timing_service.record(read_sample)
+                for stage in stages:
+                    samples[stage.name].items = files
+                    stage_timing_service.record(samples[stage.name])
+
+    def _next_batch(self, index_engine, job_id, after_id, reads_content=True, until_id=None):
+        """
+        Next files of a job in id order, up to POST_INDEX_BATCH_FILES and
+        POST_INDEX_BATCH_BYTES (of the bytes that will be read), and up to
+        until_id if given
+
+        Returns:
+            list: (id, relative_path, size) tuples
+        """
+        table = FileMetadata.__table__
+        conditions = [table.c.job_id == job_id, table.c.id > after_id]
+        if until_id is not None:
+            conditions.append(table.c.id <= until_id)
+        with index_engine.connect() as connection:
+            rows = connection.execute(
+                select(table.c.id, table.c.parent_id, table.c.name, table.c.size)
+                .where(*conditions)
+                .order_by(table.c.id)
+                .limit(settings.POST_INDEX_BATCH_FILES)
+            ).all()
+
+        dir_map = directory_service.path_map(job_id)
+        batch = []
+        batch_bytes = 0
+        for file_id, parent_id, name, size in rows:
+            if batch and batch_bytes >= settings.POST_INDEX_BATCH_BYTES:
+                break
+            path = dir_map.file_path(parent_id, name)
+            batch.append((file_id, path, size or 0))
+            if reads_content and (size or 0) <= settings.CONTENT_INDEX_MAX_FILE_SIZE:
+                batch_bytes += size or 0
+        return batch
+
+    def _reader(self, job_id, stages=()):
+        """
+        Function reading one file of a job: from the extracted tree, or from
+        the job's pack when it is in the cold tier - then running the
+        stages' prepare() on it
+        """
+        from app.services.cold_storage import cold_storage_service
+
+        pack = cold_storage_service.get(job_id)
+        max_size = settings.CONTENT_INDEX_MAX_FILE_SIZE
+        preparing = [stage for stage in stages if type(stage).prepare is not PostIndexStage.prepare]
+
+        def opener(path):
+            """Function opening the whole file (raises OSError if it is gone)"""
+            if pack is not None:
+                member = pack.resolve(path)
+                if member is None:
+                    raise FileNotFoundError(path)
+                return lambda: pack.open(member)
+            is_safe, full_path, _ = check_file_access(job_id, path)
+            if not is_safe:
+                raise FileNotFoundError(path)
+            return lambda: open(full_path, 'rb')
+
+        def read(row):
+            nonlocal pack
+            file_id, path, size = row
+            data = None
+            try:
+                open_file = opener(path)
+                if size <= max_size:
+                    with open_file() as f:
+                        data = f.read(max_size)
+            except OSError as e:
+                if pack is None:
+                    # Packed into the cold tier since the batch started: read the pack from now on
+                    pack = cold_storage_service.get(job_id)
+                    if pack is not None:
+                        return read(row)
+                logger.debug(f"Could not read {path} of job {job_id}: {e}")
+                return IndexedFile(file_id, path, size, None)
+
+            item = IndexedFile(file_id, path, size, data)
+            prepared = {}
+            consumers = {}
+            for stage in preparing:
+                try:
+                    value = stage.prepare(job_id, item, open_file)
+                except OSError as e:
+                    logger.debug(f"Stage {stage.name} could not read {path} of job {job_id}: {e}")
+                    continue
+                if isinstance(value, ChunkConsumer):
+                    consumers[stage.name] = value
+                else:
+                    prepared[stage.name] = value
+            if consumers:
+                prepared.update(feed(path, open_file, consumers))
+            return item._replace(prepared=prepared)
+
+        def feed(path, open_file, consumers):
+            """Read a file once for the stages' chunk consumers; their results by stage name"""
+            active = dict(consumers)
+            try:
+                with open_file() as f:
+                    while active:
+                        chunk = f.read(READ_CHUNK)
+                        if not chunk:
+                            break
+                        for name, consumer in list(active.items()):
+                            if consumer.update(chunk):
+                                del active[name]
+            except OSError as e:
+                logger.debug(f"Could not read {path} of job {job_id}: {e}")
+                return {}
+            return {name: consumer.result() for name, consumer in consumers.items()}
+
+        return read
+
+
+# Global post-index pipeline instance
+post_index_pipeline = PostIndexPipeline()
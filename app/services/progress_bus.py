@@ -0,0 +1,127 @@
+"""
+Progress Bus
+In-process publish/subscribe channel for job progress events
+"""
+
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Job statuses after which no further progress events are published
+TERMINAL_STATUSES = ('completed', 'error', 'cancelled')
+
+
+class ProgressSubscription:
+    """
+    A single listener for one job's progress
+
+    Only the latest snapshot is kept, so a slow consumer skips intermediate
+    events instead of queueing them.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._latest = None
+        self._event = threading.Event()
+
+    def _deliver(self, snapshot):
+        self._latest = snapshot
+        self._event.set()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the next snapshot
+
+        Args:
+            timeout: Seconds to wait
+
+        Returns:
+            dict: Latest progress snapshot, or None on timeout
+        """
+        if not self._event.wait(timeout):
+            return None
+        self._event.clear()
+        return self._latest
+
+
+class ProgressBus:
+    """Holds the live progress state of running jobs and fans it out to subscribers"""
+
+    def __init__(self):
+        self._state = {}
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, job_id, **fields):
+        """
+        Merge fields into a job's progress state and notify subscribers
+
+        Args:
+            job_id: UUID of the job
+            **fields: Progress fields (status, progress, message, ...)
+
+        Returns:
+            dict: The merged snapshot
+        """
+        with self._lock:
+            snapshot = dict(self._state.get(job_id, {}))
+            snapshot.update(fields)
+            self._state[job_id] = snapshot
+            subscribers = list(self._subscribers.get(job_id, ()))
+
+        for subscription in subscribers:
+            subscription._deliver(snapshot)
+
+        return snapshot
+
+    def get(self, job_id):
+        """
+        Get the live progress snapshot of a job
+
+        Returns:
+            dict: Snapshot, or None if nothing was published in this process
+        """
+        with self._lock:
+            snapshot = self._state.get(job_id)
+            return dict(snapshot) if snapshot is not None else None
+
+    def subscribe(self, job_id):
+        """
+        Start listening to a job's progress
+
+        The current snapshot, if any, is delivered immediately.
+
+        Returns:
+            ProgressSubscription: Subscription to wait on
+        """
+        subscription = ProgressSubscription(job_id)
+        with self._lock:
+            self._subscribers.setdefault(job_id, []).append(subscription)
+            snapshot = self._state.get(job_id)
+        if snapshot is not None:
+            subscription._deliver(dict(snapshot))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Stop listening"""
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.job_id, [])
+            if subscription in subscribers:
+                subscribers.remove(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.job_id, None)
+
+    def discard(self, job_id):
+        """
+        Drop a finished job's live state
+
+        Subscribers have already received the terminal snapshot; later
+        readers fall back to the persisted Job row.
+        """
+        with self._lock:
+            self._state.pop(job_id, None)
+
+
+# Global progress bus instance
+progress_bus = ProgressBus()
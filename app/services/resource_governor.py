@@ -0,0 +1,114 @@
+"""
+Resource Governor
+Streaming limits on expanded size, expansion ratio, member count and free disk space
+"""
+
+import shutil
+
+from app.utils.security import get_file_size_human
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The expansion ratio is only enforced once this much has been written,
+# so small, highly compressible archives (text logs) are not rejected
+RATIO_GRACE_BYTES = 64 * 1024 * 1024
+
+# Free space is re-checked after this many bytes or members
+DISK_CHECK_BYTES = 64 * 1024 * 1024
+DISK_CHECK_MEMBERS = 1000
+
+
+class ResourceLimitExceeded(Exception):
+    """Raised when an extraction trips one of the configured limits"""
+
+
+class ResourceGovernor:
+    """
+    Enforces per-job extraction limits while members are written
+
+    Checks run before each member (using its declared size) and before each
+    chunk of a streamed decompression, so a job is aborted before it writes
+    past a limit. A limit of 0 disables that check.
+    """
+
+    def __init__(self, extract_to, archive_bytes,
+                 max_bytes=None, max_ratio=None, max_members=None, min_free_bytes=None):
+        """
+        Args:
+            extract_to: Destination directory (its filesystem is watched)
+            archive_bytes: Compressed size of the archive
+            max_bytes: Maximum expanded bytes (defaults to settings.EXTRACT_MAX_BYTES)
+            max_ratio: Maximum expanded/compressed ratio (defaults to settings.EXTRACT_MAX_RATIO)
+            max_members: Maximum archive members (defaults to settings.EXTRACT_MAX_MEMBERS)
+            min_free_bytes: Free-space watermark (defaults to settings.EXTRACT_MIN_FREE_BYTES)
+        """
+        self.extract_to = extract_to
+        self.archive_bytes = archive_bytes or 0
+        self.max_bytes = settings.EXTRACT_MAX_BYTES if max_bytes is None else max_bytes
+        self.max_ratio = settings.EXTRACT_MAX_RATIO if max_ratio is None else max_ratio
+        self.max_members = settings.EXTRACT_MAX_MEMBERS if max_members is None else max_members
+        self.min_free_bytes = settings.EXTRACT_MIN_FREE_BYTES if min_free_bytes is None else min_free_bytes
+
+        self.bytes_written = 0
+        self.members = 0
+        self._bytes_at_disk_check = 0
+        self._members_at_disk_check = 0
+        self._free_bytes = None
+
+    def check_member(self, size):
+        """
+        Account for the next archive member before it is written
+
+        Args:
+            size: Declared uncompressed size of the member (0 for directories/links)
+
+        Raises:
+            ResourceLimitExceeded: If writing the member would exceed a limit
+        """
+        self.members += 1
+        if self.max_members and self.members > self.max_members:
+            raise ResourceLimitExceeded(
+                f'Archive has more than {self.max_members} members')
+        self._account(size or 0)
+
+    def check_chunk(self, size):
+        """
+        Account for the next chunk of a streamed decompression
+
+        Raises:
+            ResourceLimitExceeded: If writing the chunk would exceed a limit
+        """
+        self._account(size)
+
+    def _account(self, size):
+        self.bytes_written += size
+
+        if self.max_bytes and self.bytes_written > self.max_bytes:
+            raise ResourceLimitExceeded(
+                f'Expanded size exceeds the limit of {get_file_size_human(self.max_bytes)}')
+
+        if (self.max_ratio and self.archive_bytes and self.bytes_written > RATIO_GRACE_BYTES
+                and self.bytes_written > self.max_ratio * self.archive_bytes):
+            raise ResourceLimitExceeded(
+                f'Expansion ratio exceeds {self.max_ratio:g}:1 '
+                f'({get_file_size_human(self.bytes_written)} from {get_file_size_human(self.archive_bytes)})')
+
+        if self.min_free_bytes:
+            self._check_disk(size)
+
+    def _check_disk(self, size):
+        """Check the free-space watermark (statvfs only every few MB / members)"""
+        if (self._free_bytes is None
+                or self.bytes_written - self._bytes_at_disk_check >= DISK_CHECK_BYTES
+                or self.members - self._members_at_disk_check >= DISK_CHECK_MEMBERS):
+            self._free_bytes = shutil.disk_usage(self.extract_to).free
+            self._bytes_at_disk_check = self.bytes_written
+            self._members_at_disk_check = self.members
+
+        # Free space once this write lands
+        self._free_bytes -= size
+        if self._free_bytes < self.min_free_bytes:
+            raise ResourceLimitExceeded(
+                f'Free disk space would drop below {get_file_size_human(self.min_free_bytes)}')
@@ -0,0 +1,177 @@
+"""
+Retention Service
+Deletes finished jobs by age, idle time and total size (least recently used first)
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+from app.database import db_session
+from app.models import Job
+from app.services.job_control import job_control_service
+from app.services.job_writer import job_writer
+from app.services.progress_bus import TERMINAL_STATUSES
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds after startup before the first sweep
+STARTUP_DELAY = 60
+
+# A job's last access is recorded at most this often (seconds)
+TOUCH_INTERVAL = 60
+
+
+class RetentionService:
+    """
+    Applies the retention policies
+
+    - RETENTION_MAX_AGE_DAYS: jobs uploaded longer ago are deleted
+    - RETENTION_MAX_IDLE_DAYS: jobs not opened for longer are deleted
+    - RETENTION_MAX_TOTAL_BYTES: while the jobs' footprint (archive plus
+      extracted bytes) exceeds it, the least recently accessed are deleted
+
+    Only finished jobs are eligible. Deletion goes through
+    JobControlService.cleanup_job_data (trash-folder file removal, chunked
+    index deletes or a shard unlink) from a background thread.
+    """
+
+    def __init__(self):
+        self._touched = {}  # job_id -> monotonic time of the last recorded access
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self):
+        """Whether any retention policy is configured"""
+        return bool(settings.RETENTION_MAX_AGE_DAYS or settings.RETENTION_MAX_IDLE_DAYS
+                    or settings.RETENTION_MAX_TOTAL_BYTES)
+
+    def touch(self, job_id):
+        """
+        Record an access to a job (coalesced by the job writer)
+
+        Args:
+            job_id: UUID of the job
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._touched.get(job_id, -TOUCH_INTERVAL) < TOUCH_INTERVAL:
+                return
+            self._touched[job_id] = now
+        job_writer.touch(job_id, datetime.utcnow())
+
+    def plan(self, now=None):
+        """
+        Jobs the policies select for deletion
+
+        Args:
+            now: Reference time (default: utcnow)
+
+        Returns:
+            list: (job_id, reason) tuples, in deletion order
+        """
+        now = now or datetime.utcnow()
+        jobs = db_session.query(
+            Job.id, Job.status, Job.created_at, Job.updated_at, Job.last_accessed_at,
+            Job.compressed_bytes, Job.uncompressed_bytes, Job.total_size
+        ).all()
+        db_session.rollback()
+
+        def last_access(job):
+            return job.last_accessed_at or job.updated_at or job.created_at or now
+
+        def footprint(job):
+            return (job.compressed_bytes or 0) + (job.uncompressed_bytes or job.total_size or 0)
+
+        selected = []
+        remaining = []
+        for job in jobs:
+            if job.status not in TERMINAL_STATUSES or job_control_service.is_running(job.id):
+                continue
+            if settings.RETENTION_MAX_AGE_DAYS and job.created_at and \
+                    now - job.created_at > timedelta(days=settings.RETENTION_MAX_AGE_DAYS):
+                selected.append((job.id, 'age'))
+            elif settings.RETENTION_MAX_IDLE_DAYS and \
+                    now - last_access(job) > timedelta(days=settings.RETENTION_MAX_IDLE_DAYS):
+                selected.append((job.id, 'idle'))
+            else:
+                remaining.append(job)
+
+        if settings.RETENTION_MAX_TOTAL_BYTES:
+            selected_ids = {job_id for job_id, _ in selected}
+            # Running jobs count towards the total but cannot be evicted
+            total = sum(footprint(job) for job in jobs if job.id not in selected_ids)
+            for job in sorted(remaining, key=last_access):
+                if total <= settings.RETENTION_MAX_TOTAL_BYTES:
+                    break
+                selected.append((job.id, 'size'))
+                total -= footprint(job)
+
+        return selected
+
+    def sweep(self, dry_run=False):
+        """
+        Delete the jobs the policies select
+
+        Args:
+            dry_run: Only report what would be deleted
+
+        Returns:
+            list: (job_id, reason) tuples of the jobs deleted (or selected)
+        """
+        selected = self.plan()
+        if dry_run:
+            return selected
+
+        deleted = []
+        try:
+            for job_id, reason in selected:
+                if job_control_service.is_running(job_id):
+                    continue
+                try:
+                    entries = job_control_service.cleanup_job_data(job_id, delete_job=True)
+                except Exception as e:
+                    logger.error(f"Retention could not delete job {job_id}: {e}")
+                    continue
+                with self._lock:
+                    self._touched.pop(job_id, None)
+                deleted.append((job_id, reason))
+                logger.info(f"Retention deleted job {job_id} ({reason}, {entries} indexed entries)")
+
+            # Leftovers of deletions interrupted by a restart
+            job_control_service.purge_trash()
+        finally:
+            db_session.remove()
+
+        return deleted
+
+    def start(self):
+        """Run sweeps every RETENTION_INTERVAL seconds in a background thread (if enabled)"""
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+        self._thread.start()
+        logger.info(f"Retention sweeps every {settings.RETENTION_INTERVAL}s")
+
+    def stop(self):
+        """Stop the background sweeps"""
+        self._stop.set()
+
+    def _run(self):
+        delay = STARTUP_DELAY
+        while not self._stop.wait(delay):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Retention sweep failed: {e}", exc_info=True)
+            delay = settings.RETENTION_INTERVAL
+
+
+# Global retention service instance
+retention_service = RetentionService()
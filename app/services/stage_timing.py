@@ -0,0 +1,195 @@
+"""
+Stage Timing Service
+Records wall time, CPU time and bytes processed for each job pipeline stage
+"""
+
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from app.database import db_session
+from app.models import JobStageTiming
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Percentiles reported by the cross-job summary
+SUMMARY_PERCENTILES = (50, 90, 95, 99)
+
+
+class StageSample:
+    """
+    Accumulates measurements for one stage of one job
+
+    A sample can be measured several times (e.g. every DB insert batch) and
+    sums the intervals. CPU time is that of the measuring thread.
+    """
+
+    def __init__(self, job_id, stage):
+        self.job_id = job_id
+        self.stage = stage
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.bytes_processed = None
+        self.items = None
+        self.started_at = None
+        self._wall_start = None
+        self._cpu_start = None
+
+    def start(self):
+        """Start an interval"""
+        if self.started_at is None:
+            self.started_at = datetime.utcnow()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+
+    def stop(self):
+        """End the current interval and add it to the totals"""
+        if self._wall_start is None:
+            return
+        self.wall_seconds += time.perf_counter() - self._wall_start
+        self.cpu_seconds += time.thread_time() - self._cpu_start
+        self._wall_start = None
+        self._cpu_start = None
+
+    @contextmanager
+    def measure(self):
+        """Measure the enclosed block as one interval"""
+        self.start()
+        try:
+            yield self
+        finally:
+            self.stop()
+
+    def subtract(self, other):
+        """Remove another sample's time (a sub-stage measured inside this one)"""
+        self.wall_seconds = max(0.0, self.wall_seconds - other.wall_seconds)
+        self.cpu_seconds = max(0.0, self.cpu_seconds - other.cpu_seconds)
+
+
+class StageTimingService:
+    """Persists stage samples and aggregates them across jobs"""
+
+    def record(self, sample):
+        """
+        Persist a stage sample
+
+        Instrumentation must never fail a job, so errors are only logged.
+
+        Args:
+            sample: StageSample to store
+        """
+        sample.stop()
+        if sample.started_at is None:
+            return
+
+        try:
+            db_session.add(JobStageTiming(
+                job_id=sample.job_id,
+                stage=sample.stage,
+                wall_seconds=round(sample.wall_seconds, 6),
+                cpu_seconds=round(sample.cpu_seconds, 6),
+                bytes_processed=sample.bytes_processed,
+                items=sample.items,
+                started_at=sample.started_at
+            ))
+            db_session.commit()
+        except Exception as e:
+            logger.error(f"Error recording {sample.stage} timing for job {sample.job_id}: {e}")
+            db_session.rollback()
+
+    @contextmanager
+    def stage(self, job_id, stage):
+        """
+        Measure and record a stage
+
+        Usage:
+            with stage_timing_service.stage(job_id, 'extract') as sample:
+                ...
+                sample.bytes_processed = written
+
+        Args:
+            job_id: UUID of the job
+            stage: Stage name
+        """
+        sample = StageSample(job_id, stage)
+        try:
+            with sample.measure():
+                yield sample
+        finally:
+            self.record(sample)
+
+    def get_job_timings(self, job_id):
+        """
+        Get all stage timings of a job
+
+        Returns:
+            list: Timing dictionaries in execution order
+        """
+        timings = db_session.query(JobStageTiming).filter_by(job_id=job_id).order_by(
+            JobStageTiming.started_at, JobStageTiming.id
+        ).all()
+        return [timing.to_dict() for timing in timings]
+
+    def summarize(self, stage=None, days=None):
+        """
+        Aggregate stage timings across jobs
+
+        Args:
+            stage: Optional stage name filter
+            days: Optional window (only samples started in the last N days)
+
+        Returns:
+            dict: stage -> count, totals and percentiles of wall/CPU time and throughput
+        """
+        query = db_session.query(
+            JobStageTiming.stage,
+            JobStageTiming.wall_seconds,
+            JobStageTiming.cpu_seconds,
+            JobStageTiming.bytes_processed
+        )
+        if stage:
+            query = query.filter(JobStageTiming.stage == stage)
+        if days:
+            query = query.filter(JobStageTiming.started_at >= datetime.utcnow() - timedelta(days=days))
+
+        by_stage = {}
+        for stage_name, wall, cpu, processed in query:
+            values = by_stage.setdefault(stage_name, {'wall': [], 'cpu': [], 'bps': []})
+            values['wall'].append(wall or 0.0)
+            values['cpu'].append(cpu or 0.0)
+            if processed and wall:
+                values['bps'].append(processed / wall)
+
+        summary = {}
+        for stage_name, values in by_stage.items():
+            summary[stage_name] = {
+                'count': len(values['wall']),
+                'total_wall_seconds': round(sum(values['wall']), 3),
+                'total_cpu_seconds': round(sum(values['cpu']), 3),
+                'wall_seconds': _percentiles(values['wall']),
+                'cpu_seconds': _percentiles(values['cpu']),
+                'bytes_per_sec': _percentiles(values['bps']),
+            }
+        return summary
+
+
+def _percentiles(values):
+    """Linear-interpolated percentiles plus max of a list of numbers"""
+    if not values:
+        return None
+
+    ordered = sorted(values)
+    result = {}
+    for pct in SUMMARY_PERCENTILES:
+        rank = (len(ordered) - 1) * pct / 100
+        lower = int(rank)
+        upper = min(lower + 1, len(ordered) - 1)
+        value = ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+        result[f'p{pct}'] = round(value, 4)
+    result['max'] = round(ordered[-1], 4)
+    return result
+
+
+# Global stage timing service instance
+stage_timing_service = StageTimingService()
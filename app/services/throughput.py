@@ -0,0 +1,128 @@
+"""
+Throughput Meter
+Byte-accurate progress, rates and smoothed ETA for long-running job stages
+"""
+
+import time
+
+
+class ThroughputMeter:
+    """
+    Tracks progress of one job stage
+
+    ``done`` / ``total`` is the primary progress measure (compressed bytes
+    read during extraction, entries during indexing). Any number of extra
+    counters (bytes written, members, ...) can be tracked alongside; rates
+    are reported for all of them. The ETA uses an exponentially weighted
+    moving average of the primary rate so it does not jump around on
+    bursty input.
+    """
+
+    def __init__(self, total=None, smoothing=0.3, report_interval=0.5):
+        """
+        Args:
+            total: Expected final value of the primary measure (None if unknown)
+            smoothing: EWMA weight of the newest rate sample (0-1)
+            report_interval: Minimum seconds between reports
+        """
+        self.total = total
+        self.done = 0
+        self.counters = {}
+        self.smoothing = smoothing
+        self.report_interval = report_interval
+
+        self.started_at = time.monotonic()
+        self._sample_at = self.started_at
+        self._sample_done = 0
+        self._last_report_at = 0.0
+        self._rate = None
+
+    def update(self, done, **counters):
+        """
+        Record new absolute values
+
+        Args:
+            done: Current value of the primary measure
+            **counters: Current values of extra counters
+
+        Returns:
+            bool: True if a progress report is due
+        """
+        self.done = done
+        self.counters.update(counters)
+
+        now = time.monotonic()
+        elapsed = now - self._sample_at
+        if elapsed >= self.report_interval:
+            sample_rate = (done - self._sample_done) / elapsed
+            if self._rate is None:
+                self._rate = sample_rate
+            else:
+                self._rate = self.smoothing * sample_rate + (1 - self.smoothing) * self._rate
+            self._sample_at = now
+            self._sample_done = done
+
+        if now - self._last_report_at >= self.report_interval:
+            self._last_report_at = now
+            return True
+        return False
+
+    @property
+    def elapsed(self):
+        """Seconds since the stage started"""
+        return time.monotonic() - self.started_at
+
+    def fraction(self):
+        """Completed fraction of the primary measure (0-1), or None if total is unknown"""
+        if not self.total:
+            return None
+        return min(1.0, self.done / self.total)
+
+    def eta_seconds(self):
+        """Smoothed estimate of seconds remaining, or None if unknown"""
+        if not self.total or not self._rate or self._rate <= 0:
+            return None
+        return max(0.0, (self.total - self.done) / self._rate)
+
+    def snapshot(self):
+        """
+        Get current figures
+
+        Returns:
+            dict: done/total, elapsed seconds, per-second rates and ETA
+        """
+        elapsed = self.elapsed
+        eta = self.eta_seconds()
+        snapshot = {
+            'done': self.done,
+            'total': self.total,
+            'elapsed_seconds': round(elapsed, 2),
+            'rate_per_sec': round(self.done / elapsed, 1) if elapsed > 0 else 0,
+            'eta_seconds': round(eta, 1) if eta is not None else None,
+        }
+        for name, value in self.counters.items():
+            snapshot[name] = value
+            snapshot[f'{name}_per_sec'] = round(value / elapsed, 1) if elapsed > 0 else 0
+        return snapshot
+
+
+def format_eta(seconds):
+    """
+    Format an ETA for progress messages
+
+    Args:
+        seconds: Seconds remaining or None
+
+    Returns:
+        str: e.g. '42s', '3m 05s' or '' if unknown
+    """
+    if seconds is None:
+        return ''
+    seconds = int(seconds)
+    if seconds < 60:
+        return f'{seconds}s'
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f'{minutes}m {seconds:02d}s'
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}h {minutes:02d}m'
@@ -4,10 +4,11 @@ Builds hierarchical directory tree structures
 """
 
 import os
-from collections import defaultdict
 
-from app.database import db_session
-from app.models import FileMetadata
+from app.models import Directory, DirectoryStats, FileMetadata
+from app.services.directories import directory_service
+from app.services.index_store import index_store
+from app.services.manifest import manifest_service
 from config import settings
 import logging
 
@@ -28,10 +29,14 @@ class TreeBuilderService:
         Returns:
             dict: Tree structure
         """
-        # Query all files and directories
-        all_items = db_session.query(FileMetadata).filter_by(job_id=job_id).all()
+        manifest = manifest_service.get(job_id)
+        if manifest:
+            return self._build_tree_from_manifest(manifest, start_path)
 
-        if not all_items:
+        dir_map = directory_service.path_map(job_id)
+        start_id = dir_map.id_of(start_path)
+
+        if start_id is None:
             return {
                 'name': 'root',
                 'path': '',
@@ -39,88 +44,95 @@ class TreeBuilderService:
                 'children': []
             }
 
-        # Build tree structure
-        tree = self._build_tree_recursive(all_items, start_path)
-        return tree
-
-    def _build_tree_recursive(self, items, start_path):
-        """
-        Recursively build tree structure
-
-        Args:
-            items: List of FileMetadata objects
-            start_path: Current path prefix
-
-        Returns:
-            dict: Tree node
-        """
-        # Group items by their immediate parent
-        children_by_parent = defaultdict(list)
-
-        for item in items:
-            rel_path = item.relative_path
+        # Build root node
+        root = {
+            'name': os.path.basename(start_path) if start_path else 'root',
+            'path': start_path,
+            'type': 'directory',
+            'children': []
+        }
 
-            # Skip if not in current path
-            if start_path and not rel_path.startswith(start_path):
-                continue
+        # Add immediate children (children loaded lazily); counts are precomputed
+        for name, relative_path, file_count, total_size in self._child_directories(job_id, start_id):
+            root['children'].append({
+                'name': name,
+                'path': relative_path,
+                'type': 'directory',
+                'file_count': file_count or 0,
+                'total_size': total_size or 0,
+                'children': []
+            })
 
-            # Get relative path from start_path
-            if start_path:
-                path_from_start = rel_path[len(start_path):].lstrip('/')
-            else:
-                path_from_start = rel_path
+        for name, size, extension in self._child_files(job_id, start_id):
+            root['children'].append({
+                'name': name,
+                'path': dir_map.file_path(start_id, name),
+                'type': 'file',
+                'size': size,
+                'extension': extension
+            })
 
-            # Get immediate parent
-            if '/' in path_from_start:
-                parent = path_from_start.split('/')[0]
-            else:
-                parent = ''
+        # Sort children: directories first, then files, alphabetically
+        root['children'].sort(key=lambda x: (x['type'] == 'file', x['name'].lower()))
 
-            children_by_parent[parent].append(item)
+        return root
 
-        # Build root node
+    def _build_tree_from_manifest(self, manifest, start_path):
+        """build_tree() from a mapped manifest"""
+        start = manifest.find_directory(start_path)
         root = {
-            'name': os.path.basename(start_path) if start_path else 'root',
-            'path': start_path,
+            'name': os.path.basename(start_path) if start_path and start is not None else 'root',
+            'path': start_path if start is not None else '',
             'type': 'directory',
             'children': []
         }
-
-        # Add immediate children
-        for item in children_by_parent.get('', []):
-            if item.is_directory:
-                # Add directory node
-                dir_node = {
-                    'name': item.name,
-                    'path': item.relative_path,
-                    'type': 'directory',
-                    'file_count': self._count_files(items, item.relative_path),
-                    'children': []  # Children loaded lazily
-                }
-                root['children'].append(dir_node)
-            else:
-                # Add file node
-                file_node = {
-                    'name': item.name,
-                    'path': item.relative_path,
-                    'type': 'file',
-                    'size': item.size,
-                    'extension': item.extension
-                }
-                root['children'].append(file_node)
+        if start is None:
+            return root
+
+        for d in manifest.children(start):
+            relative_path = manifest.dir_path(d)
+            root['children'].append({
+                'name': relative_path.rpartition('/')[2],
+                'path': relative_path,
+                'type': 'directory',
+                'file_count': manifest.dir_file_count[d],
+                'total_size': manifest.dir_total_size[d],
+                'children': []
+            })
+
+        for f in manifest.files(start):
+            name = manifest.file_name(f)
+            root['children'].append({
+                'name': name,
+                'path': f'{start_path}/{name}' if start_path else name,
+                'type': 'file',
+                'size': manifest.file_size(f),
+                'extension': manifest.file_extension(f)
+            })
 
         # Sort children: directories first, then files, alphabetically
         root['children'].sort(key=lambda x: (x['type'] == 'file', x['name'].lower()))
 
         return root
 
-    def _count_files(self, items, dir_path):
-        """Count files in a directory"""
-        count = 0
-        for item in items:
-            if not item.is_directory and item.relative_path.startswith(dir_path + '/'):
-                count += 1
-        return count
+    def _child_directories(self, job_id, directory_id):
+        """(name, relative_path, file_count, total_size) of the subdirectories of a directory"""
+        return index_store.session(job_id).query(
+            Directory.name,
+            Directory.relative_path,
+            DirectoryStats.file_count,
+            DirectoryStats.total_size
+        ).outerjoin(
+            DirectoryStats, DirectoryStats.directory_id == Directory.id
+        ).filter(Directory.parent_id == directory_id).all()
+
+    def _child_files(self, job_id, directory_id):
+        """(name, size, extension) of the files in a directory"""
+        return index_store.session(job_id).query(
+            FileMetadata.name,
+            FileMetadata.size,
+            FileMetadata.extension
+        ).filter(FileMetadata.parent_id == directory_id).all()
 
     def get_directory_contents(self, job_id, dir_path=''):
         """
@@ -133,56 +145,49 @@ class TreeBuilderService:
         Returns:
             dict: Directory contents with files and subdirectories
         """
-        # Query items in this directory
+        dir_map = directory_service.path_map(job_id)
+
+        # Query items in this directory (integer parent_id lookups)
         if dir_path:
-            items = db_session.query(FileMetadata).filter(
-                FileMetadata.job_id == job_id,
-                FileMetadata.parent_path == dir_path
-            ).all()
+            directory_id = dir_map.id_of(dir_path)
         else:
             # Root level: find the root directory first, then get its children
-            root_dir = db_session.query(FileMetadata).filter(
-                FileMetadata.job_id == job_id,
-                FileMetadata.is_directory == True,
-                (FileMetadata.parent_path == None) | (FileMetadata.parent_path == '') | (FileMetadata.parent_path == '.')
-            ).first()
-
-            if root_dir:
-                # Get children of the root directory
-                items = db_session.query(FileMetadata).filter(
-                    FileMetadata.job_id == job_id,
-                    FileMetadata.parent_path == root_dir.relative_path
-                ).all()
-            else:
-                # Fallback: get items with no parent
-                items = db_session.query(FileMetadata).filter(
-                    FileMetadata.job_id == job_id,
-                    (FileMetadata.parent_path == None) | (FileMetadata.parent_path == '') | (FileMetadata.parent_path == '.')
-                ).all()
+            root_dir = None
+            if dir_map.root_id is not None:
+                root_dir = index_store.session(job_id).query(Directory.id).filter(
+                    Directory.parent_id == dir_map.root_id
+                ).order_by(Directory.id).first()
+
+            # Fallback: get items with no parent
+            directory_id = root_dir.id if root_dir else dir_map.root_id
 
         files = []
         directories = []
 
-        for item in items:
-            if item.is_directory:
+        if directory_id is not None:
+            for name, relative_path, file_count, total_size in self._child_directories(job_id, directory_id):
                 directories.append({
-                    'name': item.name,
-                    'path': item.relative_path,
-                    'relative_path': item.relative_path,
+                    'name': name,
+                    'path': relative_path,
+                    'relative_path': relative_path,
                     'type': 'directory',
-                    'size': item.size,
-                    'size_human': 'Directory'
+                    'size': None,
+                    'size_human': 'Directory',
+                    'file_count': file_count or 0,
+                    'total_size': total_size or 0
                 })
-            else:
-                from app.utils.security import get_file_size_human
+
+            from app.utils.security import get_file_size_human
+            for name, size, extension in self._child_files(job_id, directory_id):
+                relative_path = dir_map.file_path(directory_id, name)
                 files.append({
-                    'name': item.name,
-                    'path': item.relative_path,
-                    'relative_path': item.relative_path,
+                    'name': name,
+                    'path': relative_path,
+                    'relative_path': relative_path,
                     'type': 'file',
-                    'size': item.size,
-                    'size_human': get_file_size_human(item.size) if item.size else 'Unknown',
-                    'extension': item.extension
+                    'size': size,
+                    'size_human': get_file_size_human(size) if size else 'Unknown',
+                    'extension': extension
                 })
 
         # Sort alphabetically
@@ -0,0 +1,301 @@
+"""
+Tree Watcher Service
+Keeps job indexes in step with changes made to their extracted trees (inotify)
+"""
+
+import errno
+import os
+import threading
+import time
+
+from app.database import db_session
+from app.models import Job
+from app.services.index_store import index_store
+from app.utils import inotify
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Events watched on every directory of a job's tree
+WATCH_MASK = (inotify.IN_CREATE | inotify.IN_DELETE | inotify.IN_MODIFY | inotify.IN_CLOSE_WRITE
+              | inotify.IN_MOVED_FROM | inotify.IN_MOVED_TO | inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF
+              | inotify.IN_ONLYDIR | inotify.IN_DONT_FOLLOW | inotify.IN_EXCL_UNLINK)
+
+# Events that change a directory's listing
+LISTING_EVENTS = inotify.IN_CREATE | inotify.IN_DELETE | inotify.IN_MOVED_FROM | inotify.IN_MOVED_TO
+
+# Events of a file written in place
+WRITE_EVENTS = inotify.IN_MODIFY | inotify.IN_CLOSE_WRITE
+
+# Longest wait for events between checks of the pending changes (seconds)
+POLL_INTERVAL = 1.0
+
+
+class _Changes:
+    """Paths of one job changed since its last update"""
+
+    def __init__(self, now):
+        self.paths = set()
+        self.created = set()
+        self.written = set()
+        self.first_seen = now
+        self.last_seen = now
+
+    def add(self, relative_path, now, created=False, written=False):
+        self.paths.add(relative_path)
+        if created:
+            self.created.add(relative_path)
+        if written:
+            self.written.add(relative_path)
+        self.last_seen = now
+
+    def modified(self):
+        """Files written in place (not created since the last update)"""
+        return self.written - self.created
+
+
+class TreeWatcherService:
+    """
+    Incremental re-indexing of job trees from inotify events
+
+    With INDEX_WATCH on (Linux only), every directory of each completed
+    job's loose tree under EXTRACT_FOLDER is watched. Creates, deletes,
+    moves and writes are collected per job; once a job has been quiet for
+    INDEX_WATCH_DELAY seconds (INDEX_WATCH_MAX_DELAY at most), the changed
+    paths are applied in one IndexingService.update_paths() call, which
+    compares only those paths - and the subtrees of changed directories -
+    with the index. Files added by nested or rhcert extraction (which index
+    them themselves), manual fixes on the server and deletions all reach
+    the index without a full walk.
+
+    Changes are held back while a job's worker is running or an extraction
+    into its tree is in progress (pause()). An event queue overflow
+    re-compares every watched job's whole tree. Packing a job into the cold
+    tier or deleting it moves its tree away, which ends its watch.
+    """
+
+    def __init__(self):
+        self._inotify = None
+        self._watches = {}  # wd -> (job_id, relative directory path)
+        self._job_watches = {}  # job_id -> {relative directory path: wd}
+        self._pending = {}  # job_id -> _Changes
+        self._paused = {}  # job_id -> nesting count
+        self._lock = threading.RLock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Watch every completed job's tree and apply changes in a background thread (if enabled)"""
+        if not settings.INDEX_WATCH:
+            return
+        if not inotify.available():
+            logger.warning("INDEX_WATCH is set but inotify is not available; job trees are not watched")
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._inotify is None:
+                self._inotify = inotify.Inotify()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='tree-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread"""
+        self._stop.set()
+
+    def watch(self, job_id):
+        """
+        Start watching a job's extracted tree (a job already watched is left as is)
+
+        Args:
+            job_id: UUID of the job
+
+        Returns:
+            bool: Whether the job is watched
+        """
+        if self._inotify is None:
+            return False
+        root = os.path.join(settings.EXTRACT_FOLDER, job_id)
+        with self._lock:
+            if job_id in self._job_watches:
+                return True
+            if not os.path.isdir(root):
+                return False
+            self._job_watches[job_id] = {}
+            try:
+                self._add_tree(job_id, '')
+            except OSError as e:
+                for wd in self._remove_job(job_id):
+                    self._inotify.rm_watch(wd)
+                if e.errno == errno.ENOSPC:
+                    logger.warning(f"Not watching job {job_id}: inotify watch limit reached "
+                                   f"(raise fs.inotify.max_user_watches)")
+                else:
+                    logger.warning(f"Not watching job {job_id}: {e}")
+                return False
+
+        logger.info(f"Watching job {job_id} ({len(self._job_watches.get(job_id, ()))} directories)")
+        return True
+
+    def unwatch(self, job_id):
+        """Stop watching a job and drop its pending changes"""
+        with self._lock:
+            for wd in self._remove_job(job_id):
+                self._inotify.rm_watch(wd)
+
+    def is_watched(self, job_id):
+        """Whether a job's tree is watched"""
+        with self._lock:
+            return job_id in self._job_watches
+
+    def pause(self, job_id):
+        """Hold back a job's changes while the caller writes and indexes its tree itself (nests)"""
+        with self._lock:
+            self._paused[job_id] = self._paused.get(job_id, 0) + 1
+
+    def resume(self, job_id):
+        """End a pause(); the changes held back are applied once the job is quiet"""
+        with self._lock:
+            self._paused[job_id] -= 1
+            if not self._paused[job_id]:
+                del self._paused[job_id]
+
+    def _add_tree(self, job_id, relative_path):
+        """Watch a directory and every directory below it (caller holds the lock)"""
+        root = os.path.join(settings.EXTRACT_FOLDER, job_id)
+        for directory, _, _ in os.walk(os.path.join(root, relative_path)):
+            path = os.path.relpath(directory, root).replace(os.sep, '/')
+            path = '' if path == '.' else path
+            try:
+                wd = self._inotify.add_watch(directory, WATCH_MASK)
+            except OSError as e:
+                if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                    continue  # removed while walking; its parent's event covers it
+                raise
+            self._watches[wd] = (job_id, path)
+            self._job_watches[job_id][path] = wd
+
+    def _remove_tree(self, job_id, relative_path):
+        """Stop watching a directory moved out of its place and everything below it (caller holds the lock)"""
+        watches = self._job_watches.get(job_id, {})
+        for path in [path for path in watches if path == relative_path or path.startswith(relative_path + '/')]:
+            wd = watches.pop(path)
+            self._watches.pop(wd, None)
+            self._inotify.rm_watch(wd)
+
+    def _remove_job(self, job_id):
+        """Forget a job's watches and pending changes (caller holds the lock)"""
+        watches = self._job_watches.pop(job_id, {})
+        for wd in watches.values():
+            self._watches.pop(wd, None)
+        self._pending.pop(job_id, None)
+        return list(watches.values())
+
+    def _run(self):
+        """Watch loop: record events, apply the changes of quiet jobs"""
+        self._watch_completed_jobs()
+        while not self._stop.is_set():
+            try:
+                events = self._inotify.read(POLL_INTERVAL)
+                if events:
+                    self._record(events, time.monotonic())
+                self._apply_quiet_jobs()
+            except Exception as e:
+                logger.error(f"Tree watcher failed: {e}", exc_info=True)
+                self._stop.wait(POLL_INTERVAL)
+
+    def _watch_completed_jobs(self):
+        """Watch the loose trees of jobs completed before startup"""
+        try:
+            job_ids = [job_id for (job_id,) in db_session.query(Job.id).filter(Job.status == 'completed')]
+        finally:
+            db_session.remove()
+        for job_id in job_ids:
+            if self._stop.is_set():
+                return
+            self.watch(job_id)
+
+    def _record(self, events, now):
+        """Turn events into pending changed paths"""
+        with self._lock:
+            for event in events:
+                if event.mask & inotify.IN_Q_OVERFLOW:
+                    logger.warning("inotify event queue overflowed; re-checking every watched job")
+                    for job_id in self._job_watches:
+                        self._pending.setdefault(job_id, _Changes(now)).add('', now)
+                    continue
+
+                watched = self._watches.get(event.wd)
+                if watched is None:
+                    continue
+                job_id, directory = watched
+
+                if event.mask & inotify.IN_IGNORED:
+                    self._watches.pop(event.wd, None)
+                    if self._job_watches.get(job_id, {}).get(directory) == event.wd:
+                        del self._job_watches[job_id][directory]
+                    continue
+
+                if event.mask & (inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF):
+                    if not directory:
+                        # The whole tree was deleted, packed or moved to the trash
+                        for wd in self._remove_job(job_id):
+                            self._inotify.rm_watch(wd)
+                    continue
+
+                path = f'{directory}/{event.name}' if directory else event.name
+                changes = self._pending.get(job_id)
+                if changes is None:
+                    changes = self._pending[job_id] = _Changes(now)
+
+                if event.mask & inotify.IN_ISDIR:
+                    if event.mask & inotify.IN_MOVED_FROM:
+                        self._remove_tree(job_id, path)
+                    elif event.mask & (inotify.IN_CREATE | inotify.IN_MOVED_TO):
+                        try:
+                            self._add_tree(job_id, path)
+                        except OSError as e:
+                            logger.warning(f"Could not watch {path} of job {job_id}: {e}")
+                    changes.add(path, now)
+                elif event.mask & LISTING_EVENTS:
+                    changes.add(path, now, created=bool(event.mask & (inotify.IN_CREATE | inotify.IN_MOVED_TO)))
+                elif event.mask & WRITE_EVENTS:
+                    changes.add(path, now, written=True)
+
+    def _apply_quiet_jobs(self):
+        """Apply the pending changes of every job quiet for INDEX_WATCH_DELAY seconds (or waiting too long)"""
+        from app.services.job_control import job_control_service
+
+        now = time.monotonic()
+        with self._lock:
+            ready = [job_id for job_id, changes in self._pending.items()
+                     if job_id not in self._paused and not job_control_service.is_running(job_id)
+                     and (now - changes.last_seen >= settings.INDEX_WATCH_DELAY
+                          or now - changes.first_seen >= settings.INDEX_WATCH_MAX_DELAY)]
+            batches = [(job_id, self._pending.pop(job_id)) for job_id in ready]
+
+        for job_id, changes in batches:
+            self._apply(job_id, changes)
+
+    def _apply(self, job_id, changes):
+        """Update a job's index for a batch of changed paths"""
+        from app.services.indexing import indexing_service
+
+        try:
+            started = time.perf_counter()
+            added, removed = indexing_service.update_paths(job_id, changes.paths, changes.modified())
+            if added or removed:
+                logger.info(f"Updated index of job {job_id} from {len(changes.paths)} changed paths: "
+                            f"{added} added, {removed} removed in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"Updating the index of job {job_id} failed: {e}", exc_info=True)
+        finally:
+            db_session.remove()
+            index_store.remove_sessions()
+
+
+# Global tree watcher service instance
+tree_watcher_service = TreeWatcherService()
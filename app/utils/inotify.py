@@ -0,0 +1,138 @@
+"""
+Inotify
+Minimal ctypes binding of the Linux inotify API (no third-party package)
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+from collections import namedtuple
+
+# Event bits (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# struct inotify_event: wd, mask, cookie, len (then len bytes of NUL-padded name)
+EVENT_HEADER = struct.Struct('iIII')
+
+# Bytes read per call (a batch of events; the kernel never splits one)
+READ_SIZE = 64 * 1024
+
+# One event: watch descriptor (-1 for IN_Q_OVERFLOW), mask, rename cookie and
+# the name of the entry inside the watched directory ('' for the directory itself)
+InotifyEvent = namedtuple('InotifyEvent', 'wd mask cookie name')
+
+
+def _load_libc():
+    """libc with the inotify functions, or None (not Linux, or too old)"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+_libc = _load_libc()
+
+
+def available():
+    """Whether inotify can be used on this system"""
+    return _libc is not None
+
+
+class Inotify:
+    """
+    An inotify instance
+
+    Watches are per directory (inotify is not recursive). The descriptor is
+    non-blocking; read() waits for events with select().
+    """
+
+    def __init__(self):
+        if _libc is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path, mask):
+        """
+        Watch a path (watching it again replaces the mask and returns the same descriptor)
+
+        Args:
+            path: Absolute path
+            mask: IN_* bits
+
+        Returns:
+            int: Watch descriptor
+
+        Raises:
+            OSError: ENOSPC when the user's watch limit (fs.inotify.max_user_watches)
+                is reached; ENOENT/ENOTDIR if the path went away
+        """
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def rm_watch(self, wd):
+        """Stop a watch (an IN_IGNORED event follows; a watch already gone is ignored)"""
+        _libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout=None):
+        """
+        Events available within timeout seconds
+
+        Returns:
+            list: InotifyEvent items (empty on timeout)
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].split(b'\0', 1)[0]
+            offset += length
+            events.append(InotifyEvent(wd, mask, cookie, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        """Close the instance (removes all its watches)"""
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
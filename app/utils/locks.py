@@ -0,0 +1,46 @@
+"""
+Keyed Locks
+One lock per key (e.g. per job), kept only while it is in use
+"""
+
+import threading
+from contextlib import contextmanager
+
+
+class KeyedLocks:
+    """
+    A lock per key, created on first use and dropped once no thread holds
+    or waits for it - a long-running process does not keep a lock for
+    every job it has ever touched
+    """
+
+    def __init__(self, factory=threading.Lock):
+        """
+        Args:
+            factory: Lock type (threading.RLock for locks re-entered by their holder)
+        """
+        self._factory = factory
+        self._entries = {}  # key -> [lock, threads holding or waiting for it]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def lock(self, key):
+        """Context manager holding the key's lock"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [self._factory(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._entries[key]
+
+    def __len__(self):
+        """Keys with a lock in use"""
+        with self._lock:
+            return len(self._entries)
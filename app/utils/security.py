@@ -111,13 +111,30 @@ def check_file_size(file_path, max_size=None):
 
     try:
         size = os.path.getsize(file_path)
-        if size > max_size:
-            return False, size, f'File size ({get_file_size_human(size)}) exceeds maximum allowed ({get_file_size_human(max_size)})'
-        return True, size, None
+        error = size_limit_error(size, max_size)
+        return error is None, size, error
     except OSError as e:
         return False, 0, f'Error reading file size: {str(e)}'
 
 
+def size_limit_error(size, max_size=None):
+    """
+    Error message for a file size over the preview limit
+
+    Args:
+        size: File size in bytes
+        max_size: Maximum allowed size in bytes (defaults to settings.MAX_PREVIEW_SIZE)
+
+    Returns:
+        str: Error message, or None if the size is within the limit
+    """
+    if max_size is None:
+        max_size = settings.MAX_PREVIEW_SIZE
+    if size > max_size:
+        return f'File size ({get_file_size_human(size)}) exceeds maximum allowed ({get_file_size_human(max_size)})'
+    return None
+
+
 def is_binary_file(file_path):
     """
     Detect if a file is binary
@@ -130,20 +147,32 @@ def is_binary_file(file_path):
     """
     try:
         with open(file_path, 'rb') as f:
-            chunk = f.read(1024)
-            # Check for null bytes (common in binary files)
-            if b'\0' in chunk:
-                return True
-            # Try to decode as UTF-8
-            try:
-                chunk.decode('utf-8')
-                return False
-            except UnicodeDecodeError:
-                return True
+            return is_binary_data(f.read(1024))
     except Exception:
         return True
 
 
+def is_binary_data(chunk):
+    """
+    Detect binary content from the first bytes of a file
+
+    Args:
+        chunk: Leading bytes (up to 1KB)
+
+    Returns:
+        bool: True if the data appears to be binary, False if text
+    """
+    # Check for null bytes (common in binary files)
+    if b'\0' in chunk:
+        return True
+    # Try to decode as UTF-8
+    try:
+        chunk.decode('utf-8')
+        return False
+    except UnicodeDecodeError:
+        return True
+
+
 def get_file_size_human(size):
     """
     Convert bytes to human readable format
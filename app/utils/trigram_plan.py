@@ -0,0 +1,81 @@
+"""
+Trigram query planning
+Turns a substring or regular expression into an FTS5 trigram MATCH expression
+"""
+
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+# Shortest literal a trigram index can look up
+TRIGRAM = 3
+
+REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, 'POSSESSIVE_REPEAT'):
+    REPEATS.add(sre_constants.POSSESSIVE_REPEAT)
+
+
+def fts_phrase(value):
+    """FTS5 string literal (matched literally, whatever characters it holds)"""
+    return '"' + value.replace('"', '""') + '"'
+
+
+def regex_expression(pattern, flags=0):
+    """
+    Trigram MATCH expression of the literals a regular expression requires
+
+    Runs of literal characters of at least TRIGRAM characters must occur in
+    every match: they are ANDed, and alternatives that each require one are
+    ORed. Anything else (classes, optional parts) is left to verification.
+
+    Returns:
+        str: Expression, or None if nothing can narrow the candidates
+    """
+    return _render(_and(_required(sre_parse.parse(pattern, flags))))
+
+
+def _required(items):
+    """Nodes (literal strings, ('and'|'or', nodes)) a parsed sequence requires, all of them"""
+    required = []
+    run = []
+
+    def end_run():
+        if len(run) >= TRIGRAM:
+            required.append(''.join(run))
+        run.clear()
+
+    for op, arg in items:
+        if op is sre_constants.LITERAL:
+            run.append(chr(arg))
+            continue
+        end_run()
+        if op is sre_constants.SUBPATTERN:
+            required.extend(_required(arg[-1]))
+        elif op in REPEATS and arg[0] >= 1:
+            required.extend(_required(arg[2]))
+        elif op is getattr(sre_constants, 'ATOMIC_GROUP', None):
+            required.extend(_required(arg))
+        elif op is sre_constants.BRANCH:
+            alternatives = [_and(_required(alternative)) for alternative in arg[1]]
+            if all(alternatives):
+                required.append(('or', alternatives))
+    end_run()
+    return required
+
+
+def _and(nodes):
+    if not nodes:
+        return None
+    return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+
+def _render(node):
+    if node is None:
+        return None
+    if isinstance(node, str):
+        return fts_phrase(node)
+    operator, nodes = node
+    return '(' + f' {operator.upper()} '.join(_render(child) for child in nodes) + ')'
@@ -0,0 +1,135 @@
+"""
+Directory Walker
+Parallel os.scandir-based tree walk for indexing
+"""
+
+import os
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# One indexed entry. relative_path/parent_path use '/' separators; parent_path
+# is '' for entries directly under the walked root (same as os.path.relpath
+# + os.path.dirname), size and mtime are None for directories.
+WalkEntry = namedtuple('WalkEntry', 'name path relative_path parent_path is_directory size mtime',
+                       defaults=(None,))
+
+_DONE = object()
+
+
+def _scan_directory(abs_dir, rel_dir):
+    """
+    List one directory with a single scandir call
+
+    Directory type comes from the dirent (no stat); file sizes and mtimes
+    come from the cached DirEntry.stat(). Relative paths are built by concatenation.
+
+    Args:
+        abs_dir: Absolute directory path
+        rel_dir: Its path relative to the index root ('' for the root)
+
+    Returns:
+        tuple: (list of WalkEntry, list of (abs_path, rel_path) subdirectories to descend into)
+    """
+    entries = []
+    subdirs = []
+    prefix = rel_dir + '/' if rel_dir else ''
+
+    with os.scandir(abs_dir) as it:
+        for entry in it:
+            rel_path = prefix + entry.name
+            try:
+                if entry.is_dir():
+                    entries.append(WalkEntry(entry.name, entry.path, rel_path, rel_dir, True, None))
+                    # Like os.walk, symlinked directories are listed but not followed
+                    if not entry.is_symlink():
+                        subdirs.append((entry.path, rel_path))
+                else:
+                    stat = entry.stat()
+                    entries.append(WalkEntry(entry.name, entry.path, rel_path, rel_dir, False,
+                                             stat.st_size, stat.st_mtime))
+            except OSError as e:
+                logger.warning(f"Skipped indexing {entry.path}: {e}")
+
+    return entries, subdirs
+
+
+def walk_tree(root, relative_base='', workers=None, max_queued_batches=256):
+    """
+    Walk a directory tree, fanning subdirectories out across a thread pool
+
+    Batches (one per directory) are yielded to the caller through a bounded
+    queue, so a single consumer - the DB writer - receives everything. A
+    directory's own entry is always yielded before the batch listing its
+    contents.
+
+    Args:
+        root: Absolute path of the tree to walk
+        relative_base: Prefix for relative paths ('' for the extraction root)
+        workers: Scanner threads (defaults to settings.INDEX_WALK_WORKERS)
+        max_queued_batches: Backpressure limit between scanners and consumer
+
+    Yields:
+        list: WalkEntry items of one directory
+    """
+    workers = workers or settings.INDEX_WALK_WORKERS
+    results = queue.Queue(maxsize=max_queued_batches)
+    stop = threading.Event()
+    lock = threading.Lock()
+    pending = [1]
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='index-walk')
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def scan(abs_dir, rel_dir):
+        try:
+            if stop.is_set():
+                return
+            entries, subdirs = _scan_directory(abs_dir, rel_dir)
+            put(entries)
+            with lock:
+                pending[0] += len(subdirs)
+            for sub_abs, sub_rel in subdirs:
+                # The consumer stopped early (cancelled or failed index): nothing more to scan
+                if stop.is_set():
+                    return
+                executor.submit(scan, sub_abs, sub_rel)
+        except RuntimeError as e:
+            # The executor shuts down once the consumer stops (between the check and the submit)
+            if not stop.is_set():
+                logger.error(f"Error scanning {abs_dir}: {e}", exc_info=True)
+        except OSError as e:
+            logger.warning(f"Skipped indexing directory {abs_dir}: {e}")
+        except Exception as e:
+            logger.error(f"Error scanning {abs_dir}: {e}", exc_info=True)
+        finally:
+            with lock:
+                pending[0] -= 1
+                finished = pending[0] == 0
+            if finished:
+                put(_DONE)
+
+    executor.submit(scan, root, relative_base)
+
+    try:
+        while True:
+            batch = results.get()
+            if batch is _DONE:
+                break
+            if batch:
+                yield batch
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
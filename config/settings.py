@@ -27,6 +27,101 @@ EXTRACT_FOLDER = os.getenv('EXTRACT_FOLDER', str(BASE_DIR / 'extracted'))
 MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 2 * 1024 * 1024 * 1024))  # 2GB
 ALLOWED_EXTENSIONS = {'zip', 'tar', 'gz', 'bz2', 'xz', 'tgz', 'rar', '7z'}
 
+# Extraction Resource Limits (0 disables a limit)
+EXTRACT_MAX_BYTES = int(os.getenv('EXTRACT_MAX_BYTES', 50 * 1024 * 1024 * 1024))  # 50GB expanded per job
+EXTRACT_MAX_RATIO = float(os.getenv('EXTRACT_MAX_RATIO', 100))  # expanded:compressed
+EXTRACT_MAX_MEMBERS = int(os.getenv('EXTRACT_MAX_MEMBERS', 2000000))
+EXTRACT_MIN_FREE_BYTES = int(os.getenv('EXTRACT_MIN_FREE_BYTES', 2 * 1024 * 1024 * 1024))  # 2GB watermark
+MAX_CONCURRENT_EXTRACTIONS = int(os.getenv('MAX_CONCURRENT_EXTRACTIONS', 4))
+
+# Server database (PostgreSQL) connection pool - ignored for SQLite
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))  # extra connections under bursts
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # seconds before a connection is replaced
+DB_STATEMENT_TIMEOUT = float(os.getenv('DB_STATEMENT_TIMEOUT', 300))  # seconds per statement (0 disables)
+
+# Seconds a SQLite connection waits for another writer (indexing holds one long transaction)
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', 30))
+
+# Seconds Job progress updates are coalesced before the writer thread persists them
+JOB_WRITE_INTERVAL = float(os.getenv('JOB_WRITE_INTERVAL', 1.0))
+
+# Indexing Configuration
+INDEX_WALK_WORKERS = int(os.getenv('INDEX_WALK_WORKERS', 8))  # parallel directory scanners (raise for NFS)
+DIRECTORY_CACHE_JOBS = int(os.getenv('DIRECTORY_CACHE_JOBS', 16))  # jobs whose directory-path map is kept in memory
+JOB_STATS_TOP_FILES = int(os.getenv('JOB_STATS_TOP_FILES', 50))  # largest files kept in each job's summary stats
+
+# Per-job index shards: new jobs' file index goes to its own SQLite file
+# instead of the shared database (jobs indexed before keep using it)
+INDEX_SHARDS = os.getenv('INDEX_SHARDS', 'false').lower() == 'true'
+INDEX_SHARD_FOLDER = os.getenv('INDEX_SHARD_FOLDER', str(BASE_DIR / 'data' / 'index'))
+INDEX_SHARD_HANDLES = int(os.getenv('INDEX_SHARD_HANDLES', 8))  # shard databases kept open (LRU)
+
+# Per-job binary manifests: browse/tree/all-files of indexed jobs are served
+# from a memory-mapped file instead of the database
+ENABLE_MANIFESTS = os.getenv('ENABLE_MANIFESTS', 'true').lower() == 'true'
+MANIFEST_FOLDER = os.getenv('MANIFEST_FOLDER', str(BASE_DIR / 'data' / 'manifests'))
+MANIFEST_CACHE_JOBS = int(os.getenv('MANIFEST_CACHE_JOBS', 16))  # manifests kept mapped (LRU)
+
+# Retention: finished jobs (files and index) are deleted by a background sweep
+# when any enabled policy (0 disables) selects them
+RETENTION_MAX_AGE_DAYS = float(os.getenv('RETENTION_MAX_AGE_DAYS', 0))  # since upload
+RETENTION_MAX_IDLE_DAYS = float(os.getenv('RETENTION_MAX_IDLE_DAYS', 0))  # since last access
+RETENTION_MAX_TOTAL_BYTES = int(os.getenv('RETENTION_MAX_TOTAL_BYTES', 0))  # least recently used evicted beyond this
+RETENTION_INTERVAL = int(os.getenv('RETENTION_INTERVAL', 3600))  # seconds between sweeps
+DELETE_BATCH_ROWS = int(os.getenv('DELETE_BATCH_ROWS', 5000))  # index rows deleted per transaction
+
+# Cold tier: extracted trees of jobs not opened for COLD_TIER_IDLE_DAYS (0 disables)
+# are packed into one compressed file and expanded again on demand
+COLD_TIER_IDLE_DAYS = float(os.getenv('COLD_TIER_IDLE_DAYS', 0))
+COLD_TIER_FOLDER = os.getenv('COLD_TIER_FOLDER', str(BASE_DIR / 'data' / 'cold'))
+COLD_TIER_CODEC = os.getenv('COLD_TIER_CODEC', 'zstd')  # zstd (if installed) or zlib
+COLD_TIER_LEVEL = int(os.getenv('COLD_TIER_LEVEL', 3))
+COLD_TIER_INTERVAL = int(os.getenv('COLD_TIER_INTERVAL', 3600))  # seconds between sweeps
+COLD_TIER_HANDLES = int(os.getenv('COLD_TIER_HANDLES', 8))  # packs kept open (LRU)
+
+# Post-index pipeline: after a job is browsable, a background worker reads its
+# files once (CONTENT_INDEX_WORKERS threads) and feeds the enabled stages
+POST_INDEX_BATCH_FILES = int(os.getenv('POST_INDEX_BATCH_FILES', 500))  # files per write transaction
+POST_INDEX_BATCH_BYTES = int(os.getenv('POST_INDEX_BATCH_BYTES', 32 * 1024 * 1024))  # bytes read per batch
+
+# Full-text content index (SQLite FTS5) answering content queries of /api/search
+CONTENT_INDEX = os.getenv('CONTENT_INDEX', 'true').lower() == 'true'
+CONTENT_INDEX_WORKERS = int(os.getenv('CONTENT_INDEX_WORKERS', 4))  # file reader threads
+CONTENT_INDEX_MAX_FILE_SIZE = int(os.getenv('CONTENT_INDEX_MAX_FILE_SIZE', 5 * 1024 * 1024))  # larger files are skipped
+CONTENT_SEARCH_LIMIT = int(os.getenv('CONTENT_SEARCH_LIMIT', 1000))  # best-ranked content matches returned
+
+# Trigram index of file and directory paths (SQLite FTS5) for substring and regex path search
+PATH_INDEX = os.getenv('PATH_INDEX', 'true').lower() == 'true'
+PATH_SEARCH_SCAN_LIMIT = int(os.getenv('PATH_SEARCH_SCAN_LIMIT', 20000))  # candidates verified per page request
+
+# Regex grep across a job: trigram index of the indexed text (SQLite FTS5) picks candidate files
+GREP_INDEX = os.getenv('GREP_INDEX', 'true').lower() == 'true'
+GREP_WORKERS = int(os.getenv('GREP_WORKERS', 4))  # files verified concurrently
+GREP_MAX_HITS = int(os.getenv('GREP_MAX_HITS', 1000))  # matching lines per request
+GREP_MAX_CONTEXT = int(os.getenv('GREP_MAX_CONTEXT', 5))  # context lines around a hit
+GREP_TIMEOUT = int(os.getenv('GREP_TIMEOUT', 60))  # seconds before a grep stops early
+GREP_MAX_LINE_LENGTH = int(os.getenv('GREP_MAX_LINE_LENGTH', 1000))  # characters of a line returned
+
+# Cross-job search: file names and paths of every job in one index in the main database
+GLOBAL_INDEX = os.getenv('GLOBAL_INDEX', 'true').lower() == 'true'
+GLOBAL_SEARCH_LIMIT = int(os.getenv('GLOBAL_SEARCH_LIMIT', 500))  # best-ranked hits over all jobs
+GLOBAL_SEARCH_PER_JOB = int(os.getenv('GLOBAL_SEARCH_PER_JOB', 20))  # hits returned per job
+
+# Content hashes (XXH3-128 with the xxhash package, else BLAKE2b) compared by job diffs
+CONTENT_HASH = os.getenv('CONTENT_HASH', 'true').lower() == 'true'
+DIFF_MAX_ENTRIES = int(os.getenv('DIFF_MAX_ENTRIES', 5000))  # differing files listed per request
+DIFF_MAX_FILE_SIZE = int(os.getenv('DIFF_MAX_FILE_SIZE', 10 * 1024 * 1024))  # largest file diffed line by line
+
+# File classification (text/binary, encoding, MIME type, line count, compression) stored at index time
+FILE_CLASSIFICATION = os.getenv('FILE_CLASSIFICATION', 'true').lower() == 'true'
+
+# Incremental re-indexing of changes made to extracted trees (inotify, Linux only)
+INDEX_WATCH = os.getenv('INDEX_WATCH', 'false').lower() == 'true'
+INDEX_WATCH_DELAY = float(os.getenv('INDEX_WATCH_DELAY', 2))  # seconds without events before a job's changes are applied
+INDEX_WATCH_MAX_DELAY = float(os.getenv('INDEX_WATCH_MAX_DELAY', 30))  # longest a busy job's changes wait
+
 # File Preview Configuration
 MAX_PREVIEW_SIZE = 5 * 1024 * 1024  # 5MB
 
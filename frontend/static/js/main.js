@@ -95,7 +95,7 @@ async function uploadFile() {
         if (response.ok && data.success) {
             currentJobId = data.job_id;
             updateProgress(10, 'File uploaded, starting extraction...');
-            pollProgress();
+            watchProgress();
         } else {
             showError(data.message || data.error || 'Upload failed');
             uploadBtn.disabled = false;
@@ -106,24 +106,81 @@ async function uploadFile() {
     }
 }
 
+// Subscribe to pushed progress events; falls back to polling if SSE is unavailable
+function watchProgress() {
+    if (!window.EventSource) {
+        pollProgress();
+        return;
+    }
+
+    const jobId = currentJobId;
+    const source = new EventSource(`/api/progress/${jobId}/stream`);
+
+    source.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (jobId !== currentJobId || handleProgressUpdate(data)) {
+            source.close();
+        }
+    };
+
+    source.onerror = () => {
+        source.close();
+        if (jobId === currentJobId) pollProgress();
+    };
+}
+
 async function pollProgress() {
+    if (!currentJobId) return;
+
     try {
         const response = await fetch(`/api/progress/${currentJobId}`);
         const data = await response.json();
 
-        updateProgress(data.progress, data.message);
+        if (!handleProgressUpdate(data)) {
+            setTimeout(pollProgress, 1000);
+        }
+    } catch (error) {
+        showError('Progress check error: ' + error.message);
+        uploadBtn.disabled = false;
+    }
+}
+
+// Apply a progress update; returns true once the job reached a final state
+function handleProgressUpdate(data) {
+    updateProgress(data.progress, data.message);
+
+    if (data.status === 'completed') {
+        setTimeout(() => loadResults(), 500);
+    } else if (data.status === 'error') {
+        showError(data.message);
+        uploadBtn.disabled = false;
+    } else if (data.status === 'cancelled') {
+        resetApp();
+        uploadBtn.disabled = false;
+    } else {
+        return false;
+    }
+    return true;
+}
+
+async function cancelJob() {
+    if (!currentJobId) return;
+    if (!confirm('Cancel this job and discard its extracted files?')) return;
 
-        if (data.status === 'completed') {
-            setTimeout(() => loadResults(), 500);
-        } else if (data.status === 'error') {
-            showError(data.message);
+    try {
+        const response = await fetch(`/api/jobs/${currentJobId}`, { method: 'DELETE' });
+        const data = await response.json();
+
+        if (response.ok && data.status === 'deleted') {
+            resetApp();
             uploadBtn.disabled = false;
+        } else if (response.ok) {
+            updateProgress(0, 'Cancelling...');
         } else {
-            setTimeout(pollProgress, 300);
+            showError(data.message || data.error || 'Cancel failed');
         }
     } catch (error) {
-        showError('Progress check error: ' + error.message);
-        uploadBtn.disabled = false;
+        showError('Cancel error: ' + error.message);
     }
 }
 
@@ -216,6 +273,7 @@ function displayItems(items, containerId) {
             <div class="item-info">
                 <div>${icon} <strong>${item.name}</strong></div>
                 <div style="font-size:0.9em;color:#666;">${item.path} • ${item.size_human || 'Directory'}</div>
+                ${item.snippet ? `<div style="font-size:0.85em;color:#444;font-family:monospace;white-space:pre-wrap;margin-top:4px;">${item.snippet}</div>` : ''}
             </div>
             ${!isDir ? `
             <div class="item-actions">
@@ -582,6 +640,18 @@ async function performSearch() {
     const query = document.getElementById('searchInput').value.trim();
     if (!query) return;
 
+    // /pattern/ searches paths by regular expression
+    if (query.length > 2 && query.startsWith('/') && query.endsWith('/')) {
+        searchPathsRegex(query.slice(1, -1));
+        return;
+    }
+
+    // grep:pattern searches file contents line by line
+    if (query.startsWith('grep:') && query.length > 5) {
+        grepJob(query.slice(5));
+        return;
+    }
+
     try {
         const response = await fetch(`/api/search/${currentJobId}?q=${encodeURIComponent(query)}&page=1&per_page=${itemsPerPage}`);
         const data = await response.json();
@@ -607,6 +677,97 @@ async function searchPage(query, page) {
     }
 }
 
+async function searchPathsRegex(pattern, cursor = null, shown = []) {
+    try {
+        let url = `/api/search/${currentJobId}/paths?regex=1&q=${encodeURIComponent(pattern)}&limit=${itemsPerPage}`;
+        if (cursor) url += `&cursor=${encodeURIComponent(cursor)}`;
+        const response = await fetch(url);
+        const data = await response.json();
+
+        if (!response.ok) {
+            showError(data.message || data.error || 'Search failed');
+            return;
+        }
+
+        const items = shown.concat(data.items);
+        displayItems(items, 'filesList');
+
+        const pagination = document.getElementById('filesPagination');
+        pagination.innerHTML = '';
+        if (data.next_cursor) {
+            const btn = document.createElement('button');
+            btn.className = 'page-btn';
+            btn.textContent = 'Load more';
+            btn.onclick = () => searchPathsRegex(pattern, data.next_cursor, items);
+            pagination.appendChild(btn);
+        }
+
+    } catch (error) {
+        console.error('Search error:', error);
+    }
+}
+
+async function grepJob(pattern) {
+    const container = document.getElementById('filesList');
+    const pagination = document.getElementById('filesPagination');
+    container.innerHTML = '<div class="loading">Searching...</div>';
+    pagination.innerHTML = '';
+
+    try {
+        const response = await fetch(`/api/grep/${currentJobId}?q=${encodeURIComponent(pattern)}&context=2`);
+        if (!response.ok) {
+            const data = await response.json();
+            container.innerHTML = '';
+            showError(data.message || data.error || 'Search failed');
+            return;
+        }
+
+        container.innerHTML = '';
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop() || '';
+
+            for (const line of lines) {
+                if (!line.startsWith('data: ')) continue;
+                const event = JSON.parse(line.slice(6));
+
+                if (event.done) {
+                    let text = `${event.hits} matching lines in ${event.files_searched} files`;
+                    if (event.timed_out) text += ' (stopped: time limit)';
+                    else if (event.truncated) text += ' (stopped: hit limit)';
+                    pagination.innerHTML = `<p style="color:#666;">${text}</p>`;
+                    if (event.hits === 0) {
+                        container.innerHTML = '<p style="text-align:center;padding:40px;color:#999;">No items found</p>';
+                    }
+                    continue;
+                }
+
+                const hitDiv = document.createElement('div');
+                hitDiv.className = 'item';
+                const context = (rows) => rows.map(l => `<div style="color:#999;">${escapeHtml(l)}</div>`).join('');
+                hitDiv.innerHTML = `
+                    <div class="item-info">
+                        <div><a href="#" onclick="viewFile('${event.path}'); return false;">${escapeHtml(event.path)}:${event.line}</a></div>
+                        <div style="font-size:0.85em;font-family:monospace;white-space:pre-wrap;margin-top:4px;">${context(event.before)}<div>${escapeHtml(event.text)}</div>${context(event.after)}</div>
+                    </div>
+                `;
+                container.appendChild(hitDiv);
+            }
+        }
+
+    } catch (error) {
+        console.error('Grep error:', error);
+    }
+}
+
 async function loadTree() {
     try {
         const treeView = document.getElementById('treeView');
@@ -789,6 +950,16 @@ let currentTestFolder = null;
 let currentTestResults = null;
 let chatHistory = [];
 
+// The analysis service reads the extracted tree directly - bring a job
+// moved to the cold tier back onto disk first (a no-op otherwise)
+async function ensureJobOnDisk() {
+    const response = await fetch(`/api/jobs/${currentJobId}/rehydrate`, { method: 'POST' });
+    if (!response.ok) {
+        const data = await response.json().catch(() => ({}));
+        throw new Error(data.message || data.error || 'Failed to restore job files');
+    }
+}
+
 // Discover RHOSO test folders
 async function discoverRHOSOFolders() {
     if (!currentJobId) return;
@@ -796,6 +967,7 @@ async function discoverRHOSOFolders() {
     const extractPath = `${appConfig.extractFolder}/${currentJobId}`;
 
     try {
+        await ensureJobOnDisk();
         const response = await fetch(`${appConfig.analysisServiceUrl}/api/analysis/discover`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
@@ -837,6 +1009,7 @@ async function discoverRHCertFiles() {
     const extractPath = `${appConfig.extractFolder}/${currentJobId}`;
 
     try {
+        await ensureJobOnDisk();
         const response = await fetch(`${appConfig.analysisServiceUrl}/api/analysis/discover-rhcert`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
@@ -923,6 +1096,7 @@ async function loadTestResults(folderPath, folderName) {
     const extractPath = `${appConfig.extractFolder}/${currentJobId}`;
 
     try {
+        await ensureJobOnDisk();
         const response = await fetch(`${appConfig.analysisServiceUrl}/api/analysis/parse`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
@@ -963,6 +1137,7 @@ async function loadRHCertResults(filePath, fileName) {
     const extractPath = `${appConfig.extractFolder}/${currentJobId}`;
 
     try {
+        await ensureJobOnDisk();
         // Parse attachments (neutron, cinder, manila) instead of direct XML parsing
         const response = await fetch(`${appConfig.analysisServiceUrl}/api/analysis/parse-rhcert-attachments`, {
             method: 'POST',
@@ -1519,6 +1694,7 @@ async function startAIAnalysis() {
     const extractPath = `${appConfig.extractFolder}/${currentJobId}`;
 
     try {
+        await ensureJobOnDisk();
         console.log('Sending analysis request to:', `${appConfig.analysisServiceUrl}/api/analysis/analyze`);
         const response = await fetch(`${appConfig.analysisServiceUrl}/api/analysis/analyze`, {
             method: 'POST',
@@ -1667,6 +1843,7 @@ async function sendChatMessage() {
     const extractPath = `${appConfig.extractFolder}/${currentJobId}`;
 
     try {
+        await ensureJobOnDisk();
         console.log('Sending chat request to:', `${appConfig.analysisServiceUrl}/api/analysis/chat`);
         const response = await fetch(`${appConfig.analysisServiceUrl}/api/analysis/chat`, {
             method: 'POST',